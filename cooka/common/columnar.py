@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+"""
+Typed columnar copy of a dataset, it's a parquet file next to the csv file and written once after the dataset created.
+Readers prefer it to skip parsing csv and read only the columns required, pyarrow is optional and readers fall back to
+csv if it's not installed or the copy is not ready.
+"""
+import os
+from os import path as P
+
+import numpy as np
+import pandas as pd
+
+from cooka.common import util, dataset_util, consts
+from cooka.common.log import log_core as logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+COLUMNAR_SUFFIX = '.parquet'
+
+
+def columnar_path(file_path):
+    return P.splitext(file_path)[0] + COLUMNAR_SUFFIX
+
+
+def is_columnar_ready(file_path):
+    path = columnar_path(file_path)
+    return pq is not None and P.exists(path) and P.getmtime(path) >= P.getmtime(file_path)
+
+
+def _arrow_type(data_type):
+    dtype = pd.api.types.pandas_dtype(data_type)
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return pa.timestamp(dtype.unit, tz=str(dtype.tz))
+    elif dtype == np.object_:
+        return pa.string()
+    else:
+        return pa.from_numpy_dtype(dtype)
+
+
+def _read_dtype(data_type):
+    """Data type to parse a column as, so that the type of a chunk does not depend on values in it. """
+    if data_type == 'object' or 'datetime' in data_type:
+        return 'object'  # a chunk of numeric strings or no datetime values is not inferred as numbers
+    elif data_type.startswith('float'):
+        return data_type
+    else:
+        return None  # integers may be read as floats for missing values, they are cast by the arrow schema
+
+
+def _cast_chunk(df, features):
+    cast_features = []
+    for f in features:
+        dtype = pd.api.types.pandas_dtype(f['data_type'])
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            df[f['name']] = pd.to_datetime(df[f['name']], errors="coerce", utc=True).dt.tz_convert(dtype.tz)
+        elif pd.api.types.is_integer_dtype(dtype) and pd.api.types.is_float_dtype(df[f['name']].dtype):
+            pass  # integers with missing values, they are cast to nullable integers by the arrow schema
+        else:
+            cast_features.append(f)
+    return dataset_util.cast_df(df, cast_features)
+
+
+def write_columnar(file_path, features, has_header, chunksize=consts.READ_CHUNK_SIZE, **read_kwargs):
+    """Convert csv file to parquet with the data types of analyzed features.
+
+    The file is converted chunk by chunk to a fixed schema from the data types, a chunk is a row group of the parquet
+    file. If a chunk can not be cast to the schema, the parquet file is not written and readers keep reading csv.
+
+    Args:
+        file_path: csv file.
+        features: list of feature dict, like [{"name": "age", "data_type": "float64"}].
+        has_header:
+        chunksize: rows of a chunk.
+        read_kwargs: params of `pd.read_csv`.
+
+    Returns:
+        Path of the parquet file, None if pyarrow is not installed or the file can not be converted.
+    """
+    if pq is None:
+        logger.warning("Package pyarrow is not installed, skip writing columnar file.")
+        return None
+
+    names = [f['name'] for f in features]
+    schema = pa.schema([(f['name'], _arrow_type(f['data_type'])) for f in features])
+    dtype = {f['name']: _read_dtype(f['data_type']) for f in features if _read_dtype(f['data_type']) is not None}
+    read_kwargs.setdefault('dtype', dtype)
+    if has_header:
+        read_kwargs['header'] = 'infer'
+    else:
+        read_kwargs['header'] = None
+        read_kwargs['names'] = names
+
+    path = columnar_path(file_path)
+    tmp_path = f"{path}.{util.short_uuid()}.tmp"
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for chunk in util.iter_csv(file_path, chunksize=chunksize, **read_kwargs):
+                table = pa.Table.from_pandas(_cast_chunk(chunk, features), schema=schema, preserve_index=False)
+                writer.write_table(table)
+    except Exception as e:
+        logger.warning(f"Convert {file_path} to data types of features failed, skip writing columnar file: {e}")
+        if P.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, path)  # readers never see a partial file
+    return path
+
+
+def read_dataset(file_path, has_header, default_headers=None, usecols=None, **read_kwargs):
+    """Read dataset from the columnar copy if it's ready, otherwise from csv file.
+
+    Args:
+        usecols: columns to read, all columns if None, columns are in the order of the file.
+        read_kwargs: params of `pd.read_csv`, only `dtype` is used for the columnar copy which is typed already.
+    """
+    if is_columnar_ready(file_path):
+        path = columnar_path(file_path)
+        if usecols is not None:
+            names = pq.read_schema(path).names
+            usecols = [c for c in names if c in set(usecols)]
+        df = pq.read_table(path, columns=usecols).to_pandas()
+        dtype = read_kwargs.get('dtype')
+        if isinstance(dtype, dict):
+            df = df.astype({c: t for c, t in dtype.items() if c in df.columns})
+        return df
+    else:
+        return util.read_csv(file_path, has_header, default_headers, usecols=usecols, **read_kwargs)
+
+
+def read_rows(file_path, start, n):
+    """Rows in [start, start + n) from the columnar copy, only row groups containing them are read.
+
+    Returns:
+        pd.DataFrame, None if the columnar copy is not ready.
+    """
+    if not is_columnar_ready(file_path):
+        return None
+    parquet_file = pq.ParquetFile(columnar_path(file_path))
+    row_groups = []
+    first_row = None
+    offset = 0
+    for i in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(i).num_rows
+        if offset + num_rows > start and offset < start + n:
+            row_groups.append(i)
+            if first_row is None:
+                first_row = offset
+        offset = offset + num_rows
+    if len(row_groups) == 0:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    table = parquet_file.read_row_groups(row_groups)
+    return table.slice(start - first_row, n).to_pandas()
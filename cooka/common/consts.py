@@ -41,6 +41,20 @@ class CookaApp(Application):
         }
     ).tag(config=True)
 
+    analyze_n_workers = Integer(psutil.cpu_count()).tag(config=True)
+    analyze_approx_distinct = Bool(False).tag(config=True)
+    analyze_hll_precision = Integer(14).tag(config=True)
+    analyze_bins_strategy = Unicode("equal_width").tag(config=True)
+    analyze_infer_epoch_datetime = Bool(False).tag(config=True)
+    analyze_cache_max_size = Integer(256 * 1024 * 1024).tag(config=True)
+    response_cache_max_size = Integer(64 * 1024 * 1024).tag(config=True)
+    csv_engine = Unicode("c").tag(config=True)
+    analyze_association_top_k = Integer(50).tag(config=True)
+    analyze_dask_min_file_size = Integer(2 * 1024 * 1024 * 1024).tag(config=True)
+    analyze_dask_scheduler = Unicode("processes").tag(config=True)
+    analyze_wide_table_min_cols = Integer(1000).tag(config=True)
+    analyze_progressive_min_file_size = Integer(256 * 1024 * 1024).tag(config=True)
+
     max_trials = Dict(
         per_key_traits={
             "performance": Integer(50),
@@ -72,6 +86,19 @@ TRAIN_MODE_MAX_TRIALS_MAPPING = {
     "minimal": 1
 }
 SERVER_PORT = _app.server_port
+ANALYZE_N_WORKERS = _app.analyze_n_workers
+ANALYZE_APPROX_DISTINCT = _app.analyze_approx_distinct
+HLL_PRECISION = _app.analyze_hll_precision
+BINS_STRATEGY = _app.analyze_bins_strategy
+INFER_EPOCH_DATETIME = _app.analyze_infer_epoch_datetime
+ANALYZE_CACHE_MAX_SIZE = _app.analyze_cache_max_size
+RESPONSE_CACHE_MAX_SIZE = _app.response_cache_max_size
+CSV_ENGINE = _app.csv_engine
+ASSOCIATION_TOP_K = _app.analyze_association_top_k
+DASK_ANALYZE_MIN_FILE_SIZE = _app.analyze_dask_min_file_size
+DASK_SCHEDULER = _app.analyze_dask_scheduler
+WIDE_TABLE_MIN_COLS = _app.analyze_wide_table_min_cols
+PROGRESSIVE_ANALYZE_MIN_FILE_SIZE = _app.analyze_progressive_min_file_size
 
 
 # ---
@@ -103,6 +130,7 @@ PATH_TMP_UPLOAD = P.join(DATA_DIR, FIELD_TMP, FIELD_UPLOAD)
 PATH_TMP_PREDICT = P.join(DATA_DIR, FIELD_TMP, 'predict')
 
 PATH_TMP_LOG = P.join(DATA_DIR, FIELD_TMP, 'log')
+PATH_ANALYZE_CACHE = P.join(DATA_DIR, FIELD_TMP, 'analyze_cache')
 PATH_CONFIG_UPLOAD = P.join(DATA_DIR, FIELD_TMP, 'config')
 PATH_DATABASE = P.join(DATA_DIR, "cooka.sqlite")
 # if not P.exists(DATA_DIR):
@@ -132,3 +160,27 @@ METRICS_GBM_OPTIMIZE_MAPPING = {
 # --- Analyze dataset
 MAX_DISTINCT_VALUES = 10
 KEY_REMAINED_FEATURE_VALUES_SUM = 'Remained_SUM'
+SNIFF_BLOCK_SIZE = 1024 * 1024  # bytes of the head of csv file to infer header, delimiter and encoding
+SNIFF_DELIMITER_TEXT_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 100000  # rows of a chunk when reading csv in chunks
+CSV_ENGINE_C = 'c'
+CSV_ENGINE_PYARROW = 'pyarrow'
+CSV_ENGINE_CHUNKED = 'chunked'
+CSV_ENGINES = [CSV_ENGINE_C, CSV_ENGINE_PYARROW, CSV_ENGINE_CHUNKED]
+CATEGORY_MAX_UNIQUE_PERCENTAGE = 50  # categorical column is read as category if most values are repeated
+MIN_ANALYZE_RANGE_SIZE = 16 * 1024 * 1024  # bytes, do not split small file to analyze in parallel
+DASK_BLOCK_SIZE = 64  # MB of a block analyzed by a dask task
+PROGRESSIVE_SAMPLE_ROWS = 10000  # head rows of the first pass of progressive analysis
+ANALYZE_PROGRESS_INTERVAL = 5  # seconds between two progress callbacks of analyze job
+N_SLOWEST_COLUMNS = 20  # slowest columns kept in timings of analyze job
+ROW_INDEX_INTERVAL = 1000  # rows between two byte offsets in row index of dataset
+UPLOAD_SAMPLE_ROWS = 20000  # rows sampled while uploading, analyze job uses them if it samples no more rows
+UPLOAD_SAMPLE_MAX_BYTES = 32 * 1024 * 1024  # rows sampled while uploading are fewer if they are wide, kept in web server
+N_BINS = 10
+BINS_EQUAL_WIDTH = 'equal_width'
+BINS_QUANTILE = 'quantile'  # bins have about the same number of values
+QUANTILE_SKETCH_K = 2000  # values kept exactly by the quantile sketch, rank error is about 0.14%
+HEAVY_HITTERS_CAPACITY = 10000  # values kept by heavy hitters when approximate distinct is enabled, counted exactly below it
+SPACE_SAVING_COMPACT_SIZE = 100000  # counts of chunks collected before summing up when heavy hitters count exactly
+ASSOCIATION_SAMPLE_ROWS = 20000  # rows sampled to calc association of features, error of correlation is about 0.01
+ASSOCIATION_MAX_CATEGORIES = 100  # other values of a categorical feature are taken as one category
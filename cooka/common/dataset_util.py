@@ -1,6 +1,10 @@
 # -*- encoding: utf-8 -*-
+import numpy as np
 import pandas as pd
 
+from cooka.common import consts
+from cooka.common.model import FeatureType
+
 
 def _convert_df_data_type(df, col_name, output_col_type):
     df[col_name] = df[[col_name]].astype(output_col_type)
@@ -21,6 +25,69 @@ convert_rules = \
     }
 
 
+# data types read as a compact one, which is accepted by `cast_df` as it is
+compact_rules = \
+    {
+        "int64": ["int8", "int16", "int32"],
+        "int32": ["int8", "int16"],
+        "float64": ["float32"],
+        "object": ["category"]
+    }
+
+
+def _compact_int_type(_min, _max):
+    for t in ["int8", "int16", "int32"]:
+        info = np.iinfo(t)
+        if info.min <= _min and _max <= info.max:
+            return t
+    return None
+
+
+def compact_dtypes(features, exact_range=False):
+    """Compact data types of features by analyzed stats, columns of no compact type are not included.
+
+    Args:
+        features: list of `Feature`.
+        exact_range: min and max of features are from the whole data, integers and floats are downcast only if it's
+            True for values out of range fail the reading.
+
+    Returns:
+        dict like {"age": "int8", "city": "category", "birthday": "datetime64[ns]"}
+    """
+    dtypes = {}
+    for f in features:
+        data_type = f.data_type
+        extension = f.extension or {}
+        if data_type == 'object' and f.type == FeatureType.Categorical:
+            if f.unique is not None and f.unique.percentage is not None \
+                    and f.unique.percentage <= consts.CATEGORY_MAX_UNIQUE_PERCENTAGE:
+                dtypes[f.name] = 'category'
+        elif 'datetime' in data_type:
+            dtypes[f.name] = data_type
+        elif exact_range and extension.get('min') is not None and extension.get('max') is not None:
+            _min, _max = extension['min'], extension['max']
+            if data_type == 'int64':
+                int_type = _compact_int_type(_min, _max)
+                if int_type is not None:
+                    dtypes[f.name] = int_type
+            elif data_type == 'float64':
+                if max(abs(_min), abs(_max)) <= np.finfo(np.float32).max:
+                    dtypes[f.name] = 'float32'
+    return dtypes
+
+
+def compact_read_kwargs(dtypes):
+    """Params of `pd.read_csv` to read columns as data types by `compact_dtypes`. """
+    read_kwargs = {}
+    dtype = {k: v for k, v in dtypes.items() if 'datetime' not in v}
+    parse_dates = [k for k, v in dtypes.items() if 'datetime' in v]
+    if len(dtype) > 0:
+        read_kwargs['dtype'] = dtype
+    if len(parse_dates) > 0:
+        read_kwargs['parse_dates'] = parse_dates
+    return read_kwargs
+
+
 def cast_df(input_df, schema, remove_unnecessary_cols=False):
     """schema: [{"name": "age", "type": "float64"}]"""
     # 1. validate input data
@@ -52,6 +119,9 @@ def cast_df(input_df, schema, remove_unnecessary_cols=False):
         feature_type_name = f['data_type']
 
         # 4.2. try to convert type if not match
+        if data_type_name in compact_rules.get(feature_type_name.lower(), []):
+            continue  # read as compact type
+
         if feature_type_name.lower() != data_type_name:
             converter_tuple = convert_rules.get(data_type_name)
             if converter_tuple is not None:
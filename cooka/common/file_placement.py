@@ -0,0 +1,65 @@
+# -*- encoding: utf-8 -*-
+"""
+Place a file at a new path without copying the data if possible, methods are tried in order:
+    - rename: move the file on the same filesystem, the source is gone.
+    - hardlink: another name of the same data on the same filesystem, changes of the source show in the target.
+    - reflink: copy-on-write clone on filesystems support it such as btrfs and xfs, the data is shared until changed.
+    - copy: copy by fixed-size blocks, content hash is computed in the same pass.
+"""
+import os
+
+from cooka.common import util
+from cooka.common.log import log_web as logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # not available on windows
+
+METHOD_RENAME = 'rename'
+METHOD_HARDLINK = 'hardlink'
+METHOD_REFLINK = 'reflink'
+METHOD_COPY = 'copy'
+METHODS = [METHOD_RENAME, METHOD_HARDLINK, METHOD_REFLINK, METHOD_COPY]
+
+FICLONE = 0x40049409  # ioctl request of linux to clone a file
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError("Reflink is not supported on this platform.")
+    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+
+
+def place_file(src, dst, methods=None):
+    """
+    Args:
+        src: source file.
+        dst: target path, it should not exist.
+        methods: methods to try in order, default is `METHODS`.
+
+    Returns:
+        tuple of (method used, content hash), content hash is None if the file is not copied.
+    """
+    methods = METHODS if methods is None else methods
+    if os.path.exists(dst):
+        raise FileExistsError(f"File {dst} already exists.")
+    for method in methods:
+        try:
+            if method == METHOD_RENAME:
+                os.rename(src, dst)
+            elif method == METHOD_HARDLINK:
+                os.link(src, dst)
+            elif method == METHOD_REFLINK:
+                _reflink(src, dst)
+            elif method == METHOD_COPY:
+                return method, util.copy_with_digest(src, dst)
+            else:
+                raise ValueError(f"Unseen method {method} to place file.")
+            return method, None
+        except OSError as e:
+            logger.info(f"Place file {src} at {dst} by {method} failed, try next: {e}")
+            if method in [METHOD_REFLINK, METHOD_COPY] and os.path.exists(dst):
+                os.remove(dst)  # remove partial file
+    raise OSError(f"Place file {src} at {dst} failed by all of methods {methods}.")
@@ -93,6 +93,30 @@ class SampleConf(Bean):
         WholeData = "whole_data"
 
 
+class CsvReadSpec(Bean):
+    has_header = BooleanField()
+    delimiter = StringField()
+    encoding = StringField()
+    quoted = BooleanField()  # double-quoted values have line breaks
+    dtypes = DictField()  # inferred from the head of file
+
+    def read_kwargs(self):
+        """Params for `pd.read_csv` except header. """
+        return {"sep": self.delimiter, "encoding": self.encoding}
+
+
+class UploadStats(Bean):
+    """Statistics computed while the file is uploaded. """
+    file_size = IntegerField()
+    content_hash = StringField()
+    n_rows = IntegerField()
+    n_sample_rows = IntegerField()  # rows in the sample file, it's uniformly sampled from all rows
+    read_spec = BeanField(CsvReadSpec)
+
+    def is_sample_enough(self, n):
+        return n <= self.n_sample_rows or self.n_sample_rows >= self.n_rows
+
+
 class AnalyzeJobConf(Bean):
 
     job_name = StringField()
@@ -122,6 +146,8 @@ class AnalyzeStep(JobStep):
         Copy = 'copy'
         Load = 'load'
         Analyzed = 'analyzed'
+        Refined = 'refined'
+        Progress = 'progress'  # kept in extension of the dataset, it's not a step of the job
         PatchCorrelation = 'patch_correlation'
         End = 'end'
 
@@ -358,6 +384,8 @@ class ExperimentConf(Bean):
     # feature_series_name = StringField()
     file_path = StringField()
     test_file_path = StringField()
+    dataset_read_spec = BeanField(CsvReadSpec)
+    dataset_dtypes = DictField()  # compact data types to read dataset
 
     class PartitionStrategy:
         CrossValidation = 'cross_validation'
@@ -411,6 +439,8 @@ class ContinuousFeatureExtension(Bean):
     mean = FloatField()
     stddev = FloatField()
     median = FloatField()
+    percentile_25 = FloatField()
+    percentile_75 = FloatField()
     value_count = ListBeanField(FeatureValueCount)
 
 
@@ -426,6 +456,17 @@ class DatetimeFeatureExtension(Bean):
     by_hour = ListObjectField()
 
 
+class AssociationMatrix(Bean):
+    columns = ListObjectField()
+    values = ListObjectField()  # values[i][j] is association of columns[i] and columns[j], None if undefined
+
+    def get(self, col_name):
+        """Association of the column with every column in the matrix, None if the column is not in it. """
+        if col_name not in self.columns:
+            return None
+        return dict(zip(self.columns, self.values[self.columns.index(col_name)]))
+
+
 class DatasetStats(Bean):
     label_col = StringField()
     file_path = StringField()
@@ -435,11 +476,22 @@ class DatasetStats(Bean):
     features = ListBeanField(Feature)
     feature_summary = BeanField(FeatureTypeStats)
     create_datetime = IntegerField()
+    read_spec = BeanField(CsvReadSpec)
+    sample_conf = BeanField(SampleConf)
+    association = BeanField(AssociationMatrix)
 
     @property
     def features_names(self):
         return [f.name for f in self.features]
 
+    def read_kwargs(self):
+        # datasets analyzed before have no read spec
+        return self.read_spec.read_kwargs() if self.read_spec is not None else {}
+
+    @property
+    def is_whole_data_analyzed(self):
+        return self.sample_conf is not None and self.sample_conf.sample_strategy == SampleConf.Strategy.WholeData
+
 
 class RestResponse(object):
 
@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+"""
+Incremental parser of multipart/form-data body, chunks are fed as they arrive and data of file parts is passed to a sink
+at once, so memory usage is bounded by the chunk size no matter how large the file is.
+"""
+from tornado import httputil
+
+STATE_PREAMBLE = 'preamble'
+STATE_HEADERS = 'headers'
+STATE_BODY = 'body'
+STATE_AFTER_DELIMITER = 'after_delimiter'
+STATE_END = 'end'
+
+MAX_HEADERS_SIZE = 64 * 1024
+MAX_FIELD_SIZE = 1024 * 1024
+
+
+class MultipartError(ValueError):
+    pass
+
+
+def parse_boundary(content_type):
+    """Boundary in the Content-Type header, None if it's not multipart. """
+    fields = content_type.split(";")
+    for field in fields:
+        k, sep, v = field.strip().partition("=")
+        if k == "boundary" and v:
+            if v.startswith('"') and v.endswith('"'):
+                v = v[1:-1]
+            return v.encode('utf-8')
+    return None
+
+
+class MultipartParser(object):
+    """
+    Args:
+        boundary: boundary of the body.
+        open_file: function(name, filename, headers) returns a sink with `write(data)` and `close()` for a file part.
+            Values of other parts are kept in `fields` as bytes.
+    """
+
+    def __init__(self, boundary: bytes, open_file):
+        self.open_file = open_file
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer = b"\r\n"  # the first boundary has no line break before it
+        self.state = STATE_PREAMBLE
+        self.fields = {}
+        self.sink = None
+        self.field_name = None
+
+    def feed(self, chunk: bytes):
+        self.buffer = self.buffer + chunk
+        while self._step():
+            pass
+
+    def _step(self):
+        """Consume the buffer as much as possible, returns whether the state changed. """
+        if self.state == STATE_PREAMBLE:
+            i = self.buffer.find(self.delimiter)
+            if i < 0:
+                self.buffer = self.buffer[-len(self.delimiter) + 1:]  # keep a partial delimiter
+                return False
+            self.buffer = self.buffer[i + len(self.delimiter):]
+            self.state = STATE_AFTER_DELIMITER
+            return True
+
+        elif self.state == STATE_AFTER_DELIMITER:
+            if len(self.buffer) < 2:
+                return False
+            if self.buffer[:2] == b"--":
+                self.state = STATE_END
+                self.buffer = b""
+                return False
+            if self.buffer[:2] != b"\r\n":
+                raise MultipartError("Invalid multipart boundary.")
+            self.buffer = self.buffer[2:]
+            self.state = STATE_HEADERS
+            return True
+
+        elif self.state == STATE_HEADERS:
+            i = self.buffer.find(b"\r\n\r\n")
+            if i < 0:
+                if len(self.buffer) > MAX_HEADERS_SIZE:
+                    raise MultipartError("Headers of multipart are too large.")
+                return False
+            self._begin_part(self.buffer[:i].decode('utf-8'))
+            self.buffer = self.buffer[i + 4:]
+            self.state = STATE_BODY
+            return True
+
+        elif self.state == STATE_BODY:
+            i = self.buffer.find(self.delimiter)
+            if i < 0:
+                # the tail may be the beginning of the delimiter
+                n = len(self.buffer) - len(self.delimiter) + 1
+                if n > 0:
+                    self._write(self.buffer[:n])
+                    self.buffer = self.buffer[n:]
+                return False
+            self._write(self.buffer[:i])
+            self._end_part()
+            self.buffer = self.buffer[i + len(self.delimiter):]
+            self.state = STATE_AFTER_DELIMITER
+            return True
+
+        else:
+            self.buffer = b""  # epilogue is ignored
+            return False
+
+    def _begin_part(self, headers_str):
+        headers = httputil.HTTPHeaders.parse(headers_str)
+        disposition, params = httputil._parse_header(headers.get("Content-Disposition", ""))
+        if disposition != "form-data" or "name" not in params:
+            raise MultipartError("Invalid multipart form-data part.")
+        if "filename" in params:
+            self.sink = self.open_file(params["name"], params["filename"], headers)
+            self.field_name = None
+        else:
+            self.sink = None
+            self.field_name = params["name"]
+            self.fields[self.field_name] = b""
+
+    def _write(self, data):
+        if len(data) == 0:
+            return
+        if self.sink is not None:
+            self.sink.write(data)
+        else:
+            value = self.fields[self.field_name] + data
+            if len(value) > MAX_FIELD_SIZE:
+                raise MultipartError(f"Field {self.field_name} is too large.")
+            self.fields[self.field_name] = value
+
+    def _end_part(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def close(self):
+        """Close the open file part if the body is not complete, raises MultipartError. """
+        if self.state != STATE_END:
+            self._end_part()
+            raise MultipartError("Multipart body is incomplete.")
+
+    @property
+    def finished(self):
+        return self.state == STATE_END
@@ -0,0 +1,92 @@
+# -*- encoding: utf-8 -*-
+"""
+Sparse row index of a csv file, byte offset of every `consts.ROW_INDEX_INTERVAL` rows is kept in a numpy file next to
+the csv file, so a page of rows is read by seeking to the nearest indexed row and parsing at most one interval more.
+
+Known Issues:
+    Blank lines are counted as rows, files may have line breaks in quoted values are not indexed.
+"""
+import os
+from os import path as P
+
+import numpy as np
+import pandas as pd
+
+from cooka.common import consts, util
+
+ROW_INDEX_SUFFIX = '.rows.npy'
+LINE_BREAK = ord('\n')
+
+
+def row_index_path(file_path):
+    return file_path + ROW_INDEX_SUFFIX
+
+
+def is_row_index_ready(file_path):
+    path = row_index_path(file_path)
+    return P.exists(path) and P.getmtime(path) >= P.getmtime(file_path)
+
+
+def is_indexable(read_spec):
+    # line breaks in quoted values are not rows, and byte offsets of multi-byte line breaks are not supported
+    if read_spec is None or read_spec.quoted:
+        return False
+    encoding = (read_spec.encoding or '').lower()
+    return '16' not in encoding and '32' not in encoding
+
+
+def build_row_index(file_path, has_header, interval=consts.ROW_INDEX_INTERVAL, block_size=util.COUNT_LINES_BLOCK_SIZE):
+    """Scan line breaks of the file by binary blocks and write the index.
+
+    Returns:
+        Path of the index file, the first item in it is the interval and others are offsets of row 0, interval,
+        interval * 2 ...
+    """
+    file_size = P.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        position = len(f.readline()) if has_header else 0
+        f.seek(position)
+        offsets = [interval, position]
+        n_breaks = 0
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            breaks = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == LINE_BREAK)
+            # row r starts after the (r - 1)th line break
+            first = (-(n_breaks + 1)) % interval
+            offsets.extend((position + breaks[first::interval] + 1).tolist())
+            n_breaks = n_breaks + breaks.shape[0]
+            position = position + len(block)
+
+    index = np.array(offsets[:2] + [o for o in offsets[2:] if o < file_size], dtype='int64')
+    path = row_index_path(file_path)
+    tmp_path = f"{path}.{util.short_uuid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, index)
+    os.replace(tmp_path, path)  # readers never see a partial file
+    return path
+
+
+def read_rows(file_path, start, n, **read_kwargs):
+    """Rows in [start, start + n) of the csv file by the row index, header of file is not read.
+
+    Args:
+        read_kwargs: params of `pd.read_csv` except header.
+
+    Returns:
+        pd.DataFrame, None if the row index is not ready.
+    """
+    if not is_row_index_ready(file_path):
+        return None
+    index = np.load(row_index_path(file_path), mmap_mode='r')
+    interval = int(index[0])
+    k = start // interval
+    file_size = P.getsize(file_path)
+    if 1 + k >= index.shape[0] or index[1 + k] >= file_size:
+        return pd.DataFrame()
+    with util.open_range(file_path, int(index[1 + k]), file_size) as f:
+        try:
+            return pd.read_csv(f, header=None, skiprows=start - k * interval, nrows=n, **read_kwargs)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
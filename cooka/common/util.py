@@ -1,4 +1,6 @@
 import datetime
+import hashlib
+import io
 import time
 import six
 from uuid import uuid4
@@ -297,6 +299,181 @@ def tail(file_path, n=100):
                 break
 
 
+COUNT_LINES_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class LineCounter(object):
+    """Count line breaks of a byte stream block by block, memory usage is constant.
+
+    If `quoted` is True, line breaks inside double-quoted fields are not counted. The quote state is kept between
+    blocks so a quoted field may span blocks, an escaped quote(`""`) toggles the state twice and makes no difference.
+    """
+
+    def __init__(self, quoted=False):
+        self.quoted = quoted
+        self.n_breaks = 0
+        self.in_quote = False
+        self.last_byte = None
+
+    def update(self, block):
+        if len(block) == 0:
+            return
+        if self.quoted:
+            parts = block.split(b'"')
+            # parts at odd position are in quote if block starts out of quote
+            start = 1 if self.in_quote else 0
+            for part in parts[start::2]:
+                self.n_breaks = self.n_breaks + part.count(b'\n')
+            if len(parts) % 2 == 0:  # odd number of quotes
+                self.in_quote = not self.in_quote
+        else:
+            self.n_breaks = self.n_breaks + block.count(b'\n')
+        self.last_byte = block[-1:]
+
+    @property
+    def n_lines(self):
+        if self.last_byte is None:
+            return 0  # empty file
+        if self.last_byte == b'\n':
+            return self.n_breaks
+        else:
+            return self.n_breaks + 1  # last line has no line break
+
+
+def count_lines(file_path, quoted=False, block_size=COUNT_LINES_BLOCK_SIZE):
+    """ Count lines of a file by reading fixed-size binary blocks.
+
+    Args:
+        file_path: a text file.
+        quoted: whether to skip line breaks in double-quoted fields, set it for csv file may has multi-line values.
+        block_size: bytes to read every time.
+
+    Returns:
+        Number of lines, the last line is counted even if it does not end with a line break.
+    """
+    counter = LineCounter(quoted=quoted)
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            counter.update(block)
+    return counter.n_lines
+
+
+CONTENT_HASH_SUFFIX = '.md5'
+
+
+def file_digest(file_path, block_size=COUNT_LINES_BLOCK_SIZE):
+    """Content hash of a file, read by fixed-size binary blocks. """
+    h = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def copy_with_digest(src, dst, block_size=COUNT_LINES_BLOCK_SIZE):
+    """Copy a file and compute its content hash in the same pass. """
+    h = hashlib.md5()
+    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        while True:
+            block = f_src.read(block_size)
+            if not block:
+                break
+            h.update(block)
+            f_dst.write(block)
+    return h.hexdigest()
+
+
+def write_content_hash(file_path, content_hash):
+    """Keep content hash in a sidecar file next to the data file. """
+    with open(file_path + CONTENT_HASH_SUFFIX, 'w') as f:
+        f.write(content_hash)
+
+
+def read_content_hash(file_path, compute=True):
+    """Content hash from the sidecar file, compute it if the sidecar is missing, or None if `compute` is False. """
+    sidecar = file_path + CONTENT_HASH_SUFFIX
+    if P.exists(sidecar):
+        with open(sidecar, 'r') as f:
+            return f.read().strip()
+    if not compute:
+        return None
+    content_hash = file_digest(file_path)
+    write_content_hash(file_path, content_hash)
+    return content_hash
+
+
+class FileRangeReader(io.RawIOBase):
+    """Read bytes in [start, end) of a file as a file object, double quotes in bytes read are counted in `n_quotes`.
+    """
+
+    def __init__(self, file_path, start, end):
+        self.file = open(file_path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+        self.n_quotes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.remaining)
+        if n <= 0:
+            return 0
+        data = self.file.read(n)
+        b[:len(data)] = data
+        self.n_quotes = self.n_quotes + data.count(b'"')
+        self.remaining = self.remaining - len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super(FileRangeReader, self).close()
+
+
+def open_range(file_path, start, end):
+    return io.BufferedReader(FileRangeReader(file_path, start, end), buffer_size=COUNT_LINES_BLOCK_SIZE)
+
+
+def count_quotes(file_path, start, end):
+    """Double quotes in bytes [start, end) of a file. """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start).count(b'"')
+
+
+def split_byte_ranges(file_path, n_ranges, skip_first_line=False):
+    """ Split a file into at most `n_ranges` byte ranges, every range begins at a line start and ends after a line
+    break(or end of the file), so lines can be processed by ranges independently.
+
+    A line break in a quoted field may be chosen as a boundary, callers should check that no range starts in a quote,
+    see `count_quotes` and `FileRangeReader.n_quotes`.
+
+    Returns:
+        list of (start, end)
+    """
+    file_size = P.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        begin = len(f.readline()) if skip_first_line else 0
+        boundaries = [begin]
+        for i in range(1, n_ranges):
+            position = begin + (file_size - begin) * i // n_ranges
+            if position <= boundaries[-1]:
+                continue
+            f.seek(position - 1)
+            f.readline()  # move to next line start, if position is a line start stay there
+            boundary = f.tell()
+            if boundaries[-1] < boundary < file_size:
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1) if boundaries[i] < boundaries[i + 1]]
+
+
 def readall(p):
     with open(p, 'r') as f:
         return f.read()
@@ -462,16 +639,63 @@ def model_dir(dataset_name, model_name):
     return P.join(dataset_dir(dataset_name), consts.FIELD_EXPERIMENT, model_name)
 
 
-def read_csv(csv_file, has_header, default_headers=None):
-    import pandas as pd  # took a lot of time(0.4s)
+def read_csv(csv_file, has_header, default_headers=None, usecols=None, engine=None, **read_kwargs):
+    """
+    Args:
+        usecols: columns to read, all columns if None.
+        engine: see `read_csv_with_engine`.
+        read_kwargs: other params of `pd.read_csv`, usually `CsvReadSpec.read_kwargs()`.
+    """
     if has_header:
-        return pd.read_csv(csv_file)  # read it all
+        return read_csv_with_engine(csv_file, engine, usecols=usecols, **read_kwargs)  # read it all
     else:
         if default_headers is None:
             raise ValueError("When has_header is False, param default_headers is required.")
-        df = pd.read_csv(csv_file, header=None)
-        df.columns = default_headers
+        return read_csv_with_engine(csv_file, engine, header=None, names=default_headers, usecols=usecols,
+                                    **read_kwargs)
+
+
+def read_csv_with_engine(csv_file, engine=None, **read_kwargs):
+    """Read the whole csv file into a DataFrame.
+
+    Args:
+        csv_file:
+        engine: one of `consts.CSV_ENGINES`, default is `consts.CSV_ENGINE`:
+            - "c": single-threaded C parser of pandas.
+            - "pyarrow": multi-threaded parser of pyarrow, falls back to "c" if pyarrow is not installed.
+            - "chunked": C parser reads chunks of `consts.READ_CHUNK_SIZE` rows then concat them, peak memory of the
+              parser is bounded by a chunk.
+        read_kwargs: params of `pd.read_csv`.
+    """
+    import pandas as pd
+    engine = consts.CSV_ENGINE if engine is None else engine
+    if engine == consts.CSV_ENGINE_PYARROW:
+        import importlib.util
+        if importlib.util.find_spec('pyarrow') is not None:
+            read_kwargs.pop('infer_datetime_format', None)  # not supported by pyarrow, datetime is inferred anyway
+            return pd.read_csv(csv_file, engine='pyarrow', **read_kwargs)
+        else:
+            from cooka.common.log import log_core as logger
+            logger.warning("Package pyarrow is not installed, read csv with engine 'c'.")
+            return pd.read_csv(csv_file, **read_kwargs)
+    elif engine == consts.CSV_ENGINE_CHUNKED:
+        df = pd.concat(iter_csv(csv_file, **read_kwargs), ignore_index=True)
+        dtype = read_kwargs.get('dtype')
+        if isinstance(dtype, dict):  # chunks of different categories are concat as object
+            category_cols = [c for c, t in dtype.items() if t == 'category' and df[c].dtype.name != 'category']
+            if len(category_cols) > 0:
+                df = df.astype({c: 'category' for c in category_cols})
         return df
+    elif engine == consts.CSV_ENGINE_C:
+        return pd.read_csv(csv_file, **read_kwargs)
+    else:
+        raise ValueError(f"Unsupported csv engine {engine}, should be one of {consts.CSV_ENGINES}")
+
+
+def iter_csv(csv_file, chunksize=consts.READ_CHUNK_SIZE, **read_kwargs):
+    """Read the csv file in chunks of DataFrame, it's always the C parser for pyarrow can not read in chunks. """
+    import pandas as pd
+    return pd.read_csv(csv_file, chunksize=chunksize, **read_kwargs)
 
 
 def relative_path(p: str, prefix=consts.DATA_DIR):
@@ -0,0 +1,421 @@
+# -*- encoding: utf-8 -*-
+"""
+Mergeable statistics of dataset, feed data chunk by chunk with `update` and combine partial results with `merge`,
+both produce the same result as analyze the whole data at once.
+"""
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cooka.common import consts
+from cooka.common.model import Feature, FeatureTypeStats, DatasetStats, ContinuousFeatureBin, \
+    ContinuousFeatureExtension, FeatureValueCount, CategoricalFeatureExtension, DatetimeFeatureExtension, \
+    YearValueCount, FeatureType, FeatureMode, FeatureUnique, FeatureMissing
+from cooka.core.sketch import HyperLogLog, SpaceSaving, KLLSketch
+from cooka.core.sampler import ReservoirSampler
+from cooka.core import association
+from cooka.core.instrument import timed, merge_timings, summarize_timings
+
+NaN = float('nan')
+
+
+def infer_feature_type(type_name):
+    if 'float' in type_name or 'int' in type_name:
+        return FeatureType.Continuous
+    elif 'datetime' in type_name:
+        return FeatureType.Datetime
+    else:
+        # todo CategoricalInt
+        # todo infer text
+        return FeatureType.Categorical
+
+
+def merge_data_type(type_name1, type_name2):
+    """Data type of a column when two chunks of it are read as different types. """
+    if type_name1 is None:
+        return type_name2
+    if type_name2 is None or type_name1 == type_name2:
+        return type_name1
+    types = {type_name1, type_name2}
+    if types == {'int64', 'float64'}:
+        return 'float64'  # int column has missing values in some chunks
+    return 'object'
+
+
+def weighted_quantiles(values, weights, qs):
+    """Quantiles of sorted values, a value of weight w counts as w duplicated values, linear interpolation between
+    the closest ranks as `pd.Series.quantile`.
+    """
+    cum_weights = np.cumsum(weights)
+    h = (cum_weights[-1] - 1) * np.asarray(qs, dtype='float64')
+    lower = values[np.searchsorted(cum_weights, np.floor(h), side='right')]
+    upper = values[np.searchsorted(cum_weights, np.ceil(h), side='right')]
+    return lower + (upper - lower) * (h - np.floor(h))
+
+
+def add_counts(counts1, counts2):
+    if counts1 is None:
+        return counts2
+    if counts2 is None:
+        return counts1
+    return counts1.add(counts2, fill_value=0).astype('int64')
+
+
+class ColumnAccumulator(object):
+    """
+    Args:
+        name: column name.
+        approx_distinct: summarize values in bounded memory, keep `consts.HEAVY_HITTERS_CAPACITY` most frequent
+            values by a Space-Saving sketch and estimate number of distinct values with a HyperLogLog sketch when
+            there are more, the relative error is written to extension as `unique_error_bound`.
+            Quantiles and bins of continuous column are from a KLL sketch, the rank error is written to extension as
+            `quantile_rank_error`.
+        hll_precision: precision of the HyperLogLog sketch.
+
+    Seconds spent on every statistic are accumulated in `timings`.
+    """
+
+    def __init__(self, name, approx_distinct=False, hll_precision=consts.HLL_PRECISION):
+        self.name = name
+        self.timings = {}
+        self.hll = HyperLogLog(hll_precision) if approx_distinct else None
+        self.data_type = None
+        self.is_mixed_types = False
+        self.n_rows = 0
+        self.missing = 0
+
+        # moments of non-null values for continuous column, merged by Chan's parallel algorithm
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+        self.heavy_hitters = SpaceSaving(consts.HEAVY_HITTERS_CAPACITY if approx_distinct else None)
+        # distribution of continuous values for bins and quantiles, unbounded heavy hitters already count all values
+        self.quantiles = KLLSketch(consts.QUANTILE_SKETCH_K) if approx_distinct else None
+
+        # for datetime column
+        self.by_year = None
+        self.by_month = np.zeros(12, dtype='int64')
+        self.by_week = np.zeros(7, dtype='int64')
+        self.by_hour = np.zeros(24, dtype='int64')
+
+    @property
+    def feature_type(self):
+        return infer_feature_type(self.data_type)
+
+    def _update_moments(self, count, mean, m2, _min, _max):
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = count, mean, m2, _min, _max
+            return
+        n = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / n
+        self.m2 = self.m2 + m2 + delta * delta * self.count * count / n
+        self.count = n
+        self.min = min(self.min, _min)
+        self.max = max(self.max, _max)
+
+    def _update_data_type(self, type_name, is_mixed_types=False):
+        if self.data_type is not None and type_name is not None and self.data_type != type_name:
+            is_mixed_types = True
+        self.is_mixed_types = self.is_mixed_types or is_mixed_types
+        self.data_type = merge_data_type(self.data_type, type_name)
+
+    def update(self, series: pd.Series, missing=None, moments=None):
+        """
+        Args:
+            series: a chunk of the column.
+            missing: number of missing values in the chunk if it's counted already.
+            moments: tuple of (count, mean, m2, min, max) of non-null values in the chunk if they're computed already.
+        """
+        self._update_data_type(series.dtype.name)
+        self.n_rows = self.n_rows + series.shape[0]
+        with timed(self.timings, 'missing'):
+            self.missing = self.missing + (int(series.isnull().sum()) if missing is None else missing)
+        with timed(self.timings, 'heavy_hitters'):
+            self.heavy_hitters.update(series)
+        if self.hll is not None:
+            with timed(self.timings, 'distinct'):
+                self.hll.update(series)
+
+        chunk_type = infer_feature_type(series.dtype.name)
+        if chunk_type == FeatureType.Continuous:
+            values = series.dropna().values.astype('float64') if self.quantiles is not None or moments is None \
+                else None
+            if self.quantiles is not None:
+                with timed(self.timings, 'quantiles'):
+                    self.quantiles.update(values)
+            if moments is not None:
+                self._update_moments(*moments)
+            elif values.shape[0] > 0:
+                with timed(self.timings, 'moments'):
+                    mean = values.mean()
+                    self._update_moments(values.shape[0], mean, float(((values - mean) ** 2).sum()),
+                                         values.min(), values.max())
+        elif chunk_type == FeatureType.Datetime:
+            with timed(self.timings, 'datetime'):
+                dt = series.dropna().dt
+                self.by_year = add_counts(self.by_year, dt.year.value_counts())
+                self.by_month = self.by_month + np.bincount(dt.month.values - 1, minlength=12)
+                self.by_week = self.by_week + np.bincount(dt.dayofweek.values, minlength=7)
+                self.by_hour = self.by_hour + np.bincount(dt.hour.values, minlength=24)
+        return self
+
+    def update_counts(self, value_counts: pd.Series, n_rows, type_name='object'):
+        """Update by distinct values of a categorical chunk and their counts, for values counted already.
+
+        Args:
+            value_counts: counts of non-null values indexed by the values.
+            n_rows: rows of the chunk, rows not counted are missing.
+            type_name: data type of the chunk.
+        """
+        self._update_data_type(type_name)
+        self.n_rows = self.n_rows + n_rows
+        self.missing = self.missing + n_rows - int(value_counts.sum())
+        with timed(self.timings, 'heavy_hitters'):
+            self.heavy_hitters.update_counts(value_counts)
+        if self.hll is not None:
+            with timed(self.timings, 'distinct'):
+                self.hll.update(value_counts.index.to_series())
+        return self
+
+    def merge(self, other):
+        merge_timings(self.timings, other.timings)
+        with timed(self.timings, 'merge'):
+            return self._merge(other)
+
+    def _merge(self, other):
+        self._update_data_type(other.data_type, other.is_mixed_types)
+        self.n_rows = self.n_rows + other.n_rows
+        self.missing = self.missing + other.missing
+        self.heavy_hitters.merge(other.heavy_hitters)
+        if self.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+        if self.hll is not None:
+            self.hll.merge(other.hll)
+        self._update_moments(other.count, other.mean, other.m2, other.min, other.max)
+        self.by_year = add_counts(self.by_year, other.by_year)
+        self.by_month = self.by_month + other.by_month
+        self.by_week = self.by_week + other.by_week
+        self.by_hour = self.by_hour + other.by_hour
+        return self
+
+    def _distribution(self):
+        # sorted distinct values or sketch items and their weights
+        if self.quantiles is not None:
+            return self.quantiles.items()
+        value_counts = self.heavy_hitters.counts.sort_index()
+        return value_counts.index.values.astype('float64'), value_counts.values
+
+    def _bins(self, values, weights, bins_strategy):
+        if bins_strategy == consts.BINS_QUANTILE:
+            edges = np.unique(weighted_quantiles(values, weights, np.linspace(0, 1, consts.N_BINS + 1)))
+            edges[0], edges[-1] = self.min, self.max
+        elif bins_strategy == consts.BINS_EQUAL_WIDTH:
+            edges = None
+        else:
+            raise ValueError(f"Unseen bins strategy: {bins_strategy}")
+
+        if edges is None or edges.shape[0] < 2:
+            # sketch may not keep min and max, put them in so that the bins cover the range of the column
+            intervals = pd.cut(np.concatenate([[self.min, self.max], values]), consts.N_BINS)[2:]
+        else:
+            intervals = pd.cut(values, edges, include_lowest=True)
+        bins_count = pd.Series(weights).groupby(intervals).sum().sort_values(ascending=False)
+        return [ContinuousFeatureBin(begin=k.left, end=k.right, value=int(v)) for k, v in bins_count.items()]
+
+    def _continuous_extension(self, bins_strategy):
+        if self.count == 0:
+            return ContinuousFeatureExtension(bins=[], min=NaN, max=NaN, mean=NaN, stddev=NaN, median=NaN,
+                                              percentile_25=NaN, percentile_75=NaN, value_count=[])
+
+        # 1. defaule set to 10 bins of equal width, or bins have the same number of values
+        values, weights = self._distribution()
+        bins = self._bins(values, weights, bins_strategy)
+        percentile_25, median, percentile_75 = weighted_quantiles(values, weights, [0.25, 0.5, 0.75])
+
+        # 2. feature_value_count, 按个数进行统计
+        heavy_hitters = self.heavy_hitters
+        value_count = [FeatureValueCount(type=k, value=int(v)) for k, v in
+                       heavy_hitters.top(consts.MAX_DISTINCT_VALUES).items()]
+        if heavy_hitters.counts.shape[0] > consts.MAX_DISTINCT_VALUES or not heavy_hitters.is_exact:
+            others_feature_values_sum = heavy_hitters.remained(consts.MAX_DISTINCT_VALUES)
+            value_count.append(FeatureValueCount(type=consts.KEY_REMAINED_FEATURE_VALUES_SUM, value=others_feature_values_sum))
+
+        stddev = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else NaN
+        return ContinuousFeatureExtension(bins=bins,
+                                          min=float(self.min),
+                                          max=float(self.max),
+                                          mean=float(self.mean),
+                                          stddev=stddev,
+                                          median=float(median),
+                                          percentile_25=float(percentile_25),
+                                          percentile_75=float(percentile_75),
+                                          value_count=value_count)
+
+    def _categorical_value_counts(self):
+        value_counts = self.heavy_hitters.counts
+        if self.is_mixed_types:
+            # chunks are read as different types, values are the same if they have the same text
+            return value_counts.groupby(value_counts.index.map(str)).sum().sort_values(ascending=False)
+        else:
+            return value_counts
+
+    def _categorical_extension(self, value_counts):
+        if value_counts.shape[0] > 0:
+            mode_value = value_counts.index[0]
+            mode_count = int(value_counts.iloc[0])
+            mode = FeatureMode(value=str(mode_value), count=mode_count, percentage=round(mode_count / self.n_rows * 100, 2))
+        else:
+            mode = None
+
+        # limit value count
+        value_count = [FeatureValueCount(type=str(k), value=int(v)) for k, v in
+                       value_counts.iloc[:consts.MAX_DISTINCT_VALUES].items()]
+        return CategoricalFeatureExtension(value_count=value_count, mode=mode)
+
+    def _datetime_extension(self):
+        # month starts from January at index 0, week starts from Monday
+        by_month = [int(v) for v in self.by_month]
+        by_hour = [int(v) for v in self.by_hour]
+        by_week = [int(v) for v in self.by_week]
+        by_year = []
+        if self.by_year is not None:
+            by_year = [YearValueCount(year=int(year), value=int(count)) for year, count in
+                       self.by_year.sort_values(ascending=False).items()]
+        return DatetimeFeatureExtension(by_year=by_year, by_month=by_month, by_week=by_week, by_hour=by_hour)
+
+    def to_feature(self, bins_strategy=consts.BINS_STRATEGY) -> Feature:
+        with timed(self.timings, 'to_feature'):
+            return self._to_feature(bins_strategy)
+
+    def _to_feature(self, bins_strategy) -> Feature:
+        feature_type = self.feature_type
+        if feature_type == FeatureType.Continuous:
+            extension = self._continuous_extension(bins_strategy)
+            unique_value = int(self.heavy_hitters.counts.shape[0])
+        elif feature_type == FeatureType.Datetime:
+            extension = self._datetime_extension()
+            unique_value = int(self.heavy_hitters.counts.shape[0])
+        else:
+            value_counts = self._categorical_value_counts()
+            extension = self._categorical_extension(value_counts)
+            unique_value = int(value_counts.shape[0])
+        extension = extension.to_dict()
+        if feature_type == FeatureType.Continuous and self.quantiles is not None and not self.quantiles.is_exact:
+            extension['quantile_rank_error'] = self.quantiles.rank_error
+
+        if not self.heavy_hitters.is_exact:
+            # less frequent values are dropped by heavy hitters
+            unique_value = min(max(self.hll.count(), unique_value), self.n_rows - self.missing)
+            extension['unique_error_bound'] = self.hll.error_bound
+
+        n_rows = self.n_rows
+        unique_percentage = unique_value / n_rows * 100 if n_rows > 0 else 0
+        feature_unique = FeatureUnique(value=unique_value, percentage=unique_percentage,
+                                       status=FeatureUnique.calc_status(unique_value, unique_percentage))
+        missing_percentage = self.missing / n_rows * 100 if n_rows > 0 else 0
+        feature_missing = FeatureMissing(value=self.missing, percentage=missing_percentage,
+                                         status=FeatureMissing.calc_status(missing_percentage))
+
+        return Feature(name=self.name,
+                       type=feature_type,
+                       data_type=self.data_type,
+                       missing=feature_missing,
+                       unique=feature_unique,
+                       extension=extension)
+
+
+class DatasetAccumulator(object):
+    """Statistics of all columns and a sample of rows to calc association of features.
+
+    Args:
+        sample_rows: whether to keep a sample of rows, accumulators of byte ranges do not keep it for the sample has all
+            columns and is pickled to the parent process, rows of the association features are sampled by another
+            pass then, see `to_dataset_stats`.
+    """
+
+    def __init__(self, approx_distinct=False, hll_precision=consts.HLL_PRECISION, sample_rows=True,
+                 random_state=None):
+        self.approx_distinct = approx_distinct
+        self.hll_precision = hll_precision
+        self.n_rows = 0
+        self.columns = OrderedDict()
+        # rows to calc association of features
+        self.sampler = ReservoirSampler(consts.ASSOCIATION_SAMPLE_ROWS, random_state) if sample_rows else None
+        self.timings = {}  # seconds of statistics of the whole dataset
+
+    def update(self, df: pd.DataFrame):
+        self.n_rows = self.n_rows + df.shape[0]
+        if self.sampler is not None:
+            with timed(self.timings, 'sample'):
+                self.sampler.update(df)
+        for col_name in df.columns:
+            column = self.columns.get(col_name)
+            if column is None:
+                column = ColumnAccumulator(col_name, self.approx_distinct, self.hll_precision)
+                self.columns[col_name] = column
+            column.update(df[col_name])
+        return self
+
+    def merge(self, other):
+        self.n_rows = self.n_rows + other.n_rows
+        merge_timings(self.timings, other.timings)
+        if self.sampler is not None and other.sampler is not None:
+            with timed(self.timings, 'sample'):
+                self.sampler.merge(other.sampler)
+        else:
+            self.sampler = None
+        for col_name, other_column in other.columns.items():
+            column = self.columns.get(col_name)
+            if column is None:
+                self.columns[col_name] = other_column
+            else:
+                column.merge(other_column)
+        return self
+
+    def summarize_timings(self):
+        return summarize_timings({name: column.timings for name, column in self.columns.items()}, self.timings)
+
+    @staticmethod
+    def summary_feature_type(features):
+        feature_type_dict = pd.Series(data=[f.type for f in features], name='feature_type').value_counts().to_dict()
+        return FeatureTypeStats(**feature_type_dict)
+
+    def to_dataset_stats(self, has_header, n_rows=None, bins_strategy=consts.BINS_STRATEGY,
+                         association_top_k=consts.ASSOCIATION_TOP_K, sample_features=None) -> DatasetStats:
+        """
+        Args:
+            has_header:
+            n_rows: rows of the whole file, default is rows accumulated.
+            bins_strategy: `consts.BINS_EQUAL_WIDTH` or `consts.BINS_QUANTILE`.
+            association_top_k: max features to calc association, 0 to skip it.
+            sample_features: called with names of features to calc association if no rows are sampled, it returns a
+                DataFrame of sampled rows of them. Association is skipped if both are missing.
+        """
+        features = [column.to_feature(bins_strategy) for column in self.columns.values()]
+        association_matrix = None
+        if association_top_k > 0:
+            if self.sampler is not None:
+                sample_df = self.sampler.get_sample()
+            elif sample_features is not None:
+                selected = association.select_features(features, association_top_k)
+                with timed(self.timings, 'sample'):
+                    sample_df = sample_features([f.name for f in selected]) if len(selected) > 0 else None
+            else:
+                sample_df = None
+            if sample_df is not None:
+                with timed(self.timings, 'association'):
+                    association_matrix = association.association_matrix(sample_df, features, association_top_k)
+        return DatasetStats(has_header=has_header,
+                            n_rows=self.n_rows if n_rows is None else n_rows,
+                            n_cols=len(features),
+                            features=features,
+                            feature_summary=self.summary_feature_type(features),
+                            association=association_matrix)
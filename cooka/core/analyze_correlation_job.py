@@ -7,7 +7,7 @@ import pandas as pd
 import argparse
 
 from sklearn.preprocessing import LabelEncoder
-from cooka.common import util, dataset_util
+from cooka.common import util, dataset_util, columnar
 from cooka.common.model import FeatureType, DatasetStats, AnalyzeStep, JobStep
 from cooka.common.log import log_web as logger
 from cooka.common import client
@@ -39,9 +39,15 @@ t = time.time()  # begin time
 dataset_detail = client.retrieve_dataset(server_portal, dataset_name)
 dataset_stats = DatasetStats.load_dict(dataset_detail)
 
-# 3. read df
-df = util.read_csv(util.abs_path(dataset_stats.file_path), dataset_stats.has_header, dataset_stats.features_names)
-df = dataset_util.cast_df(df, dataset_detail['features'], True)
+# 3. read df, only label and features to calc corr
+corr_features = [f for f in dataset_stats.features
+                 if f.name == label_col or f.type in [FeatureType.Continuous, FeatureType.Datetime]]
+usecols = [f.name for f in corr_features]
+dtypes = dataset_util.compact_dtypes(corr_features, dataset_stats.is_whole_data_analyzed)
+df = columnar.read_dataset(util.abs_path(dataset_stats.file_path), dataset_stats.has_header,
+                           dataset_stats.features_names, usecols=usecols, **dataset_stats.read_kwargs(),
+                           **dataset_util.compact_read_kwargs(dtypes))
+df = dataset_util.cast_df(df, [f.to_dict() for f in corr_features], True)
 y = df[label_col]
 
 # 4. encode y if is categorical # Do not calculate if categorical
@@ -1,9 +1,11 @@
 import time
-from cooka.common import util
+from cooka.common import util, consts
 from cooka.common.log import log_core as logger
 from cooka.common.model import AnalyzeStep, JobStep, SampleConf
 from cooka.common import client
-from cooka.core.analyzer import PandasAnalyzer
+from cooka.core.analyzer import PandasAnalyzer, ParallelAnalyzer
+from cooka.core import dask_analyzer, upload_stats
+import os
 
 # [1]. parse arguments
 import argparse
@@ -55,17 +57,99 @@ print("=========================")
 sample_conf = SampleConf(sample_strategy=sample_strategy, percentage=percentage, n_rows=n_rows)
 util.validate_sample_conf(sample_conf)
 
+
+def make_progress_callback(refining):
+    begin_time = time.time()
+
+    def report_progress(progress):
+        progress['refining'] = refining
+        client.analyze_callback(portal=server_portal,
+                                dataset_name=dataset_name,
+                                analyze_job_name=job_name,
+                                type=AnalyzeStep.Types.Progress,
+                                status=JobStep.Status.Succeed,
+                                took=util.time_diff(time.time(), begin_time),
+                                extension=progress)
+    return report_progress
+
+
+def make_whole_data_analyzer(progress_callback):
+    read_spec = file_upload_stats.read_spec if file_upload_stats is not None else None  # skip sniffing
+    use_dask = os.path.getsize(file_path) >= consts.DASK_ANALYZE_MIN_FILE_SIZE
+    if use_dask and not dask_analyzer.is_dask_available():
+        logger.warning("Package dask is not installed, analyze large file by processes pool.")
+        use_dask = False
+    if use_dask:
+        return dask_analyzer.DaskAnalyzer(file_path=file_path, label_col=None,
+                                          approx_distinct=consts.ANALYZE_APPROX_DISTINCT,
+                                          hll_precision=consts.HLL_PRECISION, read_spec=read_spec,
+                                          progress_callback=progress_callback)
+    else:
+        return ParallelAnalyzer(file_path=file_path, label_col=None,
+                                approx_distinct=consts.ANALYZE_APPROX_DISTINCT,
+                                hll_precision=consts.HLL_PRECISION, read_spec=read_spec,
+                                progress_callback=progress_callback)
+
+
+def make_analyze_extension(analyzer, dataset_stats, analyzed_sample_conf):
+    hints = []
+    if dataset_stats.n_cols > 1000:
+        hints.append({
+            "type": "Warning",
+            "message": "More than 1,000 columns dataset requires a long time to train."
+        })
+
+    if dataset_stats.n_rows > 1000000:
+        hints.append({
+            "type": "Warning",
+            "message": "More than 1,000,000 rows dataset requires a long time to train."
+        })
+    extension = dataset_stats.to_dict()
+    # del extension['name']
+    # del extension['create_datetime']
+    extension['hints'] = hints
+    # 增加抽样信息
+    extension['sample_conf'] = analyzed_sample_conf.to_dict()
+    extension['read_spec'] = analyzer.read_spec.to_dict()
+    # seconds of statistics and the slowest columns
+    extension['timings'] = analyzer.summarize_timings()
+    return extension
+
+
+# analyze head rows of large file first, and refine it by whole data later
+progressive = sample_conf.sample_strategy == SampleConf.Strategy.WholeData \
+              and consts.PROGRESSIVE_ANALYZE_MIN_FILE_SIZE > 0 \
+              and os.path.getsize(file_path) >= consts.PROGRESSIVE_ANALYZE_MIN_FILE_SIZE
+
+# rows and a sample computed while uploading, the file is not read again if the sample is enough
+file_upload_stats = upload_stats.read_stats(file_path)
+
 # [2]. load data
 t = time.time()
 load_extension = None
 load_status = JobStep.Status.Succeed
 try:
-    analyzer = PandasAnalyzer(file_path=file_path, label_col=None,  sample_conf=sample_conf)
+    if progressive:
+        analyzed_sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows,
+                                          n_rows=consts.PROGRESSIVE_SAMPLE_ROWS)
+        analyzer = PandasAnalyzer(file_path=file_path, label_col=None, sample_conf=analyzed_sample_conf,
+                                  approx_distinct=consts.ANALYZE_APPROX_DISTINCT, hll_precision=consts.HLL_PRECISION,
+                                  head_only=True, progress_callback=make_progress_callback(False),
+                                  upload_stats=file_upload_stats)
+    elif sample_conf.sample_strategy == SampleConf.Strategy.WholeData:
+        analyzed_sample_conf = sample_conf
+        analyzer = make_whole_data_analyzer(make_progress_callback(False))
+    else:
+        analyzed_sample_conf = sample_conf
+        analyzer = PandasAnalyzer(file_path=file_path, label_col=None,  sample_conf=sample_conf,
+                                  approx_distinct=consts.ANALYZE_APPROX_DISTINCT, hll_precision=consts.HLL_PRECISION,
+                                  progress_callback=make_progress_callback(False), upload_stats=file_upload_stats)
     load_extension = {
         "n_rows_used": analyzer.n_rows_used,
         "n_cols_used": analyzer.n_cols,
         "n_rows": analyzer.n_rows,
         "n_cols": analyzer.n_cols,
+        "content_hash": util.read_content_hash(file_path),  # read from the sidecar unless the file is cloned
     }
 except Exception as e:
     load_status = JobStep.Status.Failed
@@ -87,25 +171,8 @@ analyze_extension = None
 analyze_status = JobStep.Status.Succeed
 try:
     dataset_stats = analyzer.do_analyze_csv()
-    hints = []
-    if dataset_stats.n_cols > 1000:
-        hints.append({
-            "type": "Warning",
-            "message": "More than 1,000 columns dataset requires a long time to train."
-        })
-
-    if dataset_stats.n_rows > 1000000:
-        hints.append({
-            "type": "Warning",
-            "message": "More than 1,000,000 rows dataset requires a long time to train."
-        })
-    analyze_extension = dataset_stats.to_dict()
-    # del extension['name']
-    # del extension['create_datetime']
-    analyze_extension['hints'] = hints
-    # 增加抽样信息
-    analyze_extension['sample_conf'] = sample_conf.to_dict()
-
+    analyze_extension = make_analyze_extension(analyzer, dataset_stats, analyzed_sample_conf)
+    analyze_extension['progressive'] = progressive
 except Exception as e:
     analyze_status = JobStep.Status.Failed
     raise e
@@ -118,3 +185,26 @@ finally:
                             took=util.time_diff(time.time(), t),
                             extension=analyze_extension)
     logger.info("Analyze dataset finished. ")
+
+
+# [4]. refine by whole data
+if progressive:
+    t = time.time()
+    refine_extension = None
+    refine_status = JobStep.Status.Succeed
+    try:
+        analyzer = make_whole_data_analyzer(make_progress_callback(True))
+        dataset_stats = analyzer.do_analyze_csv()
+        refine_extension = make_analyze_extension(analyzer, dataset_stats, sample_conf)
+    except Exception as e:
+        refine_status = JobStep.Status.Failed
+        raise e
+    finally:
+        client.analyze_callback(portal=server_portal,
+                                dataset_name=dataset_name,
+                                analyze_job_name=job_name,
+                                type=AnalyzeStep.Types.Refined,
+                                status=refine_status,
+                                took=util.time_diff(time.time(), t),
+                                extension=refine_extension)
+        logger.info("Refine analysis of dataset finished. ")
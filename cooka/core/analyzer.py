@@ -1,13 +1,18 @@
 # DataFrames
+import math
+import multiprocessing
 import os
 
 import pandas as pd
 
-from cooka.common import consts
-from cooka.common.model import Feature, FeatureTypeStats, DatasetStats, ContinuousFeatureBin, \
-    ContinuousFeatureExtension, FeatureValueCount, \
-    CategoricalFeatureExtension, DatetimeFeatureExtension, YearValueCount, FeatureType, FeatureMode, SampleConf, \
-    FeatureUnique, FeatureMissing
+from cooka.common import consts, util
+from cooka.common.log import log_core as logger
+from cooka.core import sampler, datetime_parser, association, column_parallel
+from cooka.core.accumulator import ColumnAccumulator, DatasetAccumulator, infer_feature_type
+from cooka.core.instrument import ProgressReporter, timed, summarize_timings
+from cooka.core.sniffer import CsvSniffer
+from cooka.core.upload_stats import read_sample as read_upload_sample
+from cooka.common.model import DatasetStats, SampleConf, CsvReadSpec, UploadStats
 
 
 class Analyzer(object):
@@ -17,61 +22,111 @@ class Analyzer(object):
 class PandasAnalyzer(Analyzer):
 
     @staticmethod
-    def get_analyze_df(file_path, sample_chunksize, header):
+    def get_analyze_df(file_path, sample_chunksize, header, **read_kwargs):
         # infer
         if sample_chunksize > -1:
-            df_iterator = pd.read_csv(file_path, chunksize=sample_chunksize, header=header, infer_datetime_format=True)
+            df_iterator = util.iter_csv(file_path, chunksize=sample_chunksize, header=header,
+                                        infer_datetime_format=True, **read_kwargs)
             return df_iterator.get_chunk()  # use first chunk
         else:
             # use whole data
-            return pd.read_csv(file_path, header=header, infer_datetime_format=True)
+            return util.read_csv_with_engine(file_path, header=header, infer_datetime_format=True, **read_kwargs)
 
-    def __init__(self, file_path: str, label_col: str, sample_conf: SampleConf):
-        import time
+    @staticmethod
+    def estimate_n_rows(file_path, n_head_rows, is_has_header):
+        """Rows of the file estimated by bytes of the head rows. """
+        with open(file_path, 'rb') as f:
+            if is_has_header:
+                f.readline()
+            begin = f.tell()
+            for i in range(n_head_rows):
+                f.readline()
+            head_bytes = f.tell() - begin
+        if head_bytes == 0:
+            return 0
+        return int(round((os.path.getsize(file_path) - begin) / head_bytes * n_head_rows))
+
+    def __init__(self, file_path: str, label_col: str, sample_conf: SampleConf, random_state=None,
+                 approx_distinct=False, hll_precision=consts.HLL_PRECISION, read_spec: CsvReadSpec = None,
+                 head_only=False, progress_callback=None, upload_stats: UploadStats = None):
+        """
+        Args:
+            head_only: for strategy `SampleConf.Strategy.RandomRows`, take the head rows but not random rows and
+                estimate rows of the file by bytes, it does not read the whole file so it's fast for a first look.
+            progress_callback: called with progress of analysis periodically, see `ProgressReporter`.
+            upload_stats: statistics computed while the file was uploaded, rows are taken from its sample file and
+                the file is not read if the sample is enough for the sample conf, even if `head_only` is set.
+        """
         # 1. check params
         if not os.path.exists(file_path):
             raise FileExistsError("File not found: %s" % file_path)
         self.file_path = file_path
         self.sample_conf = sample_conf
         self.label_col = label_col
-
-        # 2. check headers
-        is_has_header = self.is_csv_file_has_header(file_path)
+        self.approx_distinct = approx_distinct
+        self.hll_precision = hll_precision
+        self.random_state = random_state
+        self.progress = ProgressReporter(progress_callback)
+        self.column_timings = {}
+        self.timings = {}
+
+        # 2. check headers, delimiter and encoding
+        if read_spec is None and upload_stats is not None:
+            read_spec = upload_stats.read_spec
+        self.read_spec = read_spec if read_spec is not None else CsvSniffer().sniff(file_path)
+        is_has_header = self.read_spec.has_header
         self.is_has_header = is_has_header
-
-        # 3. calc sample chunk size
-        self.n_rows = self._count_lines(file_path, is_has_header)
-        if sample_conf.sample_strategy == SampleConf.Strategy.RandomRows:
-            sample_chunksize = sample_conf.n_rows
-
-        elif sample_conf.sample_strategy == SampleConf.Strategy.Percentage:
-            sample_chunksize = round(self.n_rows * sample_conf.percentage / 100)
-
+        header = 'infer' if is_has_header else None
+
+        # 3. read data, sample strategies read the file once and count rows meanwhile
+        n_upload_sample = self.n_upload_sample(sample_conf, upload_stats)
+        if n_upload_sample is not None:
+            logger.info(f"Take {n_upload_sample} rows from the sample of upload statistics.")
+            self.df = read_upload_sample(file_path, n_upload_sample, random_state=random_state, header=header,
+                                         infer_datetime_format=True, **self.read_spec.read_kwargs())
+            self.n_rows = upload_stats.n_rows
+        elif head_only and sample_conf.sample_strategy == SampleConf.Strategy.RandomRows:
+            self.df = self.get_analyze_df(file_path, sample_conf.n_rows, header, **self.read_spec.read_kwargs())
+            if self.df.shape[0] < sample_conf.n_rows:
+                self.n_rows = self.df.shape[0]  # read all
+            elif upload_stats is not None:
+                self.n_rows = upload_stats.n_rows
+            else:
+                self.n_rows = self.estimate_n_rows(file_path, self.df.shape[0], is_has_header)
+        elif sample_conf.sample_strategy in [SampleConf.Strategy.RandomRows, SampleConf.Strategy.Percentage]:
+            self.df, self.n_rows = sampler.sample_csv(file_path, sample_conf, random_state=random_state,
+                                                      header=header, infer_datetime_format=True,
+                                                      **self.read_spec.read_kwargs())
         elif sample_conf.sample_strategy == SampleConf.Strategy.WholeData:
-            sample_chunksize = -1
-
+            self.df = self.get_analyze_df(file_path, -1, header, **self.read_spec.read_kwargs())
+            self.n_rows = self.df.shape[0]
         else:
             raise ValueError(f"Unsupported sample strategy = {sample_conf.sample_strategy}")
 
-        # 4. read data
         if not is_has_header:
-            # 4.1. update columns
-            self.df = self.get_analyze_df(file_path, sample_chunksize, None)
             self.df.columns = ["c%s" % c for c in self.df.columns]  # generate name for df
-        else:
-            self.df = self.get_analyze_df(file_path, sample_chunksize, 'infer')
 
         self.n_cols = self.df.shape[1]  # read file columns
+        self.n_rows_used = self.df.shape[0]
+        self.progress.n_cols = self.n_cols
+        self.progress.report(n_rows_scanned=self.n_rows_used, force=True)
 
-        if self.sample_conf.sample_strategy == SampleConf.Strategy.WholeData:
-            self.n_rows_used = self.n_rows
-        else:
-            self.n_rows_used = sample_chunksize
+        # 4. to fix date types
+        with timed(self.timings, 'parse_datetime'):
+            datetime_parser.parse_datetime_cols(self.df)
 
-        # 3. to fix date types
-        categorical_cols = self.get_categorical_cols(self.df)
-        for c in categorical_cols:
-            self.df[c] = self.parse_date(self.df[c])
+    @staticmethod
+    def n_upload_sample(sample_conf: SampleConf, upload_stats: UploadStats):
+        """Rows to take from the sample of upload statistics, None if the sample is not enough. """
+        if upload_stats is None or upload_stats.n_rows < 1:
+            return None
+        if sample_conf.sample_strategy == SampleConf.Strategy.RandomRows:
+            n = sample_conf.n_rows
+        elif sample_conf.sample_strategy == SampleConf.Strategy.Percentage:
+            n = int(round(upload_stats.n_rows * sample_conf.percentage / 100))
+        else:
+            return None
+        return n if upload_stats.is_sample_enough(n) else None
 
     @staticmethod
     def get_categorical_cols(df: pd.DataFrame):
@@ -85,166 +140,202 @@ class PandasAnalyzer(Analyzer):
 
     @staticmethod
     def is_csv_file_has_header(path):
-        df_no_header: pd.DataFrame = next(pd.read_csv(path, chunksize=100, header=None))
-        for col in df_no_header.dtypes.to_dict():
-            type_name = df_no_header.dtypes[col].name
-            # only this case
-            if 'float' in type_name or 'int' in type_name or 'datetime' in type_name or 'timestamp' in type_name:
-                return False
-        return True
+        return CsvSniffer().sniff(path).has_header
 
     @staticmethod
     def parse_date(series: pd.Series):
-        format = "%Y-%m-%d %H:%M:%S"  # Now only support one format
-        # 1. take top 100 non-empty values
-        INFER_TOP_N = 100
-        series_non_empty = series.dropna()[: INFER_TOP_N]
-
-        # 2. if these value all datetime value infer it as datetime nor object
-        for item in series_non_empty:
-            try:
-                if isinstance(item, str):
-                    pd.datetime.strptime(item, format)
-                else:
-                    return series
-            except Exception as e:
-                return series
-
-        # 3. infer as datetime
-        return pd.to_datetime(series, format=format)
-
-    def _count_lines(self, path, is_has_header):
-        count = 0
-        with open(path, 'r') as f:
-            for _ in f.readlines():
-                count = count + 1
-        if count > 0:
-            if is_has_header is True:
-                return count - 1  # remove header
-            else:
-                return count
+        return datetime_parser.parse_datetime(series)
+
+    def analyze_col(self, col_name):
+        accumulator = ColumnAccumulator(col_name, self.approx_distinct, self.hll_precision)
+        feature = accumulator.update(self.df[col_name]).to_feature()
+        self.column_timings[col_name] = accumulator.timings
+        return feature
+
+    def do_analyze_csv(self) -> DatasetStats:
+        if self.df.shape[1] >= consts.WIDE_TABLE_MIN_COLS and consts.ANALYZE_N_WORKERS > 1:
+            logger.info(f"Analyze {self.df.shape[1]} columns with {consts.ANALYZE_N_WORKERS} processes.")
+            features = column_parallel.analyze_columns(self.df, self.approx_distinct, self.hll_precision,
+                                                       timings=self.column_timings, progress=self.progress)
         else:
-            return 0
+            features = []
+            for col_name in self.df.columns:
+                features.append(self.analyze_col(col_name))
+                self.progress.report(n_cols_done=len(features))
+        self.progress.report(n_cols_done=len(features), force=True)
+        fts = DatasetAccumulator.summary_feature_type(features)
+
+        association_matrix = None
+        if consts.ASSOCIATION_TOP_K > 0:
+            if self.df.shape[0] > consts.ASSOCIATION_SAMPLE_ROWS:
+                association_df = self.df.sample(consts.ASSOCIATION_SAMPLE_ROWS, random_state=self.random_state)
+            else:
+                association_df = self.df
+            with timed(self.timings, 'association'):
+                association_matrix = association.association_matrix(association_df, features,
+                                                                    consts.ASSOCIATION_TOP_K)
 
-    def analyze_col(self, col_name, missing):
-        series = self.df[col_name]
+        return DatasetStats(has_header=self.is_has_header, n_rows=self.n_rows, n_cols=len(features), features=features,
+                            feature_summary=fts, association=association_matrix)
 
-        unique_value = int(self.df[col_name].value_counts().count())
-        type_name = self.df.dtypes[col_name].name
+        # X1.corr(Y1, method="pearson")
 
-        # del missing label
-        # label encoder label
-        # calc relevance
-        # not for text
+    def infer_feature_type(self, type_name):
+        return infer_feature_type(type_name)
 
-        feature_type = self.infer_feature_type(type_name)
-        extension = None
-        if feature_type == FeatureType.Continuous:
-            # 1. defaule set to 10 bins
-            bins = [ContinuousFeatureBin(begin=k.left, end=k.right, value=v) for k, v in pd.value_counts(pd.cut(series, 10)).items()]
+    def summarize_timings(self):
+        return summarize_timings(self.column_timings, self.timings)
 
-            # 2. describe
-            series_d = series.describe()
-            feature_value_count = pd.value_counts(series)
 
-            # feature_value_count, 按个数进行统计
-            feature_value_count_sorted = feature_value_count.sort_values(ascending=False)
+class StreamingAnalyzer(Analyzer):
+    """Analyze the whole data chunk by chunk, statistics of chunks are accumulated so the file is never loaded at once.
+    """
 
-            if feature_value_count_sorted.shape[0] > consts.MAX_DISTINCT_VALUES:
-                feature_value_count_limited = feature_value_count_sorted.iloc[:consts.MAX_DISTINCT_VALUES]
-                others_feature_values_sum = feature_value_count_sorted.iloc[consts.MAX_DISTINCT_VALUES:].sum()
-                value_count = [FeatureValueCount(type=k, value=int(v)) for k, v in
-                               feature_value_count_limited.items()]
+    def __init__(self, file_path: str, label_col: str, chunksize=consts.READ_CHUNK_SIZE,
+                 approx_distinct=False, hll_precision=consts.HLL_PRECISION, read_spec: CsvReadSpec = None,
+                 progress_callback=None):
+        if not os.path.exists(file_path):
+            raise FileExistsError("File not found: %s" % file_path)
+        self.file_path = file_path
+        self.label_col = label_col
+        self.chunksize = chunksize
+        self.approx_distinct = approx_distinct
+        self.hll_precision = hll_precision
+        self.sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.WholeData)
+
+        self.read_spec = read_spec if read_spec is not None else CsvSniffer().sniff(file_path)
+        self.is_has_header = self.read_spec.has_header
+
+        self.progress = ProgressReporter(progress_callback, n_cols=len(self.read_spec.dtypes))
+        self.accumulator = self.accumulate()
+        self.n_rows = self.accumulator.n_rows
+        self.n_rows_used = self.n_rows
+        self.n_cols = len(self.accumulator.columns)
+        self.progress.n_cols = self.n_cols
+        self.progress.report(n_rows_scanned=self.n_rows, force=True)
+
+    def accumulate(self) -> DatasetAccumulator:
+        header = 'infer' if self.is_has_header else None
+        accumulator = DatasetAccumulator(self.approx_distinct, self.hll_precision)
+        for chunk in util.iter_csv(self.file_path, chunksize=self.chunksize, header=header, infer_datetime_format=True,
+                                   **self.read_spec.read_kwargs()):
+            accumulator.update(self.prepare_chunk(chunk, self.is_has_header))
+            self.progress.report(n_rows_scanned=accumulator.n_rows)
+        return accumulator
 
-                remained_feature_count = FeatureValueCount(type=consts.KEY_REMAINED_FEATURE_VALUES_SUM, value=int(others_feature_values_sum))
-                value_count.append(remained_feature_count)
-            else:
-                value_count = [FeatureValueCount(type=k, value=int(v)) for k, v in feature_value_count_sorted.items()]
-
-            extension = \
-                ContinuousFeatureExtension(bins=bins,
-                                           min=series_d['min'],
-                                           max=series_d['max'],
-                                           mean=series_d['mean'],
-                                           stddev=series_d['std'],
-                                           median=series_d['50%'],
-                                           value_count=value_count)
-        elif feature_type == FeatureType.Categorical:
-            series_d = series.describe()
-
-            feature_value_count = pd.value_counts(series)
-            mode_value = series_d['top']
-            mode_count = int(feature_value_count[mode_value])
-            mode = FeatureMode(value=str(mode_value), count=mode_count, percentage=round(mode_count/self.df.shape[0] * 100, 2))  # todo add unit test
-
-            # limit value count
-            feature_value_count_limited = feature_value_count.sort_values(ascending=False).iloc[:consts.MAX_DISTINCT_VALUES]
-
-            value_count = [FeatureValueCount(type=str(k), value=int(v)) for k, v in feature_value_count_limited.items()]
-            extension = \
-                CategoricalFeatureExtension(value_count=value_count, mode=mode)
-
-        elif feature_type == FeatureType.Datetime:
-            def to_int(v):
-                try:
-                    return int(v)
-                except Exception:
-                    return v
-
-            by_year_dict = series.map(lambda _: to_int(_.year)).value_counts()
-            by_month_dict = series.map(lambda _: to_int(_.month)).value_counts()
-            by_week_dict = series.map(lambda _: to_int(_.dayofweek)).value_counts()  # +1
-            by_hour_dict = series.map(lambda _: to_int(_.hour)).value_counts()
-
-            by_month = [int(by_month_dict.get(float(i), 0)) for i in range(12)]
-            by_hour = [int(by_hour_dict.get(float(i), 0)) for i in range(24)]
-            by_week = [int(by_week_dict.get(float(i), 0)) for i in range(7)]
-            by_year = [YearValueCount(year=int(year), value=count) for year, count in by_year_dict.items()]
-
-            extension = \
-                DatetimeFeatureExtension(by_year=by_year, by_month=by_month, by_week=by_week,by_hour=by_hour)
-
-        if extension is not None:
-            extension = extension.to_dict()
-        n_rows = series.shape[0]
-
-        unique_percentage = unique_value/n_rows * 100
-        feature_unique = FeatureUnique(value=unique_value, percentage=unique_percentage,
-                                       status=FeatureUnique.calc_status(unique_value, unique_percentage))
-        missing_percentage = missing/n_rows*100
-        feature_missing = FeatureMissing(value=missing, percentage=missing_percentage,
-                                         status=FeatureMissing.calc_status(missing_percentage))
-
-        # feature_correlation = FeatureCorrelation(value=unique_value, percentage=unique_value/, status=) 相关性在分析那里
-
-        return Feature(name=col_name,
-                       type=feature_type,
-                       data_type=series.dtype.name,
-                       missing=feature_missing,
-                       unique=feature_unique,
-                       extension=extension)
+    @staticmethod
+    def prepare_chunk(chunk: pd.DataFrame, is_has_header):
+        if not is_has_header:
+            chunk.columns = ["c%s" % c for c in chunk.columns]
+        return datetime_parser.parse_datetime_cols(chunk)
+
+    def sample_features(self, columns):
+        """Sample rows of some columns by another pass of the file, for accumulators of byte ranges sample no rows. """
+        reservoir = sampler.ReservoirSampler(consts.ASSOCIATION_SAMPLE_ROWS)
+        header = 0 if self.is_has_header else None
+        for chunk in util.iter_csv(self.file_path, chunksize=self.chunksize, header=header,
+                                   names=list(self.read_spec.dtypes.keys()), usecols=columns,
+                                   infer_datetime_format=True, **self.read_spec.read_kwargs()):
+            reservoir.update(self.prepare_chunk(chunk, True))
+        return reservoir.get_sample()
 
     def do_analyze_csv(self) -> DatasetStats:
-        df = self.df
+        dataset_stats = self.accumulator.to_dataset_stats(self.is_has_header, sample_features=self.sample_features)
+        self.progress.report(n_cols_done=self.n_cols, force=True)
+        return dataset_stats
 
-        n_cols = len(df.columns)
-        missing_dict = df.isnull().sum()
-        features = [self.analyze_col(col_name, int(missing_dict[col_name]), ) for col_name in df.columns]
-        feature_type_dict = pd.Series(data=[f.type for f in features], name='feature_type').value_counts().to_dict()
-        fts = FeatureTypeStats(**feature_type_dict)
+    def summarize_timings(self):
+        return self.accumulator.summarize_timings()
 
-        return DatasetStats(has_header=self.is_has_header, n_rows=self.n_rows, n_cols=n_cols, features=features, feature_summary=fts)
 
-        # df['SepalLengthCm'].value_counts().compute()
+class RangeAccumulation(object):
+    """Accumulator of consecutive byte ranges and the double quotes in them.
 
-        # X1.corr(Y1, method="pearson")
+    A range is parsed right only if it does not start in a quoted value, that is quotes before it are even. Quotes
+    before the first range are unknown until ranges are merged, so `start_parity` keeps the parity they are required
+    to have, or None if no parity makes every range right or a range failed to parse. The accumulator is dropped then.
+    """
 
-    def infer_feature_type(self, type_name):
-        if 'float' in type_name  or 'int'  in type_name:
-            return FeatureType.Continuous
-        elif 'datetime' in type_name :
-            return FeatureType.Datetime
+    def __init__(self, accumulator, n_quotes, start_parity=0):
+        self.accumulator = accumulator
+        self.n_quotes = n_quotes
+        self.start_parity = start_parity if accumulator is not None else None
+
+    def merge(self, other):
+        # quotes before `other` are quotes before self and in self
+        other_parity = None if other.start_parity is None else (other.start_parity + self.n_quotes) % 2
+        if self.start_parity is None or other_parity != self.start_parity:
+            self.start_parity = None
+            self.accumulator = None
         else:
-            # todo CategoricalInt
-            # todo infer text
-            return FeatureType.Categorical
+            self.accumulator.merge(other.accumulator)
+        self.n_quotes = self.n_quotes + other.n_quotes
+        return self
+
+    def is_split_right(self, n_quotes_before):
+        return self.start_parity is not None and self.start_parity == n_quotes_before % 2
+
+
+def _accumulate_range(file_path, start, end, columns, chunksize, approx_distinct, hll_precision, read_kwargs):
+    accumulator = DatasetAccumulator(approx_distinct, hll_precision, sample_rows=False)
+    with util.open_range(file_path, start, end) as f:
+        try:
+            for chunk in util.iter_csv(f, chunksize=chunksize, header=None, names=columns,
+                                       infer_datetime_format=True, **read_kwargs):
+                accumulator.update(StreamingAnalyzer.prepare_chunk(chunk, True))
+        except (pd.errors.ParserError, ValueError) as e:
+            # a range starts in a quoted value may be malformed, the whole file will be read in one pass then
+            logger.warning(f"Failed to parse range [{start}, {end}) of file {file_path}: {e}")
+            f.read()  # count all quotes
+            accumulator = None
+        n_quotes = f.raw.n_quotes
+    return RangeAccumulation(accumulator, n_quotes)
+
+
+def _accumulate_range_task(task):
+    return _accumulate_range(*task)
+
+
+class ParallelAnalyzer(StreamingAnalyzer):
+    """Split the file into newline-aligned byte ranges and accumulate every range in a process pool.
+
+    Set `quoted` if values of the file may contain line breaks, then the file is not split. It is also set if the
+    sniffer finds such values in the head of file. Otherwise quotes of every range are counted, if a range starts in a
+    quoted value the file is read again in one pass.
+    """
+
+    def __init__(self, file_path: str, label_col: str, n_workers=consts.ANALYZE_N_WORKERS, quoted=False,
+                 chunksize=consts.READ_CHUNK_SIZE, approx_distinct=False, hll_precision=consts.HLL_PRECISION,
+                 read_spec: CsvReadSpec = None, progress_callback=None):
+        self.n_workers = n_workers
+        self.quoted = quoted
+        super(ParallelAnalyzer, self).__init__(file_path, label_col, chunksize, approx_distinct, hll_precision,
+                                               read_spec, progress_callback)
+
+    def accumulate(self) -> DatasetAccumulator:
+        n_ranges = min(self.n_workers, math.ceil(os.path.getsize(self.file_path) / consts.MIN_ANALYZE_RANGE_SIZE))
+        if self.quoted or self.read_spec.quoted or n_ranges <= 1:
+            return super(ParallelAnalyzer, self).accumulate()
+
+        # 1. columns are named by the sniffer
+        columns = list(self.read_spec.dtypes.keys())
+
+        # 2. accumulate ranges in parallel and reduce them by order
+        ranges = util.split_byte_ranges(self.file_path, n_ranges, skip_first_line=self.is_has_header)
+        logger.info(f"Analyze {len(ranges)} ranges of file {self.file_path} with {self.n_workers} processes.")
+        tasks = [(self.file_path, start, end, columns, self.chunksize, self.approx_distinct, self.hll_precision,
+                  self.read_spec.read_kwargs()) for start, end in ranges]
+        n_header_quotes = util.count_quotes(self.file_path, 0, ranges[0][0])
+        accumulation = None
+        with multiprocessing.Pool(min(self.n_workers, len(tasks))) as pool:
+            # results are in order of ranges
+            for partial in pool.imap(_accumulate_range_task, tasks):
+                accumulation = partial if accumulation is None else accumulation.merge(partial)
+                if not accumulation.is_split_right(n_header_quotes):
+                    break  # pool is terminated on exit
+                self.progress.report(n_rows_scanned=accumulation.accumulator.n_rows)
+
+        if not accumulation.is_split_right(n_header_quotes):
+            logger.warning(f"File {self.file_path} has line breaks in quoted values, analyze it in one pass.")
+            return super(ParallelAnalyzer, self).accumulate()
+        return accumulation.accumulator
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+"""
+Association of every two features, calculated from a sample of rows when analyzing so the correlation with any label
+is a lookup later:
+    - Pearson correlation of two continuous or datetime features.
+    - Cramér's V of two categorical features.
+    - Correlation ratio of a categorical feature and a continuous or datetime feature.
+Pairs are calculated on rows both values are not missing.
+"""
+import numpy as np
+import pandas as pd
+
+from cooka.common import consts
+from cooka.common.model import AssociationMatrix, FeatureType, FeatureUnique
+
+NUMERIC_FEATURE_TYPES = [FeatureType.Continuous, FeatureType.Datetime]
+
+
+def select_features(features, top_k=consts.ASSOCIATION_TOP_K):
+    """Features to calculate association, constant ones and ID-like categorical ones are skipped, features with the
+    least missing values are kept if there are more than `top_k`.
+    """
+    candidates = []
+    for f in features:
+        unique_status = f.unique.status if f.unique is not None else None
+        if f.type in NUMERIC_FEATURE_TYPES:
+            if unique_status == FeatureUnique.Status.Stable:
+                continue
+        elif f.type == FeatureType.Categorical:
+            if unique_status in [FeatureUnique.Status.ID_ness, FeatureUnique.Status.Stable]:
+                continue
+        else:
+            continue
+        candidates.append(f)
+    return sorted(candidates, key=lambda f: f.missing.value if f.missing is not None else 0)[:top_k]  # stable sort
+
+
+def to_numeric(series: pd.Series):
+    if 'datetime' in series.dtype.name:
+        values = series.values.astype('datetime64[ns]').astype('int64').astype('float64')
+        values[series.isnull().values] = np.nan
+        return values
+    return pd.to_numeric(series, errors='coerce').values.astype('float64')
+
+
+def to_codes(series: pd.Series, max_categories=consts.ASSOCIATION_MAX_CATEGORIES):
+    """Codes of the most frequent values, other values are one more code and missing values are -1.
+
+    Returns:
+        tuple of (codes, number of codes)
+    """
+    top_values = series.value_counts().index[:max_categories]
+    codes = pd.Categorical(series, categories=top_values).codes.astype('int64')
+    codes[(codes < 0) & series.notnull().values] = len(top_values)
+    return codes, len(top_values) + 1
+
+
+def cramers_v(x_codes, n_x, y_codes, n_y):
+    mask = (x_codes >= 0) & (y_codes >= 0)
+    table = np.bincount(x_codes[mask] * n_y + y_codes[mask], minlength=n_x * n_y).reshape(n_x, n_y).astype('float64')
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    n = table.sum()
+    k = min(table.shape) - 1
+    if n == 0 or k < 1:
+        return None
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / n
+    chi2 = ((table - expected) ** 2 / expected).sum()
+    return float(np.sqrt(chi2 / n / k))
+
+
+def correlation_ratio(codes, n_codes, values):
+    mask = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[mask], values[mask]
+    if values.shape[0] == 0:
+        return None
+    counts = np.bincount(codes, minlength=n_codes)
+    sums = np.bincount(codes, weights=values, minlength=n_codes)
+    mean = values.mean()
+    ss_total = ((values - mean) ** 2).sum()
+    if ss_total == 0:
+        return None
+    ss_between = (sums[counts > 0] ** 2 / counts[counts > 0]).sum() - values.shape[0] * mean ** 2
+    return float(np.sqrt(min(max(ss_between / ss_total, 0), 1)))
+
+
+def association_matrix(df: pd.DataFrame, features, top_k=consts.ASSOCIATION_TOP_K) -> AssociationMatrix:
+    """
+    Args:
+        df: sample of the dataset.
+        features: analyzed features of the dataset.
+        top_k: max features in the matrix.
+    Returns:
+        AssociationMatrix, None if no feature to calculate.
+    """
+    selected = [f for f in select_features(features, top_k) if f.name in df.columns]
+    if len(selected) == 0:
+        return None
+    columns = [f.name for f in selected]
+    numeric_cols = [f.name for f in selected if f.type in NUMERIC_FEATURE_TYPES]
+    categorical_cols = [f.name for f in selected if f.type == FeatureType.Categorical]
+
+    numeric = {c: to_numeric(df[c]) for c in numeric_cols}
+    codes = {c: to_codes(df[c]) for c in categorical_cols}
+
+    # 1. pearson of all numeric pairs at once
+    pearson = pd.DataFrame(numeric, columns=numeric_cols).corr(method='pearson')
+
+    def association(c1, c2):
+        if c1 in numeric and c2 in numeric:
+            value = pearson.at[c1, c2]
+            return None if np.isnan(value) else float(value)
+        elif c1 in codes and c2 in codes:
+            return cramers_v(*codes[c1], *codes[c2])
+        elif c1 in codes:
+            return correlation_ratio(*codes[c1], numeric[c2])
+        else:
+            return correlation_ratio(*codes[c2], numeric[c1])
+
+    # 2. the matrix is symmetric
+    n = len(columns)
+    values = [[None] * n for _ in range(n)]
+    for i in range(n):
+        values[i][i] = 1.0
+        for j in range(i + 1, n):
+            values[i][j] = values[j][i] = association(columns[i], columns[j])
+    return AssociationMatrix(columns=columns, values=values)
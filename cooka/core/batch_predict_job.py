@@ -7,7 +7,9 @@ from cooka.common.log import log_core as logger
 from cooka.common import client
 from cooka.common import consts
 
-from cooka.common.model import AnalyzeStep, JobStep, PredictStepType, Model, Feature, ModelFeature, FrameworkType
+from cooka.common.model import AnalyzeStep, JobStep, PredictStepType, Model, Feature, ModelFeature, FrameworkType, \
+    DatasetStats
+from cooka.core.sniffer import CsvSniffer
 import pandas as pd
 from deeptables.models import DeepTable
 from os import path as P
@@ -26,7 +28,7 @@ parser.add_argument("--server_portal", help="server_portal", default=None, requi
 args_namespace = parser.parse_args()
 
 input_file_path = args_namespace.input_file_path
-reserved_cols = args_namespace.reserved_cols
+reserved_cols = args_namespace.reserved_cols.split(",") if args_namespace.reserved_cols else []
 model_name = args_namespace.model_name
 dataset_name = args_namespace.dataset_name
 job_name = args_namespace.job_name
@@ -53,8 +55,23 @@ try:
     # May has no header
     if default_headers is not None:
         default_headers = default_headers.split(",")
-    df = util.read_csv(input_file_path, has_header, default_headers)
-    df_origin = df.copy()
+    read_spec = CsvSniffer().sniff(input_file_path)
+    input_cols = list(read_spec.dtypes.keys()) if has_header else default_headers
+
+    # read only inputs of the model and reserved cols, missing inputs are reported by cast
+    model_dict = client.retrieve_model(portal=server_portal, dataset_name=dataset_name, model_name=model_name)
+    features = model_dict['inputs']
+    required_cols = set([f['name'] for f in features] + reserved_cols)
+    usecols = [c for c in input_cols if c in required_cols]
+
+    # values of the input may be out of range of the dataset, so numbers are not downcast
+    dataset_stats = DatasetStats.load_dict(client.retrieve_dataset(server_portal, dataset_name))
+    dtypes = {k: v for k, v in dataset_util.compact_dtypes(dataset_stats.features, exact_range=False).items()
+              if k in usecols}
+    df = util.read_csv(input_file_path, has_header, default_headers, usecols=usecols, **read_spec.read_kwargs(),
+                       **dataset_util.compact_read_kwargs(dtypes))
+    # keep origin values of reserved cols, inputs are cast in place
+    df_reserved = df[reserved_cols].copy() if len(reserved_cols) > 0 else None
 
     load_extension = {
         "n_cols": df.shape[0],
@@ -81,9 +98,6 @@ t_load_model_start = time.time()
 load_model_status = JobStep.Status.Succeed
 load_model_extension = None
 try:
-    model_dict = client.retrieve_model(portal=server_portal, dataset_name=dataset_name, model_name=model_name)
-    features = model_dict['inputs']
-
     logger.info("Before cast type: ")
     logger.info(df.dtypes)
     X = dataset_util.cast_df(df, features, remove_unnecessary_cols=True)
@@ -149,9 +163,8 @@ write_result_extension = {}
 t_write_result_start = time.time()
 write_result_status = AnalyzeStep.Status.Succeed
 try:
-    df = X  # remained cols
-    if reserved_cols is not None and len(reserved_cols) > 0:
-        result_df = df_origin[reserved_cols]
+    if df_reserved is not None:
+        result_df = df_reserved
         result_df[BATCH_PREDICTION_COL] = y_pred
     else:
         result_df = pd.DataFrame(data={BATCH_PREDICTION_COL: y_pred})
@@ -0,0 +1,203 @@
+# -*- encoding: utf-8 -*-
+"""
+Analyze columns of a wide DataFrame in a process pool. Columns of the same numpy data type are put into one 2-D array
+in shared memory, tz-aware datetime columns are shared as UTC values, so only the layout of blocks is sent to the
+workers. Missing values and moments of a group of columns are computed by one vectorised call per block.
+
+Other columns, mostly strings, are counted by `pd.factorize` in the parent process meanwhile, which is the hashing pass
+their statistics need, so their distinct values are never pickled.
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from cooka.common import consts
+from cooka.core.accumulator import ColumnAccumulator
+from cooka.core.instrument import timed
+
+KIND_VALUES = 'values'
+KIND_DATETIME_TZ = 'datetime_tz'  # UTC values of a tz-aware datetime column
+
+
+def _is_shareable(dtype):
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biufM'
+
+
+def _shared_values(series: pd.Series):
+    """Values to share of a column, its kind and time zone, None if it can not be shared. """
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        return series.dt.tz_convert('UTC').dt.tz_localize(None).values, KIND_DATETIME_TZ, series.dtype.tz
+    elif _is_shareable(series.dtype):
+        return series.values, KIND_VALUES, None
+    else:
+        return None
+
+
+class SharedBlock(object):
+    """A 2-D array in shared memory, every row is a column of the DataFrame. """
+
+    def __init__(self, shm: shared_memory.SharedMemory, dtype, shape):
+        self.shm = shm
+        self.dtype = dtype
+        self.shape = shape
+
+    @staticmethod
+    def create(arrays, dtype):
+        shape = (len(arrays), arrays[0].shape[0])
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+        block = SharedBlock(shm, np.dtype(dtype).str, shape)
+        view = block.view()
+        for i, a in enumerate(arrays):
+            view[i] = a
+        return block
+
+    def view(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "dtype": self.dtype, "shape": self.shape}
+
+    def __setstate__(self, state):
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.dtype = state['dtype']
+        self.shape = state['shape']
+
+
+def to_shared_blocks(df: pd.DataFrame):
+    """Put columns of numpy or tz-aware datetime types into shared blocks.
+
+    Returns:
+        tuple of (blocks, specs), spec of a column is (name, kind, block index, row in block, time zone)
+    """
+    arrays_by_dtype = {}
+    specs = []
+    for name in df.columns:
+        shared = _shared_values(df[name])
+        if shared is None:
+            continue
+        values, kind, tz = shared
+        arrays = arrays_by_dtype.setdefault(values.dtype.str, [])
+        arrays.append(values)
+        specs.append((name, kind, values.dtype.str, len(arrays) - 1, tz))
+
+    blocks = []
+    block_index = {}
+    for dtype, arrays in arrays_by_dtype.items():
+        block_index[dtype] = len(blocks)
+        blocks.append(SharedBlock.create(arrays, dtype))
+    return blocks, [(name, kind, block_index[dtype], row, tz) for name, kind, dtype, row, tz in specs]
+
+
+def batch_statistics(values: np.ndarray):
+    """Missing values and moments of every row of a 2-D array.
+
+    Returns:
+        tuple of (missing, moments), moments of a row is (count, mean, m2, min, max) of non-null values, moments are
+        None if values are not numbers.
+    """
+    if values.dtype.kind == 'M':
+        return np.isnat(values).sum(axis=1), None
+    elif values.dtype.kind not in 'iuf':
+        return np.zeros(values.shape[0], dtype='int64'), None
+
+    values = values.astype('float64')
+    is_nan = np.isnan(values)
+    missing = is_nan.sum(axis=1)
+    count = values.shape[1] - missing
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(is_nan, 0, values).sum(axis=1) / count
+        m2 = (np.where(is_nan, 0, values - mean[:, np.newaxis]) ** 2).sum(axis=1)
+    _min = np.where(is_nan, np.inf, values).min(axis=1)
+    _max = np.where(is_nan, -np.inf, values).max(axis=1)
+    moments = [(int(count[i]), mean[i], float(m2[i]), _min[i], _max[i]) for i in range(values.shape[0])]
+    return missing, moments
+
+
+def _analyze_columns(blocks, specs, approx_distinct, hll_precision, bins_strategy):
+    views = [b.view() for b in blocks]
+
+    # cheap statistics of columns in the group by one vectorised call per block
+    rows_by_block = {}
+    for name, kind, block_index, row, tz in specs:
+        rows_by_block.setdefault(block_index, []).append(row)
+    statistics = {}
+    for block_index, rows in rows_by_block.items():
+        missing, moments = batch_statistics(views[block_index][rows])
+        for i, row in enumerate(rows):
+            statistics[(block_index, row)] = (int(missing[i]), moments[i] if moments is not None else None)
+
+    features = []
+    for name, kind, block_index, row, tz in specs:
+        series = pd.Series(views[block_index][row], name=name, copy=False)
+        if kind == KIND_DATETIME_TZ:
+            series = series.dt.tz_localize('UTC').dt.tz_convert(tz)
+        n_missing, moments = statistics[(block_index, row)]
+        accumulator = ColumnAccumulator(name, approx_distinct, hll_precision)
+        feature = accumulator.update(series, missing=n_missing, moments=moments).to_feature(bins_strategy)
+        features.append((feature, accumulator.timings))
+
+    for b in blocks:
+        b.shm.close()
+    return features
+
+
+def _analyze_columns_task(task):
+    return _analyze_columns(*task)
+
+
+def analyze_counted_column(series: pd.Series, approx_distinct=False, hll_precision=consts.HLL_PRECISION,
+                           bins_strategy=consts.BINS_STRATEGY):
+    """Feature of a column can not be shared, its values are counted by factorize. """
+    accumulator = ColumnAccumulator(series.name, approx_distinct, hll_precision)
+    with timed(accumulator.timings, 'heavy_hitters'):
+        codes, uniques = pd.factorize(series)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        value_counts = pd.Series(counts, index=uniques, dtype='int64').sort_values(ascending=False)
+    accumulator.update_counts(value_counts, series.shape[0], series.dtype.name)
+    return accumulator.to_feature(bins_strategy), accumulator.timings
+
+
+def analyze_columns(df: pd.DataFrame, approx_distinct=False, hll_precision=consts.HLL_PRECISION,
+                    n_workers=consts.ANALYZE_N_WORKERS, bins_strategy=consts.BINS_STRATEGY, timings=None,
+                    progress=None):
+    """Features of all columns in the order of the DataFrame, columns are split into groups for workers.
+
+    Args:
+        timings: dict to put seconds of statistics by column name.
+        progress: `ProgressReporter` to report columns done.
+    """
+    blocks, specs = to_shared_blocks(df)
+    try:
+        results = {}
+
+        def put_result(feature, feature_timings):
+            results[feature.name] = feature
+            if timings is not None:
+                timings[feature.name] = feature_timings
+            if progress is not None:
+                progress.report(n_cols_done=len(results))
+
+        n_groups = min(n_workers * 4, len(specs))  # more groups than workers to balance the load
+        groups = [specs[i * len(specs) // n_groups: (i + 1) * len(specs) // n_groups] for i in range(n_groups)]
+        tasks = [(blocks, group, approx_distinct, hll_precision, bins_strategy) for group in groups]
+        with multiprocessing.Pool(max(min(n_workers, n_groups), 1)) as pool:
+            shared_results = pool.imap(_analyze_columns_task, tasks)
+            # count other columns while workers are analyzing the shared ones
+            shared_names = set(spec[0] for spec in specs)
+            for name in df.columns:
+                if name not in shared_names:
+                    put_result(*analyze_counted_column(df[name], approx_distinct, hll_precision, bins_strategy))
+            for group_results in shared_results:
+                for feature, feature_timings in group_results:
+                    put_result(feature, feature_timings)
+        features = [results[name] for name in df.columns]
+        if timings is not None:
+            timings_in_order = {name: timings.pop(name) for name in df.columns}
+            timings.update(timings_in_order)
+        return features
+    finally:
+        for b in blocks:
+            b.shm.close()
+            b.shm.unlink()
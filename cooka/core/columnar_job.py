@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+"""
+Write the row index and the typed columnar copy of a dataset once it's created, preview seeks pages by the row index and
+later jobs read the columnar copy instead of parsing csv.
+"""
+import time
+import argparse
+
+from cooka.common import util, columnar, row_index
+from cooka.common.model import DatasetStats
+from cooka.common.log import log_core as logger
+from cooka.common import client
+
+# 1. parse params
+parser = argparse.ArgumentParser(description='Write columnar file of dataset.', add_help=True)
+parser.add_argument("--dataset_name", help="dataset_name", default=None, required=True)
+parser.add_argument("--server_portal", help="server_portal", default="http://localhost:8000", required=False)
+
+args_namespace = parser.parse_args()
+
+dataset_name = args_namespace.dataset_name
+server_portal = args_namespace.server_portal
+
+print("===========Write Columnar File Config==========")
+print(f"dataset_name: {dataset_name}")
+print(f"server_portal: {server_portal}")
+print("===============================================")
+
+t = time.time()
+
+# 2. retrieve dataset info
+dataset_detail = client.retrieve_dataset(server_portal, dataset_name)
+dataset_stats = DatasetStats.load_dict(dataset_detail)
+
+file_path = util.abs_path(dataset_stats.file_path)
+
+# 3. write row index, it's fast and makes preview of large file usable before columnar file is ready
+if row_index.is_indexable(dataset_stats.read_spec):
+    row_index_path = row_index.build_row_index(file_path, dataset_stats.has_header)
+    logger.info(f"Write row index {row_index_path} of dataset {dataset_name} finished, took {util.time_diff(time.time(), t)}s.")
+else:
+    logger.info(f"Dataset {dataset_name} may have line breaks in values, skip writing row index.")
+
+# 4. write columnar file
+t = time.time()
+columnar_file_path = columnar.write_columnar(file_path, dataset_detail['features'], dataset_stats.has_header,
+                                             **dataset_stats.read_kwargs())
+logger.info(f"Write columnar file {columnar_file_path} of dataset {dataset_name} finished, took {util.time_diff(time.time(), t)}s.")
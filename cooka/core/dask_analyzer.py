@@ -1,80 +1,79 @@
 # -*- encoding: utf-8 -*-
-# import os
-#
-# from cooka.common import util
-# from cooka.common.serializer import ListBeanField, Bean
-# from cooka import settings
-# import pandas as pd
-# from cooka.common.log import log_core as logger
-# from cooka.common.model import Feature, FeatureTypeStats, DatasetStats, ContinuousFeatureBin, ContinuousFeatureExtension, CategoricalFeatureValueCount, \
-#     CategoricalFeatureExtension, DatetimeFeatureExtension, YearValueCount, FeatureType, FeatureMode
-# from sklearn.compose import make_column_selector
-#
-
-# class DaskAnalyzer(Analyzer):
-#
-#     def __init__(self, path, label_col):
-#
-#         if not os.path.exists(path):
-#             raise FileExistsError("File not found: %s" % path)
-#
-#         self.file_path = path
-#         self.df = dd.read_csv(path, blocksize=consts.DASK_BLOCK_SIZE * 1024 * 1024)[:1000]  # break text into 64MB chunks todo 1000 for dev
-#         self.file_size = os.path.getsize(path)
-#         self.label_col = label_col
-#
-#     def analyze_col(self, col_name, missing):
-#         # attrs = ('name', 'type', 'missing', 'unique', 'relevance')
-#         # self.df[col_name]
-#         unique = int(self.df[col_name].value_counts().count().compute())
-#         type_name = self.df.dtypes[col_name].name
-#
-#         # del missing label
-#         # label encoder label
-#         # calc relevance
-#         # not for text
-#         relevance = 0.1 # todo self.df[col_name].corr(other=self.df[self.label_col], method="pearson").compute()
-#
-#         return Feature(name=col_name,
-#                 type=self.infer_feature_type(type_name),
-#                 missing=missing,
-#                 unique=unique,
-#                 relevance=relevance)
-#
-#     def do_analyze_csv(self):
-#         df = self.df
-#         shape_row = df.shape[0]
-#         if isinstance(shape_row, int):
-#             n_rows = shape_row
-#         else:
-#             n_rows = shape_row.compute()
-#
-#
-#         n_cols = len(df.columns)
-#         logger.info(f"Dataset shape is {n_rows}, {n_cols}")
-#         missing_dict = df.isnull().sum().compute()
-#
-#         features = [self.analyze_col(col_name, int(missing_dict[col_name]), ) for col_name in df.columns]
-#
-#         feature_type_dict = pd.Series(data=[f.type for f in features], name='feature_type').value_counts().to_dict()
-#         fts = FeatureTypeStats(**feature_type_dict)
-#
-#         return DatasetStats(n_rows=n_rows, n_cols=n_cols, size=util.human_data_size(self.file_size), features=features, feature_summary=fts)
-#
-#         # df['SepalLengthCm'].value_counts().compute()
-#
-#         # X1.corr(Y1, method="pearson")
-#
-#     def infer_feature_type(self, type_name):
-#         if 'float' in type_name or 'int' in type_name:
-#             return FeatureType.Continuous
-#         elif 'datetime' in type_name :
-#             return FeatureType.Datetime
-#         else:
-#             # todo CategoricalInt
-#             # todo infer text
-#             return FeatureType.Categorical
-#
-# r = DaskAnalyzer('/Users/wuhf/Documents/datasets/iris_Missing.csv', 'Species').do_analyze_csv()
-# dr = DatasetStatsSerializer(r)
-# print(json_util.dumps(dr.data))
\ No newline at end of file
+import math
+import os
+
+from cooka.common import consts, util
+from cooka.common.log import log_core as logger
+from cooka.common.model import CsvReadSpec
+from cooka.core.analyzer import StreamingAnalyzer, _accumulate_range
+
+try:
+    import dask
+except ImportError:
+    dask = None
+
+
+def is_dask_available():
+    return dask is not None
+
+
+def _merge_accumulators(left, right):
+    return left.merge(right)
+
+
+class DaskAnalyzer(StreamingAnalyzer):
+    """Out-of-core analysis of the whole data by dask, the file is split into newline-aligned blocks of `blocksize` MB,
+    every block is accumulated as a dask task and partial results are merged by a tree reduction, so only blocks in
+    progress are in memory.
+
+    Blocks are parsed the same way as `ParallelAnalyzer` instead of `dd.read_csv`, which requires data types of all
+    blocks match the inferred ones from the head of file. The file is not split if values may contain line breaks, and
+    it is read again in one pass if a block turns out to start in a quoted value.
+
+    Args:
+        scheduler: dask scheduler, "threads", "processes" or "synchronous".
+        blocksize: MB of a block.
+        n_workers: number of threads or processes.
+
+    Rows scanned are reported to the progress callback after all blocks are merged.
+    """
+
+    def __init__(self, file_path: str, label_col: str, scheduler=consts.DASK_SCHEDULER, blocksize=consts.DASK_BLOCK_SIZE,
+                 n_workers=consts.ANALYZE_N_WORKERS, quoted=False, chunksize=consts.READ_CHUNK_SIZE,
+                 approx_distinct=False, hll_precision=consts.HLL_PRECISION, read_spec: CsvReadSpec = None,
+                 progress_callback=None):
+        if dask is None:
+            raise ImportError("Package dask is required by DaskAnalyzer, install it by 'pip install dask'.")
+        self.scheduler = scheduler
+        self.blocksize = blocksize
+        self.n_workers = n_workers
+        self.quoted = quoted
+        super(DaskAnalyzer, self).__init__(file_path, label_col, chunksize, approx_distinct, hll_precision, read_spec,
+                                           progress_callback)
+
+    def accumulate(self):
+        if self.quoted or self.read_spec.quoted:
+            return super(DaskAnalyzer, self).accumulate()
+
+        # 1. columns are named by the sniffer
+        columns = list(self.read_spec.dtypes.keys())
+
+        # 2. a task for every block
+        n_blocks = max(math.ceil(os.path.getsize(self.file_path) / (self.blocksize * 1024 * 1024)), 1)
+        ranges = util.split_byte_ranges(self.file_path, n_blocks, skip_first_line=self.is_has_header)
+        logger.info(f"Analyze {len(ranges)} blocks of file {self.file_path} by dask {self.scheduler} scheduler.")
+        partials = [dask.delayed(_accumulate_range)(self.file_path, start, end, columns, self.chunksize,
+                                                    self.approx_distinct, self.hll_precision,
+                                                    self.read_spec.read_kwargs())
+                    for start, end in ranges]
+
+        # 3. merge neighbours pair by pair to keep the order of rows
+        while len(partials) > 1:
+            partials = [dask.delayed(_merge_accumulators)(partials[i], partials[i + 1]) if i + 1 < len(partials)
+                        else partials[i] for i in range(0, len(partials), 2)]
+
+        accumulation = partials[0].compute(scheduler=self.scheduler, num_workers=self.n_workers)
+        if not accumulation.is_split_right(util.count_quotes(self.file_path, 0, ranges[0][0])):
+            logger.warning(f"File {self.file_path} has line breaks in quoted values, analyze it in one pass.")
+            return super(DaskAnalyzer, self).accumulate()
+        return accumulation.accumulator
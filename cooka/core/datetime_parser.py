@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+"""
+Infer datetime columns, the format is detected from a small probe of the column then the whole column is parsed once
+with it in a vectorised way.
+"""
+import pandas as pd
+
+from cooka.common import consts
+
+DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+]
+
+# integers in these ranges can be seconds or milliseconds since epoch of 1980-01-01 ~ 2100-01-01
+EPOCH_SECONDS_RANGE = (315532800, 4102444800)
+EPOCH_MILLIS_RANGE = (EPOCH_SECONDS_RANGE[0] * 1000, EPOCH_SECONDS_RANGE[1] * 1000)
+
+INFER_TOP_N = 100
+
+
+def infer_format(series: pd.Series, formats=DATETIME_FORMATS):
+    """The first format parses top non-empty values of a string column, None if no format does. """
+    probe = series.dropna().iloc[:INFER_TOP_N]
+    if probe.shape[0] == 0 or pd.api.types.infer_dtype(probe, skipna=True) != 'string':
+        return None
+    for f in formats:
+        if pd.to_datetime(probe, format=f, errors='coerce').notnull().all():
+            return f
+    return None
+
+
+def infer_epoch_unit(series: pd.Series):
+    """'s' or 'ms' if all values of an integer column are in the range of epoch time, else None. """
+    if 'int' not in series.dtype.name or series.shape[0] == 0:
+        return None
+    _min, _max = series.min(), series.max()
+    if EPOCH_SECONDS_RANGE[0] <= _min and _max <= EPOCH_SECONDS_RANGE[1]:
+        return 's'
+    if EPOCH_MILLIS_RANGE[0] <= _min and _max <= EPOCH_MILLIS_RANGE[1]:
+        return 'ms'
+    return None
+
+
+def parse_datetime(series: pd.Series, infer_epoch=consts.INFER_EPOCH_DATETIME):
+    """Parse the column as datetime if it looks like, otherwise return it as it is.
+
+    Args:
+        series: column to parse.
+        infer_epoch: take integers in range of `EPOCH_SECONDS_RANGE` or `EPOCH_MILLIS_RANGE` as epoch time, ids may be
+            taken as datetime too so it is disabled by default.
+    """
+    if series.dtype.name == 'object':
+        f = infer_format(series)
+        if f is not None:
+            try:
+                return pd.to_datetime(series, format=f)
+            except (ValueError, OverflowError):
+                return series  # values after the probe are not in the format
+    elif infer_epoch:
+        unit = infer_epoch_unit(series)
+        if unit is not None:
+            return pd.to_datetime(series, unit=unit)
+    return series
+
+
+def parse_datetime_cols(df: pd.DataFrame, infer_epoch=consts.INFER_EPOCH_DATETIME):
+    for c in df.columns:
+        series = df[c]
+        parsed = parse_datetime(series, infer_epoch)
+        if parsed is not series:
+            df[c] = parsed
+    return df
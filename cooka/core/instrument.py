@@ -0,0 +1,83 @@
+# -*- encoding: utf-8 -*-
+"""
+Timings and progress of analysis. Every column accumulator records the seconds spent on each statistic, they are
+merged along with the statistics and summarized as the slowest columns, so slow paths on production data show up in
+the extension of analyze steps.
+"""
+import time
+from contextlib import contextmanager
+
+from cooka.common import consts
+from cooka.common.log import log_core as logger
+
+
+@contextmanager
+def timed(timings: dict, key):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[key] = timings.get(key, 0.0) + time.perf_counter() - t
+
+
+def merge_timings(timings1: dict, timings2: dict):
+    for k, v in timings2.items():
+        timings1[k] = timings1.get(k, 0.0) + v
+    return timings1
+
+
+def summarize_timings(column_timings: dict, dataset_timings: dict = None, n_slowest=consts.N_SLOWEST_COLUMNS):
+    """
+    Args:
+        column_timings: seconds of statistics by column name, like {"age": {"missing": 0.01, "moments": 0.02}}.
+        dataset_timings: seconds of statistics of the whole dataset, like {"association": 0.5}.
+        n_slowest: number of slowest columns to keep.
+    Returns:
+        dict of total seconds by statistic and the slowest columns.
+    """
+    statistics = {}
+    columns = []
+    for name, timings in column_timings.items():
+        merge_timings(statistics, timings)
+        columns.append({"name": name, "took": round(sum(timings.values()), 6),
+                        "statistics": {k: round(v, 6) for k, v in timings.items()}})
+    merge_timings(statistics, dataset_timings or {})
+    return {
+        "statistics": {k: round(v, 6) for k, v in sorted(statistics.items(), key=lambda item: -item[1])},
+        "slowest_columns": sorted(columns, key=lambda c: -c['took'])[:n_slowest]
+    }
+
+
+class ProgressReporter(object):
+    """Call back progress of analysis at most once every `interval` seconds, failures of callback are only logged.
+
+    Args:
+        callback: function accepts a dict like {"n_cols": 10, "n_cols_done": 2, "n_rows_scanned": 10000}, or None.
+        n_cols: number of columns, None if it's unknown yet.
+        interval: seconds between two callbacks.
+    """
+
+    def __init__(self, callback, n_cols=None, interval=consts.ANALYZE_PROGRESS_INTERVAL):
+        self.callback = callback
+        self.n_cols = n_cols
+        self.interval = interval
+        self.n_cols_done = 0
+        self.n_rows_scanned = 0
+        self.last_report_time = time.time()
+
+    def report(self, n_cols_done=None, n_rows_scanned=None, force=False):
+        if n_cols_done is not None:
+            self.n_cols_done = n_cols_done
+        if n_rows_scanned is not None:
+            self.n_rows_scanned = n_rows_scanned
+        if self.callback is None:
+            return
+        now = time.time()
+        if not force and now - self.last_report_time < self.interval:
+            return
+        self.last_report_time = now
+        try:
+            self.callback({"n_cols": self.n_cols, "n_cols_done": self.n_cols_done,
+                           "n_rows_scanned": self.n_rows_scanned})
+        except Exception as e:
+            logger.warning(f"Report progress of analysis failed: {e}")
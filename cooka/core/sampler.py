@@ -0,0 +1,142 @@
+# -*- encoding: utf-8 -*-
+import math
+
+import numpy as np
+import pandas as pd
+
+from cooka.common import consts, util
+from cooka.common.model import SampleConf
+
+
+class Sampler(object):
+    """Sample rows from a stream of DataFrame chunks, chunks should be fed in order by `update`. """
+
+    def __init__(self, random_state=None):
+        self.random_state = np.random.RandomState(random_state)
+        self.n_rows = 0  # rows seen
+
+    def update(self, chunk: pd.DataFrame):
+        raise NotImplementedError
+
+    def get_sample(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class ReservoirSampler(Sampler):
+    """Uniformly sample `n_rows` rows using reservoir sampling "Algorithm L".
+
+    After the reservoir is full, only the rows going to replace a reservoir slot are visited, the gap between them is
+    drawn from a geometric distribution, so a chunk costs O(replaced rows) not O(chunk rows).
+    """
+
+    def __init__(self, n_rows, random_state=None):
+        super(ReservoirSampler, self).__init__(random_state)
+        self.k = n_rows
+        self.reservoir = None
+        self.w = None
+        self.next_row = None  # global position of next row to put in reservoir
+
+    def _skip(self):
+        # log(1 - w) is negative, floor(log(u) / log(1 - w)) rows are skipped
+        return math.floor(math.log(self.random_state.random_sample()) / math.log(1 - self.w)) + 1
+
+    def _next_w(self):
+        return math.exp(math.log(self.random_state.random_sample()) / self.k)
+
+    def update(self, chunk: pd.DataFrame):
+        chunk_begin = self.n_rows
+        chunk_end = chunk_begin + chunk.shape[0]
+        self.n_rows = chunk_end
+
+        # 1. fill reservoir
+        n_filled = 0 if self.reservoir is None else self.reservoir.shape[0]
+        if n_filled < self.k:
+            n_fill = min(self.k - n_filled, chunk.shape[0])
+            fill_df = chunk.iloc[:n_fill]
+            if self.reservoir is None:
+                self.reservoir = fill_df.reset_index(drop=True)
+            else:
+                self.reservoir = pd.concat([self.reservoir, fill_df], ignore_index=True)
+            if self.reservoir.shape[0] < self.k:
+                return
+            self.w = self._next_w()
+            self.next_row = self.k - 1 + self._skip()
+
+        # 2. replace random slots, a slot replaced more than once keep the latest row
+        replacements = {}
+        while self.next_row < chunk_end:
+            slot = self.random_state.randint(self.k)
+            replacements[slot] = self.next_row - chunk_begin
+            self.w = self.w * self._next_w()
+            self.next_row = self.next_row + self._skip()
+
+        if len(replacements) > 0:
+            replaced = np.zeros(self.k, dtype=bool)
+            replaced[list(replacements.keys())] = True
+            new_rows = chunk.iloc[list(replacements.values())]
+            self.reservoir = pd.concat([self.reservoir[~replaced], new_rows], ignore_index=True)
+
+    def merge(self, other):
+        """Merge reservoir of another part of the data, rows from each part are drawn by hypergeometric distribution so
+        the result is a uniform sample of both parts. A merged sampler can not be updated anymore.
+        """
+        n_rows = self.n_rows + other.n_rows
+        k = min(self.k, n_rows)
+        n_self = self.random_state.hypergeometric(self.n_rows, other.n_rows, k) if k > 0 else 0
+
+        pieces = []
+        for reservoir, n in [(self.reservoir, n_self), (other.reservoir, k - n_self)]:
+            if reservoir is not None and n > 0:
+                pieces.append(reservoir.iloc[self.random_state.choice(reservoir.shape[0], n, replace=False)])
+        self.reservoir = pd.concat(pieces, ignore_index=True) if len(pieces) > 0 else self.reservoir
+        self.n_rows = n_rows
+        self.w = None
+        self.next_row = None
+        return self
+
+    def get_sample(self):
+        return self.reservoir
+
+
+class BernoulliSampler(Sampler):
+    """Keep every row independently with probability `percentage`%. """
+
+    def __init__(self, percentage, random_state=None):
+        super(BernoulliSampler, self).__init__(random_state)
+        self.p = percentage / 100
+        self.pieces = []
+
+    def update(self, chunk: pd.DataFrame):
+        self.n_rows = self.n_rows + chunk.shape[0]
+        mask = self.random_state.random_sample(chunk.shape[0]) < self.p
+        self.pieces.append(chunk[mask])
+
+    def get_sample(self):
+        if len(self.pieces) == 0:
+            return None
+        return pd.concat(self.pieces, ignore_index=True)
+
+
+def make_sampler(sample_conf: SampleConf, random_state=None) -> Sampler:
+    if sample_conf.sample_strategy == SampleConf.Strategy.RandomRows:
+        return ReservoirSampler(sample_conf.n_rows, random_state)
+    elif sample_conf.sample_strategy == SampleConf.Strategy.Percentage:
+        return BernoulliSampler(sample_conf.percentage, random_state)
+    else:
+        raise ValueError(f"Sample strategy {sample_conf.sample_strategy} does not need a sampler.")
+
+
+def sample_csv(file_path, sample_conf: SampleConf, chunksize=consts.READ_CHUNK_SIZE, random_state=None, **read_kwargs):
+    """Sample a csv file in one chunked pass.
+
+    Returns:
+        tuple of (sampled DataFrame, number of rows of the file)
+    """
+    sampler = make_sampler(sample_conf, random_state)
+    for chunk in util.iter_csv(file_path, chunksize=chunksize, **read_kwargs):
+        sampler.update(chunk)
+
+    sample_df = sampler.get_sample()
+    if sample_df is None:  # file has no rows
+        sample_df = pd.read_csv(file_path, nrows=0, **read_kwargs)
+    return sample_df, sampler.n_rows
@@ -0,0 +1,101 @@
+# -*- encoding: utf-8 -*-
+import codecs
+import csv
+import io
+from os import path as P
+
+import pandas as pd
+
+from cooka.common import consts, util
+from cooka.common.model import CsvReadSpec
+
+SNIFF_ENCODINGS = ['utf-8', 'gb18030']
+SNIFF_DELIMITERS = ',\t;|'
+
+
+class CsvSniffer(object):
+    """Infer how to read a csv file from its leading block, the result is a `CsvReadSpec` for all later readers.
+
+    Args:
+        block_size: bytes to read from the head of the file.
+    """
+
+    def __init__(self, block_size=consts.SNIFF_BLOCK_SIZE):
+        self.block_size = block_size
+
+    @staticmethod
+    def detect_encoding(block: bytes):
+        if block.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        for encoding in SNIFF_ENCODINGS:
+            try:
+                block.decode(encoding)
+                return encoding
+            except UnicodeDecodeError:
+                pass
+        return 'iso-8859-1'  # decodes any bytes
+
+    @staticmethod
+    def detect_delimiter(file_path, text):
+        if P.splitext(file_path)[1].lower() == '.tsv':
+            return '\t'
+        try:
+            return csv.Sniffer().sniff(text[:consts.SNIFF_DELIMITER_TEXT_SIZE], delimiters=SNIFF_DELIMITERS).delimiter
+        except csv.Error:
+            return ','
+
+    @staticmethod
+    def detect_quoted(block: bytes):
+        """Whether double-quoted values have line breaks. """
+        if b'"' not in block:
+            return False
+        counter = util.LineCounter(quoted=True)
+        counter.update(block)
+        return counter.n_lines != block.count(b'\n') + (0 if block.endswith(b'\n') else 1)
+
+    @staticmethod
+    def complete_lines(block: bytes):
+        """Head of the block ends with the last line break out of double quotes. """
+        parts = block.split(b'"')
+        pos = len(block)
+        for i in reversed(range(len(parts))):
+            pos = pos - len(parts[i])
+            if i % 2 == 0:
+                j = parts[i].rfind(b'\n')
+                if j >= 0:
+                    return block[: pos + j + 1]
+            pos = pos - 1
+        return block
+
+    @staticmethod
+    def infer_has_header(df_no_header: pd.DataFrame):
+        for col in df_no_header.dtypes.to_dict():
+            type_name = df_no_header.dtypes[col].name
+            # only this case
+            if 'float' in type_name or 'int' in type_name or 'datetime' in type_name or 'timestamp' in type_name:
+                return False
+        return True
+
+    def sniff(self, file_path) -> CsvReadSpec:
+        with open(file_path, 'rb') as f:
+            block = f.read(self.block_size)
+            if len(block) == self.block_size and f.read(1) != b'':
+                block = self.complete_lines(block)  # drop the incomplete last line
+        return self.sniff_block(file_path, block)
+
+    def sniff_block(self, file_path, block: bytes) -> CsvReadSpec:
+        """Infer from the head block of a file, the block should end with a complete line. """
+        encoding = self.detect_encoding(block)
+        text = block.decode(encoding)
+        delimiter = self.detect_delimiter(file_path, text)
+        quoted = self.detect_quoted(block)
+
+        df_no_header = pd.read_csv(io.StringIO(text), sep=delimiter, header=None, nrows=100)
+        has_header = self.infer_has_header(df_no_header)
+
+        df = pd.read_csv(io.StringIO(text), sep=delimiter, header='infer' if has_header else None)
+        if not has_header:
+            df.columns = ["c%s" % c for c in df.columns]
+        dtypes = {str(k): v.name for k, v in df.dtypes.items()}
+
+        return CsvReadSpec(has_header=has_header, delimiter=delimiter, encoding=encoding, quoted=quoted, dtypes=dtypes)
@@ -0,0 +1,175 @@
+# -*- encoding: utf-8 -*-
+"""
+Statistics of an uploaded file computed from the chunks while they are written: content hash, number of lines, the
+read spec sniffed from the head and a uniform sample of rows. They are kept in sidecar files next to the uploaded file,
+so analyze job knows number of rows and samples rows from the sample file instead of reading the whole file.
+"""
+import os
+from os import path as P
+
+import numpy as np
+import pandas as pd
+
+from cooka.common import consts, util
+from cooka.common.model import UploadStats
+from cooka.core.sniffer import CsvSniffer
+
+UPLOAD_STATS_SUFFIX = '.stats.json'
+UPLOAD_SAMPLE_SUFFIX = '.sample'
+LINE_BREAK = ord('\n')
+
+
+def stats_path(file_path):
+    return file_path + UPLOAD_STATS_SUFFIX
+
+
+def sample_path(file_path):
+    return file_path + UPLOAD_SAMPLE_SUFFIX
+
+
+class UploadStatsAccumulator(object):
+    """Feed bytes of the file in order by `update`, and write the sidecar files by `finish`.
+
+    Rows are sampled from lines by reservoir sampling, it's skipped if the sniffer finds line breaks in quoted values.
+    The reservoir is kept in the web server, once its lines take more than `sample_max_bytes` a random half of them is
+    dropped and the reservoir keeps the smaller size, a random subset of a uniform sample is still uniform.
+
+    Args:
+        file_path: path of the uploaded file.
+        sample_rows: max rows to sample.
+        sample_max_bytes: max bytes of lines sampled.
+    """
+
+    def __init__(self, file_path, sample_rows=consts.UPLOAD_SAMPLE_ROWS,
+                 sample_max_bytes=consts.UPLOAD_SAMPLE_MAX_BYTES, random_state=None):
+        self.file_path = file_path
+        self.sample_rows = sample_rows
+        self.sample_max_bytes = sample_max_bytes
+        self.random_state = np.random.RandomState(random_state)
+        self.file_size = 0
+        self.head = b""  # kept until it's enough to sniff
+        self.read_spec = None
+        self.counter = None
+        self.partial_line = b""
+        self.header_line = None
+        self.n_lines_sampled = 0  # lines seen by the sampler
+        self.reservoir = []
+        self.reservoir_bytes = 0
+
+    def update(self, data: bytes):
+        self.file_size = self.file_size + len(data)
+        if self.read_spec is None:
+            self.head = self.head + data
+            if len(self.head) > consts.SNIFF_BLOCK_SIZE:
+                self._sniff(CsvSniffer.complete_lines(self.head[:consts.SNIFF_BLOCK_SIZE]))
+        else:
+            self._update(data)
+
+    def _sniff(self, block):
+        head = self.head
+        self.head = None
+        self.read_spec = CsvSniffer().sniff_block(self.file_path, block)
+        self.counter = util.LineCounter(quoted=self.read_spec.quoted)
+        self._update(head)
+
+    def _update(self, data):
+        self.counter.update(data)
+        if not self.read_spec.quoted:
+            self._sample_lines(data)
+
+    def _sample_lines(self, data):
+        data = self.partial_line + data
+        breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == LINE_BREAK)
+        if breaks.shape[0] == 0:
+            self.partial_line = data
+            return
+        self.partial_line = data[breaks[-1] + 1:]
+        ends = breaks + 1
+        starts = np.concatenate([[0], ends[:-1]])
+        if self.read_spec.has_header and self.header_line is None:
+            self.header_line = data[: ends[0]]
+            starts, ends = starts[1:], ends[1:]
+
+        # algorithm R: the i-th line replaces a random slot in [0, i] if the slot is in the reservoir
+        indices = self.n_lines_sampled + np.arange(starts.shape[0])
+        slots = np.where(indices < self.sample_rows, indices,
+                         np.floor(self.random_state.random_sample(indices.shape[0]) * (indices + 1)).astype('int64'))
+        for j in np.flatnonzero(slots < self.sample_rows):
+            line = data[starts[j]: ends[j]]
+            if slots[j] == len(self.reservoir):
+                self.reservoir.append(line)
+            else:
+                self.reservoir_bytes = self.reservoir_bytes - len(self.reservoir[slots[j]])
+                self.reservoir[slots[j]] = line
+            self.reservoir_bytes = self.reservoir_bytes + len(line)
+        self.n_lines_sampled = self.n_lines_sampled + starts.shape[0]
+
+        while self.reservoir_bytes > self.sample_max_bytes and len(self.reservoir) > 1:
+            self._shrink_reservoir(len(self.reservoir) // 2)
+
+    def _shrink_reservoir(self, n):
+        kept = np.sort(self.random_state.choice(len(self.reservoir), n, replace=False))
+        self.reservoir = [self.reservoir[i] for i in kept]
+        self.reservoir_bytes = sum(len(line) for line in self.reservoir)
+        self.sample_rows = n
+
+    def finish(self, content_hash=None):
+        """Write sidecar files, returns `UploadStats`.
+
+        Args:
+            content_hash: md5 of the file, the writer usually computes it already.
+        """
+        if self.read_spec is None:
+            self._sniff(self.head)  # the whole file is smaller than the sniff block
+        if not self.read_spec.quoted and len(self.partial_line) > 0:
+            self._sample_lines(b"\n")  # the last line has no line break
+
+        n_lines = self.counter.n_lines
+        n_rows = n_lines - 1 if self.read_spec.has_header and n_lines > 0 else n_lines
+        n_sample_rows = 0
+        if not self.read_spec.quoted:
+            with open(sample_path(self.file_path), 'wb') as f:
+                if self.header_line is not None:
+                    f.write(self.header_line)
+                for line in self.reservoir:
+                    f.write(line)
+            n_sample_rows = len(self.reservoir)
+
+        stats = UploadStats(file_size=self.file_size, content_hash=content_hash, n_rows=n_rows,
+                            n_sample_rows=n_sample_rows, read_spec=self.read_spec)
+        tmp_path = f"{stats_path(self.file_path)}.{util.short_uuid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(util.dumps(stats.to_dict()))
+        os.replace(tmp_path, stats_path(self.file_path))
+        return stats
+
+
+def read_stats(file_path):
+    """Statistics of the uploaded file, None if it's not uploaded or changed after uploaded. """
+    path = stats_path(file_path)
+    if not P.exists(path) or P.getmtime(path) < P.getmtime(file_path):
+        return None
+    with open(path, 'r') as f:
+        stats = UploadStats.load_dict(util.loads(f.read()))
+    if stats.file_size != P.getsize(file_path):
+        return None
+    return stats
+
+
+def read_sample(file_path, n, random_state=None, **read_kwargs):
+    """Sample `n` rows from the sample file, rows of a uniform sample are also a uniform sample.
+
+    Args:
+        read_kwargs: params of `pd.read_csv`.
+    """
+    df = pd.read_csv(sample_path(file_path), **read_kwargs)
+    if df.shape[0] > n:
+        df = df.sample(n, random_state=random_state).reset_index(drop=True)
+    return df
+
+
+def remove_sidecars(file_path):
+    """Remove the content hash, statistics and sample files next to the uploaded file once they are not used. """
+    for path in [file_path + util.CONTENT_HASH_SUFFIX, stats_path(file_path), sample_path(file_path)]:
+        if P.exists(path):
+            os.remove(path)
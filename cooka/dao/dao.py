@@ -97,6 +97,13 @@ class DatasetDao(BaseDao):
         list_result = session.query(DatasetEntity).filter(DatasetEntity.name == dataset_name).all()
         return self.checkout_one(list_result)
 
+    def find_by_temporary_name(self, session, temporary_dataset_name) -> DatasetEntity:
+        """Dataset created from the temporary dataset, the name of temporary dataset is kept in extension. """
+        for d in session.query(DatasetEntity).filter(DatasetEntity.is_temporary == False).all():
+            if (d.extension or {}).get('temporary_dataset_name') == temporary_dataset_name:
+                return d
+        return None
+
     def pagination(self, session, page_num, page_size, query_key, order_by, order):
         # !! is False can not use
         query = session.query(DatasetEntity).filter(DatasetEntity.is_temporary == False).filter(DatasetEntity.status == DatasetEntity.Status.Analyzed)
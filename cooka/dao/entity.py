@@ -2,7 +2,8 @@
 
 from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Boolean, JSON
 
-from cooka.common.model import Model, Performance, TrainTrial, DatasetStats, Feature
+from cooka.common.model import Model, Performance, TrainTrial, DatasetStats, Feature, CsvReadSpec, SampleConf, \
+    AssociationMatrix
 from cooka.dao.db import Base
 from cooka.common.model import ModelFeature
 from deeptables.models.deepmodel import IgnoreCaseDict
@@ -62,7 +63,10 @@ class DatasetEntity(Base):
                          n_cols=self.n_cols,
                          features=Feature.load_dict_list(self.features),
                          feature_summary=self.feature_summary,
-                         create_datetime=self.create_datetime)
+                         create_datetime=self.create_datetime,
+                         read_spec=CsvReadSpec.load_dict((self.extension or {}).get('read_spec')),
+                         sample_conf=SampleConf.load_dict((self.extension or {}).get('sample_conf')),
+                         association=AssociationMatrix.load_dict((self.extension or {}).get('association')))
 
 
 class ExperimentEntity(Base):
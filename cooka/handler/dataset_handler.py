@@ -222,7 +222,8 @@ class DatasetAnalyzeProcessHandler(BaseHandler):
             {
                 "analyze_job_name": analyze_job_name,
                 "temporary_dataset_name": dataset_name,
-                "steps": messages_dict_list
+                "steps": messages_dict_list,
+                "progress": self.dataset_service.get_analyze_progress(dataset_name)
             }
         self.response_json(response)
 
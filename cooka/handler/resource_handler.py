@@ -1,17 +1,19 @@
 # -*- encoding: utf-8 -*-
 from cooka.common import util
 from cooka.common.exceptions import MissingParamException
+from cooka.common.multipart import MultipartParser, parse_boundary
 from cooka.common.log import log_web as logger
+from cooka.core.upload_stats import UploadStatsAccumulator
 
 from cooka.handler.base_handler import BaseHandler
 from tornado import gen
 from os import path as P
 from cooka.common import consts
 import tornado.web
+import hashlib
 import os
 import time
 from tornado.web import StaticFileHandler
-from tornado import httputil
 
 
 class AbstractTextResourceHandler(BaseHandler):
@@ -67,37 +69,25 @@ class TextResourceHeadHandler(AbstractTextResourceHandler):
                     break
 
 
-def handle_tornado_upload_file(http_handler, tornado_http_files, upload_start_time):
-    # 1. check and read param
-    tornado_http_file = tornado_http_files.get("file")[0]
-
-    if tornado_http_file is None:
-        raise MissingParamException("file")
-
-    file_name = tornado_http_file['filename']
-    file_body = tornado_http_file['body']
-    file_size = util.human_data_size(len(file_body))
+def make_upload_file_path(file_name):
     file_suffix = util.get_file_suffix(file_name)
 
     assert file_suffix in ['.csv', '.tsv'], 'Please check is your file suffix in [.csv, .tsv], current is: %s' % file_suffix
 
     origin_file_name = util.make_dataset_name(util.cut_suffix(file_name)) + file_suffix  # for it in url, disk path readable
 
-    # 2. open temporary file and  write to local file
     temporary_file_path = util.temporary_upload_file_path(origin_file_name)
 
     if not P.exists(P.dirname(temporary_file_path)):
         os.makedirs(P.dirname(temporary_file_path))
 
     logger.info(f"Open path {temporary_file_path} to store upload file.")
+    return temporary_file_path
 
-    with open(temporary_file_path, 'wb') as f:
-        f.write(file_body)
-    logger.info(f"Uploaded file finished at {temporary_file_path}, file size {file_size} .")
 
+def response_upload_file(http_handler, temporary_file_path, file_size, upload_start_time):
     upload_took = util.time_diff(time.time(), upload_start_time)
 
-    # 3. response
     # relative_path = temporary_file_path[len(consts.PATH_DATA_ROOT)+1:]  # relative path not start with /
     response = \
         {
@@ -108,6 +98,70 @@ def handle_tornado_upload_file(http_handler, tornado_http_files, upload_start_ti
     http_handler.response_json(response)
 
 
+def handle_tornado_upload_file(http_handler, tornado_http_files, upload_start_time):
+    # 1. check and read param
+    tornado_http_file = tornado_http_files.get("file")[0]
+
+    if tornado_http_file is None:
+        raise MissingParamException("file")
+
+    file_name = tornado_http_file['filename']
+    file_body = tornado_http_file['body']
+    file_size = util.human_data_size(len(file_body))
+
+    # 2. open temporary file and  write to local file
+    temporary_file_path = make_upload_file_path(file_name)
+
+    with open(temporary_file_path, 'wb') as f:
+        f.write(file_body)
+    util.write_content_hash(temporary_file_path, hashlib.md5(file_body).hexdigest())
+    logger.info(f"Uploaded file finished at {temporary_file_path}, file size {file_size} .")
+
+    # 3. response
+    response_upload_file(http_handler, temporary_file_path, file_size, upload_start_time)
+
+
+class UploadFileSink(object):
+    """Write data of the file part to the upload path, content hash and upload statistics are computed meanwhile.
+
+    The parser closes the sink at the end of the file part, content hash and statistics are written by `finish` only
+    after the whole body is parsed, so a truncated upload leaves no sidecar files.
+    """
+
+    def __init__(self, file_name):
+        self.file_path = make_upload_file_path(file_name)
+        self.file = open(self.file_path, 'wb')
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self.stats = UploadStatsAccumulator(self.file_path)
+
+    def write(self, data):
+        self.file.write(data)
+        self.md5.update(data)
+        self.size = self.size + len(data)
+        if self.stats is not None:
+            try:
+                self.stats.update(data)
+            except Exception as e:
+                logger.warning(f"Compute upload statistics of {self.file_path} failed, analyze job reads the file: {e}")
+                self.stats = None
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def finish(self):
+        self.close()
+        content_hash = self.md5.hexdigest()
+        util.write_content_hash(self.file_path, content_hash)
+        if self.stats is not None:
+            try:
+                self.stats.finish(content_hash)
+            except Exception as e:
+                logger.warning(f"Write upload statistics of {self.file_path} failed: {e}")
+            self.stats = None  # release the reservoir
+
+
 class ResourceHandler(BaseHandler):
     def prepare(self):
         self.t1 = time.time()
@@ -120,43 +174,49 @@ class ResourceHandler(BaseHandler):
 @tornado.web.stream_request_body
 class StreamResourceHandler(BaseHandler):
 
-    def prepare(self):
-        # open temporary file
-        self.temporary_file_path = util.temporary_upload_file_path('upload_chunk')
-        if not P.exists(P.dirname(self.temporary_file_path)):
-            os.makedirs(P.dirname(self.temporary_file_path))
+    """Parse the multipart body while chunks arrive and write the file part to the upload path directly. """
 
-        self.temporary_file = open(self.temporary_file_path, 'wb')  # todo limit max length of file
-        logger.info(f"Open path {self.temporary_file_path} to store upload file.")
+    def prepare(self):
         self.start_time = time.time()
-        self.writed_size = 0
+        self.sink = None
+        self.error = None  # raised in post so that the client gets a response
+        boundary = parse_boundary(self.request.headers.get('Content-Type', ''))
+        self.parser = MultipartParser(boundary, self.open_file) if boundary is not None else None
+
+    def open_file(self, name, filename, headers):
+        if name != "file" or self.sink is not None:
+            raise ValueError(f"Unexpected file part {name}.")
+        self.sink = UploadFileSink(filename)  # todo limit max length of file
+        return self.sink
 
     def data_received(self, chunk):
-        self.temporary_file.write(chunk)
-        self.writed_size = self.writed_size + len(chunk)
-        del chunk  # free mem
+        if self.parser is None or self.error is not None:
+            return  # discard the body
+        try:
+            self.parser.feed(chunk)
+        except Exception as e:
+            self.error = e
+            if self.sink is not None:
+                self.sink.close()
+
+    def on_connection_close(self):
+        if self.sink is not None:
+            self.sink.close()
 
     @gen.coroutine
     def post(self, *args, **kwargs):
-        # 1. close file
-        file_size = util.human_data_size(self.writed_size)
-        logger.info(f"Uploaded file finished at {self.temporary_file_path}, file size {file_size} .")
-        if self.temporary_file is not None:
-            self.temporary_file.flush()
-            self.temporary_file.close()
-
-        content_type = self.request.headers['Content-Type']
-        with open(self.temporary_file_path, 'rb') as f:
-            fields = content_type.split(";")
-            for field in fields:
-                k, sep, v = field.strip().partition("=")
-                if k == "boundary" and v:
-                    from tornado.escape import utf8
-                    files = {}
-                    httputil.parse_multipart_form_data(utf8(v), f.read(), {}, files)
-                    handle_tornado_upload_file(self, files, self.start_time)
-                    return
-        raise Exception("Handle upload failed.")
+        if self.parser is None:
+            raise ValueError("Request body should be multipart/form-data.")
+        if self.error is not None:
+            raise self.error
+        self.parser.close()
+        if self.sink is None:
+            raise MissingParamException("file")
+        self.sink.finish()  # the body is complete
+
+        file_size = util.human_data_size(self.sink.size)
+        logger.info(f"Uploaded file finished at {self.sink.file_path}, file size {file_size} .")
+        response_upload_file(self, self.sink.file_path, file_size, self.start_time)
 
 
 class TextResourceTailHandler(AbstractTextResourceHandler):
@@ -4,6 +4,7 @@ from tornado import gen
 
 from cooka.handler.base_handler import BaseHandler
 from cooka.common import consts
+from cooka.service.dataset_service import DatasetService
 
 
 class ConfigHandler(BaseHandler):
@@ -14,3 +15,10 @@ class ConfigHandler(BaseHandler):
             "LANG": consts.LANG,
         }
         self.response_json(response)
+
+
+class ResponseCacheHandler(BaseHandler):
+
+    @gen.coroutine
+    def get(self, *args, **kwargs):
+        self.response_json(DatasetService.response_cache.stats())
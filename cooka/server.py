@@ -17,7 +17,7 @@ from cooka.handler.resource_handler import TextResourceHeadHandler, TextResource
 from cooka.handler.dataset_handler import DatasetHandler, DatasetItemHandler, DatasetPreviewDataHandler, TestImportFileHandler, DatasetNameHandler
 from cooka.handler.experiment_handler import ModelDetailHandler, ExperimentHandler, ModelTrainProcessHandler, RecommendTrainConfigurationHandler
 from cooka.handler.model_serving_handler import BatchPredictJobHandler, BatchPredictJobItemHandler
-from cooka.handler.sys_hander import ConfigHandler
+from cooka.handler.sys_hander import ConfigHandler, ResponseCacheHandler
 from cooka.service.process_monitor import ProcessMonitor
 import os
 import argparse
@@ -50,6 +50,7 @@ class CookaWebApplication(web.Application):
 
             (r'/api/dataset', DatasetHandler),
             (r'/api/sysconfig', ConfigHandler),
+            (r'/api/sysconfig/response-cache', ResponseCacheHandler),
             (r"/api/temporary-dataset", TemporaryDatasetHandler),
 
             (r"/api/dataset/(?P<dataset_name>.+)/preview", DatasetPreviewDataHandler),
@@ -0,0 +1,94 @@
+# -*- encoding: utf-8 -*-
+import hashlib
+import os
+from os import path as P
+
+from cooka.common import util, consts
+from cooka.common.log import log_web as logger
+from cooka.common.model import SampleConf
+
+CACHE_FILE_SUFFIX = '.json'
+CACHE_FORMAT_VERSION = 1  # increase it if analyze results change, entries of other versions are never read
+
+
+class AnalyzeResultCache(object):
+    """Analyze results of files on disk, keyed by content hash of the file, the sample conf and settings of analysis.
+
+    Every entry is a json file, it's modify time is updated when read so the least recently used entries are evicted
+    first once total size of the cache exceeds `max_size`.
+
+    Args:
+        cache_dir: directory to store entries.
+        max_size: max bytes of all entries, 0 disables the cache.
+    """
+
+    def __init__(self, cache_dir=consts.PATH_ANALYZE_CACHE, max_size=consts.ANALYZE_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    @staticmethod
+    def analyze_settings():
+        """Settings that change analyze results, read when a key is made so changed settings miss old entries. """
+        return {
+            "version": CACHE_FORMAT_VERSION,
+            "approx_distinct": consts.ANALYZE_APPROX_DISTINCT,
+            "hll_precision": consts.HLL_PRECISION,
+            "bins_strategy": consts.BINS_STRATEGY,
+            "infer_epoch_datetime": consts.INFER_EPOCH_DATETIME,
+            "association_top_k": consts.ASSOCIATION_TOP_K
+        }
+
+    @staticmethod
+    def make_key(content_hash, sample_conf: SampleConf):
+        sample_conf_str = util.dumps(sample_conf.to_dict(), indent=None)
+        settings_str = util.dumps(AnalyzeResultCache.analyze_settings(), indent=None)
+        return hashlib.md5(f"{content_hash}:{sample_conf_str}:{settings_str}".encode('utf-8')).hexdigest()
+
+    def _entry_path(self, content_hash, sample_conf):
+        return P.join(self.cache_dir, self.make_key(content_hash, sample_conf) + CACHE_FILE_SUFFIX)
+
+    def get(self, content_hash, sample_conf: SampleConf):
+        if not self.enabled:
+            return None
+        entry_path = self._entry_path(content_hash, sample_conf)
+        if not P.exists(entry_path):
+            return None
+        try:
+            with open(entry_path, 'r') as f:
+                value = util.loads(f.read())
+            os.utime(entry_path)  # mark as recently used
+            return value
+        except Exception as e:
+            logger.warning(f"Read analyze cache {entry_path} failed, ignored it: {e}")
+            return None
+
+    def put(self, content_hash, sample_conf: SampleConf, value: dict):
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_path = self._entry_path(content_hash, sample_conf)
+        tmp_path = f"{entry_path}.{util.short_uuid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(util.dumps(value, indent=None))
+        os.replace(tmp_path, entry_path)  # readers never see a partial entry
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(CACHE_FILE_SUFFIX):
+                entry_path = P.join(self.cache_dir, file_name)
+                stat = os.stat(entry_path)
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(e[1] for e in entries)
+        for mtime, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(entry_path)
+            total_size = total_size - size
+            logger.info(f"Evict analyze cache {entry_path}")
@@ -1,3 +1,4 @@
+import copy
 import os
 import shutil
 import time
@@ -9,33 +10,65 @@ from cooka.dao.dao import DatasetDao, ExperimentDao
 from cooka.dao import db
 from cooka.dao.entity import DatasetEntity, MessageEntity
 
-from cooka.common import util, consts
+from cooka.common import util, consts, columnar, row_index, file_placement
 from cooka.common.exceptions import EntityNotExistsException, IllegalParamException
 from cooka.common.log import log_web as logger
 from cooka.common.model import AnalyzeJobConf, AnalyzeStep, JobStep, SampleConf, LocaleInfo, RespPreviewDataset, \
     DatasetStats, FeatureValueCount, FeatureType, FeatureCorrelation
+from cooka.core import upload_stats
+from cooka.service.analyze_cache import AnalyzeResultCache
+from cooka.service.response_cache import ResponseCache
+
+IMPORT_PLACEMENT_METHODS = [file_placement.METHOD_REFLINK, file_placement.METHOD_COPY]
+CACHE_KIND_DETAIL = 'detail'
+CACHE_KIND_PREVIEW = 'preview'
 
 
 class DatasetService:
 
     dataset_dao = DatasetDao()
     model_dao = ExperimentDao()
+    analyze_cache = AnalyzeResultCache()
+    response_cache = ResponseCache()  # shared by all instances in the server
+
+    def invalidate_response_cache(self, *dataset_names):
+        for dataset_name in dataset_names:
+            self.response_cache.invalidate(dataset_name)
 
     def add_analyze_process_step(self, dataset_name, analyze_job_name, step: JobStep):
         step_type = step.type
         with db.open_session() as s:
             # 1.1.  check dataset exists
             d = s.query(DatasetEntity).filter(DatasetEntity.name == dataset_name).first()
+            if d is None and step_type in [AnalyzeStep.Types.Refined, AnalyzeStep.Types.Progress]:
+                # temporary dataset may be created as a dataset before refined
+                d = self.dataset_dao.find_by_temporary_name(s, dataset_name)
             if d is None:
                 raise EntityNotExistsException(DatasetEntity, dataset_name)
+            dataset_name = d.name
+            self.invalidate_response_cache(dataset_name)
             dataset_file_path = d.file_path
+            if step_type == AnalyzeStep.Types.Progress:
+                # progress is reported periodically, only the latest one is kept in dataset but not in steps of the job
+                extension = dict(d.extension or {})
+                extension['analyze_progress'] = step.extension
+                self.dataset_dao.update_by_name(s, dataset_name, {"extension": extension})
+                return
             # 1.2. check event type, one type one record
             messages = s.query(MessageEntity).filter(MessageEntity.author == analyze_job_name).all()
-            for m in messages:
-                if step_type == util.loads(m.content).get('type'):
+            steps = [util.loads(m.content) for m in messages]
+            for m_step in steps:
+                if step_type == m_step.get('type'):
                     raise Exception(f"Event type = {step_type} already exists .")
 
+        # 1.3. cache analyze result of the file, result of progressive analysis is cached after refined
+        if step.status == JobStep.Status.Succeed:
+            if (step_type == AnalyzeStep.Types.Analyzed and not step.extension.get('progressive')) \
+                    or step_type == AnalyzeStep.Types.Refined:
+                self._put_analyze_cache(dataset_file_path, steps, step)
+
         # 2. handle event
+        label_col = None
         with db.open_session() as s:
             # 2.1. create a new message
             # add recommend dataset name if analyze succeed
@@ -50,26 +83,24 @@ class DatasetService:
             if step_type == AnalyzeStep.Types.Analyzed:
                 # update temporary dataset
                 if step.status == JobStep.Status.Succeed:
-                    hints = step.extension.pop("hints")
-                    d_stats = DatasetStats.load_dict(step.extension)
-                    features_str = [f.to_dict() for f in d_stats.features]
-                    update_fields = \
-                        {
-                            "has_header": d_stats.has_header,
-                            "extension": {"sample_conf": step.extension['sample_conf']},  # for sample hint
-                            "n_cols": d_stats.n_cols,
-                            "n_rows": d_stats.n_rows,
-                            "features": features_str,
-                            "hints": hints,
-                            "feature_summary": d_stats.feature_summary.to_dict(),
-                            "status": DatasetEntity.Status.Analyzed
-                         }
+                    dataset = self.dataset_dao.require_by_name(s, dataset_name)
+                    update_fields = self._analyzed_fields(step.extension, dataset.extension)  # keep upload stats
                 else:
                     update_fields = {
                         "status": DatasetEntity.Status.Failed
                     }
                 self.dataset_dao.update_by_name(s, dataset_name, update_fields)
 
+            elif step_type == AnalyzeStep.Types.Refined:
+                # replace statistics of the head rows with whole data, dataset keeps usable if refine failed
+                if step.status == JobStep.Status.Succeed:
+                    dataset = self.dataset_dao.require_by_name(s, dataset_name)
+                    update_fields = self._analyzed_fields(step.extension, dataset.extension)
+                    self.dataset_dao.update_by_name(s, dataset_name, update_fields)
+                    label_col = dataset.label_col
+                else:
+                    logger.warning(f"Refine analysis of dataset {dataset_name} failed, keep the result of head rows.")
+
             elif step_type == AnalyzeStep.Types.PatchCorrelation:
                 # 1. check dataset status, only analyzed can calc relativity
                 dataset = self.dataset_dao.require_by_name(s, dataset_name)
@@ -83,27 +114,83 @@ class DatasetService:
                 # 2. read extension
                 corr_dict = step.extension.get('corr')
 
-                # 3. load & update features
-                features = dataset.to_dataset_stats().features
-                for f in features:
-                    correlation = corr_dict.get(f.name)
-                    f.correlation = FeatureCorrelation(value=correlation, status=FeatureCorrelation.calc_status(correlation, request_label_col==f.name))
+                # 3. update features
+                self._update_correlation(s, dataset, request_label_col, corr_dict)
 
-                # 4. sort features by  abs correlation
-                def sort_key(f):
-                    if f.correlation.value is None:
-                        return 0
-                    else:
-                        return abs(f.correlation.value)
+        # 3. correlation with the label is calculated again by the refined association
+        if step_type == AnalyzeStep.Types.Refined and step.status == JobStep.Status.Succeed and label_col is not None:
+            if not self.patch_correlation_by_association(dataset_name, label_col):
+                logger.warning(f"Label {label_col} is not in association matrix, correlation of dataset {dataset_name} is not refined.")
+
+    def get_analyze_progress(self, dataset_name):
+        """Latest progress reported by the analyze job of a temporary dataset, None if nothing reported. """
+        with db.open_session() as s:
+            d = self.dataset_dao.find_by_name(s, dataset_name)
+            if d is None:
+                d = self.dataset_dao.find_by_temporary_name(s, dataset_name)
+            if d is None:
+                raise EntityNotExistsException(DatasetEntity, dataset_name)
+            return (d.extension or {}).get('analyze_progress')
+
+    @staticmethod
+    def _analyzed_fields(analyzed_extension, dataset_extension):
+        """Fields of dataset to update by extension of an analyzed step, other items in extension of dataset are kept. """
+        hints = analyzed_extension.pop("hints")
+        d_stats = DatasetStats.load_dict(analyzed_extension)
+        extension = dict(dataset_extension or {})
+        extension.update({"sample_conf": analyzed_extension['sample_conf'],  # for sample hint
+                          "read_spec": analyzed_extension.get('read_spec'),
+                          "association": analyzed_extension.get('association'),
+                          "progressive": analyzed_extension.get('progressive', False)})  # refining is pending
+        return {
+            "has_header": d_stats.has_header,
+            "extension": extension,
+            "n_cols": d_stats.n_cols,
+            "n_rows": d_stats.n_rows,
+            "features": [f.to_dict() for f in d_stats.features],
+            "hints": hints,
+            "feature_summary": d_stats.feature_summary.to_dict(),
+            "status": DatasetEntity.Status.Analyzed
+        }
+
+    def _update_correlation(self, s, dataset: DatasetEntity, label_col, corr_dict):
+        # 1. load & update features
+        features = dataset.to_dataset_stats().features
+        for f in features:
+            correlation = corr_dict.get(f.name)
+            f.correlation = FeatureCorrelation(value=correlation, status=FeatureCorrelation.calc_status(correlation, label_col==f.name))
+
+        # 2. sort features by  abs correlation
+        def sort_key(f):
+            if f.correlation.value is None:
+                return 0
+            else:
+                return abs(f.correlation.value)
 
-                features = sorted(features, key=sort_key, reverse=True)
+        features = sorted(features, key=sort_key, reverse=True)
 
-                feature_dict_list = []
-                for f in features:
-                    feature_dict_list.append(f.to_dict())
+        feature_dict_list = []
+        for f in features:
+            feature_dict_list.append(f.to_dict())
 
-                # 5. push back database
-                self.dataset_dao.update_by_name(s, dataset_name, {"features": feature_dict_list})
+        # 3. push back database
+        self.dataset_dao.update_by_name(s, dataset.name, {"features": feature_dict_list})
+
+    def patch_correlation_by_association(self, dataset_name, label_col):
+        """Update correlation of features with the label by association matrix calculated when analyzing.
+
+        Returns:
+            False if the label is not in the matrix, correlation should be calculated by job.
+        """
+        with db.open_session() as s:
+            dataset = self.dataset_dao.require_by_name(s, dataset_name)
+            association_matrix = dataset.to_dataset_stats().association
+            corr_dict = association_matrix.get(label_col) if association_matrix is not None else None
+            if corr_dict is None:
+                return False
+            self._update_correlation(s, dataset, label_col, corr_dict)
+            self.invalidate_response_cache(dataset_name)
+            return True
 
     def brevity_dataset_pagination(self, req_dict):
         # 1. read param
@@ -167,26 +254,52 @@ class DatasetService:
             new_dataset_dir = P.join(consts.PATH_DATASET, dataset_name)
             os.makedirs(new_dataset_dir, exist_ok=False)
 
-            # 5. move file
+            # 5. move file, analyze job may still read the temporary file if it's refining
             file_path = temporary_dataset.get_abs_file_path()
             new_dataset_file_path = P.join(new_dataset_dir, f'data{util.get_file_suffix(file_path)}')
-            shutil.copy(file_path, new_dataset_file_path)
+            extension = dict(temporary_dataset.extension or {})
+            methods = file_placement.METHODS
+            if extension.get('progressive'):
+                methods = [m for m in methods if m != file_placement.METHOD_RENAME]
+            placement, _ = file_placement.place_file(file_path, new_dataset_file_path, methods)
+            logger.info(f"Place file {file_path} at {new_dataset_file_path} by {placement}.")
+            if not extension.get('progressive'):
+                # hash, statistics and sample of the upload are only read by the analyze job
+                upload_stats.remove_sidecars(file_path)
 
             # 6. create meta.json
             # temporary_dataset_dict['name'] = dataset_name
             # temporary_dataset_dict['create_datetime'] = util.get_now_long()
             # with open(P.join(new_dataset_dir, 'meta.json'), 'w') as f:
             #     f.write(util.dumps(temporary_dataset_dict))
+            extension['temporary_dataset_name'] = temporary_dataset_name  # to find it if analysis refined later
+            extension['placement'] = placement
             properties = {"is_temporary": False,
                           "name": dataset_name,
-                          "file_path": new_dataset_file_path}
+                          "file_path": new_dataset_file_path,
+                          "extension": extension}
 
             # 7. change status
             affect_rows = s.query(DatasetEntity).filter(DatasetEntity.name == temporary_dataset_name, DatasetEntity.is_temporary == True).update(properties)
             if affect_rows != 1:
                 raise Exception("Update dataset failed.")
+            self.invalidate_response_cache(temporary_dataset_name, dataset_name)
+
+        # 8. write typed columnar file in background for later jobs
+        std_log = P.join(new_dataset_dir, "columnar_job.log")
+        command = f"nohup {sys.executable} {util.script_path('columnar_job.py')} --dataset_name={dataset_name} --server_portal={consts.SERVER_PORTAL} 1>{std_log} 2>&1 &"
+        logger.info(f"Run write columnar file command: \n{command}")
+        os.system(command)
 
     def retrieve(self, dataset_name, n_top_value):
+        cache_key = (CACHE_KIND_DETAIL, dataset_name, n_top_value)
+        dict_value = self.response_cache.get(cache_key)
+        if dict_value is None:
+            dict_value = self._retrieve(dataset_name, n_top_value)
+            self.response_cache.put(cache_key, dict_value)
+        return dict_value
+
+    def _retrieve(self, dataset_name, n_top_value):
         with db.open_session() as s:
             dataset = self.dataset_dao.require_by_name(s, dataset_name)
             dict_value = util.sqlalchemy_obj_to_dict(dataset)
@@ -214,6 +327,8 @@ class DatasetService:
             # dict_value['detail'] = dict_value['extension']
             extension = dict_value.pop('extension')
             dict_value['extension'] = {"sample_conf": extension['sample_conf']}
+            dict_value['read_spec'] = extension.get('read_spec')
+            dict_value['sample_conf'] = extension['sample_conf']
             return dict_value
 
     def delete(self, dataset_name):
@@ -222,6 +337,7 @@ class DatasetService:
             dataset = self.dataset_dao.require_by_name(s, dataset_name)
             is_temporary = dataset.is_temporary
             self.dataset_dao.delete(s, dataset_name)
+            self.invalidate_response_cache(dataset_name)
 
             # 2. delete file only not temporary
             if is_temporary is False:
@@ -286,10 +402,15 @@ class DatasetService:
             t1 = time.time()
             internal_path = util.temporary_upload_file_path(P.basename(file_path))
             os.makedirs(P.dirname(internal_path), exist_ok=True)
-            shutil.copy(file_path, internal_path)
+            # never move or link the imported file, clone it so that changes of it are not shared
+            placement, content_hash = file_placement.place_file(file_path, internal_path, IMPORT_PLACEMENT_METHODS)
+            if content_hash is not None:
+                util.write_content_hash(internal_path, content_hash)
+            # else a cloned file is hashed by the analyze job but not here
             took = time.time() - t1
-            logger.info(f"Copy file to {internal_path}")
-            return self._create_temporary_dataset(source_type, internal_path, took, sample_conf)
+            logger.info(f"Place file at {internal_path} by {placement}")
+            return self._create_temporary_dataset(source_type, internal_path, took, sample_conf, content_hash,
+                                                  placement)
         else:
             raise IllegalParamException('source_type', source_type, f'should one of {",".join([DatasetEntity.SourceType.Upload, DatasetEntity.SourceType.Import])}')
 
@@ -327,20 +448,59 @@ class DatasetService:
         else:
             return s
 
-    def _create_temporary_dataset(self, source_type, file_path, took, sample_conf: SampleConf):
+    def _put_analyze_cache(self, file_path, steps, analyzed_step: JobStep):
+        load_steps = [m_step for m_step in steps if m_step.get('type') == AnalyzeStep.Types.Load]
+        # hash of a cloned file is computed by the analyze job
+        content_hashes = [m_step['extension'].get('content_hash') for m_step in steps
+                          if m_step.get('type') in [AnalyzeStep.Types.Upload, AnalyzeStep.Types.Copy, AnalyzeStep.Types.Load]
+                          and m_step.get('extension') is not None]
+        content_hashes = [h for h in content_hashes if h is not None]
+        if len(load_steps) < 1 or len(content_hashes) < 1:
+            return
+        try:
+            sample_conf = SampleConf.load_dict(analyzed_step.extension['sample_conf'])
+            value = {
+                "load": load_steps[0]['extension'],
+                "analyzed": copy.deepcopy(analyzed_step.extension)
+            }
+            self.analyze_cache.put(content_hashes[0], sample_conf, value)
+        except Exception as e:
+            logger.warning(f"Cache analyze result of {file_path} failed: {e}")
+
+    def _replay_analyze_cache(self, dataset_name, analyze_job_name, content_hash, sample_conf: SampleConf):
+        cached = self.analyze_cache.get(content_hash, sample_conf)
+        if cached is None:
+            return False
+        logger.info(f"Analyze result of dataset {dataset_name} is found in cache, skip analyze job. ")
+        for step_type, extension in [(AnalyzeStep.Types.Load, cached['load']),
+                                     (AnalyzeStep.Types.Analyzed, cached['analyzed'])]:
+            step = JobStep(type=step_type, status=JobStep.Status.Succeed, extension=extension,
+                           took=0.0, datetime=util.get_now_long())
+            self.add_analyze_process_step(dataset_name, analyze_job_name, step)
+        return True
+
+    def _create_temporary_dataset(self, source_type, file_path, took, sample_conf: SampleConf, content_hash=None,
+                                  placement=None):
         now = util.get_now_datetime()
         file_name = P.basename(file_path)
         temporary_dataset_name = self.choose_dataset_name(file_name, True)  # use a long name
         analyze_job_name = util.analyze_data_job_name(util.cut_suffix(file_name), now)
         file_size = P.getsize(file_path)
+        if content_hash is None:
+            content_hash = util.read_content_hash(file_path, compute=False)
+        # statistics computed while uploading, None if the file is imported
+        stats = upload_stats.read_stats(file_path)
+        stats_dict = stats.to_dict() if stats is not None else None
 
         # 2. create record
         td = DatasetEntity(name=temporary_dataset_name,
                            file_size=file_size,
+                           n_rows=stats.n_rows if stats is not None else None,
                            is_temporary=True,
                            status=DatasetEntity.Status.Created,
                            source_type=source_type,
                            file_path=file_path,
+                           extension={"upload_stats": stats_dict} if stats is not None else None,
                            create_datetime=now, last_update_datetime=now)
         with db.open_session() as s:
             s.add(td)
@@ -349,19 +509,26 @@ class DatasetService:
         if source_type == DatasetEntity.SourceType.Upload:
             step = JobStep(type=AnalyzeStep.Types.Upload,
                            status=AnalyzeStep.Status.Succeed,
-                           extension={"file_size": file_size, "file_path": file_path},
+                           extension={"file_size": file_size, "file_path": file_path, "content_hash": content_hash,
+                                      "upload_stats": stats_dict},
                            took=took, datetime=util.get_now_long())
             self.add_analyze_process_step(temporary_dataset_name, analyze_job_name, step)
         elif source_type == DatasetEntity.SourceType.Import:
             step = JobStep(type=AnalyzeStep.Types.Copy,
                            status=AnalyzeStep.Status.Succeed,
                            extension={"file_size": file_size,
-                                      "file_path": file_path},
+                                      "file_path": file_path,
+                                      "content_hash": content_hash,
+                                      "placement": placement},
                            took=took,
                            datetime=util.get_now_long())
             self.add_analyze_process_step(temporary_dataset_name, analyze_job_name, step)
 
-        # 4. create analyze config
+        # 4. the same file was analyzed with the same sample conf
+        if content_hash is not None and self._replay_analyze_cache(temporary_dataset_name, analyze_job_name, content_hash, sample_conf):
+            return temporary_dataset_name, analyze_job_name
+
+        # 5. create analyze config
         conf = AnalyzeJobConf(job_name=analyze_job_name,
                               dataset_name=temporary_dataset_name,
                               sample_conf=sample_conf,
@@ -369,7 +536,7 @@ class DatasetService:
                               temporary_dataset=True,
                               label_col=None)
 
-        # 5. start new process
+        # 6. start new process
         analyze_config_string = util.dumps(conf.to_dict())
         logger.info(f"Analyze job conf: {analyze_config_string}")
 
@@ -392,6 +559,15 @@ class DatasetService:
         return temporary_dataset_name, analyze_job_name
 
     def preview(self, dataset_name: str, page_num: int, page_size: int) -> RespPreviewDataset:
+        cache_key = (CACHE_KIND_PREVIEW, dataset_name, page_num, page_size)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return RespPreviewDataset.load_dict(cached)
+        resp = self._preview(dataset_name, page_num, page_size)
+        self.response_cache.put(cache_key, resp.to_dict())
+        return resp
+
+    def _preview(self, dataset_name: str, page_num: int, page_size: int) -> RespPreviewDataset:
         """
         Args:
             dataset_name:
@@ -422,35 +598,45 @@ class DatasetService:
         dataset_headers = [f.name for f in dataset_stats.features]
         dataset_headers.insert(0, "No. ")
         # dataset_headers.insert(0, "number")
-        if dataset_stats.has_header:
-            iterator_df = pd.read_csv(file_path, chunksize=page_size)
+        page_df = columnar.read_rows(file_path, (page_num - 1) * page_size, page_size)
+        if page_df is not None:
+            # show datetime as text like it in csv
+            for c in page_df.columns:
+                if 'datetime' in page_df[c].dtype.name:
+                    page_df[c] = page_df[c].astype(str).where(page_df[c].notnull(), np.NaN)
         else:
-            iterator_df = pd.read_csv(file_path, chunksize=page_size, header=None)
-
-        # 4. seek pages, page num start from 1
-        # e.g. if page_num = 1 while loop will do 0 times, below code will invoke next(iterator_df) and get data
-        current_page = 1
-        while current_page < page_num:
-            try:
-                next(iterator_df)  # no Reference, will be gc
-                current_page = current_page + 1
-            except StopIteration:
-                # if page_num is too large , no data returned
-                return RespPreviewDataset(headers=dataset_headers, rows=None, count=dataset_stats.n_rows, file_path=relative_file_path)
+            # seek to the page by row index
+            page_df = row_index.read_rows(file_path, (page_num - 1) * page_size, page_size, **dataset_stats.read_kwargs())
 
-        # 5. hit data
-        try:
-            page_df: pd.DataFrame = next(iterator_df)
-            # 5.1. make index
-            start_line_no = (current_page - 1) * page_size + 1  # start from 1
-            df_index = page_df.index = pd.RangeIndex(start_line_no, start_line_no + page_df.shape[0])
-            page_df.index = df_index
-
-            # 5.2. replace NaN to null
-            page_df.replace(np.NaN, 'NULL', inplace=True)
-            # fixme orgin data can not has column named index nor cause a error "ValueError: name already used as a name or title"
-            values = page_df.to_records(index=True).tolist()
-
-            return RespPreviewDataset(headers=dataset_headers, rows=values, count=dataset_stats.n_rows, file_path=relative_file_path)
-        except StopIteration:
+        if page_df is None:
+            if dataset_stats.has_header:
+                iterator_df = util.iter_csv(file_path, chunksize=page_size, **dataset_stats.read_kwargs())
+            else:
+                iterator_df = util.iter_csv(file_path, chunksize=page_size, header=None, **dataset_stats.read_kwargs())
+
+            # 4. seek pages, page num start from 1
+            # e.g. if page_num = 1 while loop will do 0 times, below code will invoke next(iterator_df) and get data
+            current_page = 1
+            while current_page < page_num:
+                try:
+                    next(iterator_df)  # no Reference, will be gc
+                    current_page = current_page + 1
+                except StopIteration:
+                    break
+            page_df = next(iterator_df, None)
+
+        if page_df is None or page_df.shape[0] == 0:
+            # if page_num is too large , no data returned
             return RespPreviewDataset(headers=dataset_headers, rows=None, count=dataset_stats.n_rows, file_path=relative_file_path)
+
+        # 5. hit data
+        # 5.1. make index
+        start_line_no = (page_num - 1) * page_size + 1  # start from 1
+        page_df.index = pd.RangeIndex(start_line_no, start_line_no + page_df.shape[0])
+
+        # 5.2. replace NaN to null
+        page_df.replace(np.NaN, 'NULL', inplace=True)
+        # fixme orgin data can not has column named index nor cause a error "ValueError: name already used as a name or title"
+        values = page_df.to_records(index=True).tolist()
+
+        return RespPreviewDataset(headers=dataset_headers, rows=values, count=dataset_stats.n_rows, file_path=relative_file_path)
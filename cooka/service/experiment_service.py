@@ -8,7 +8,7 @@ from cooka.common.model import ExperimentConf, TrainJobConf, FrameworkType, JobS
 from cooka.dao.dao import ExperimentDao, DatasetDao
 from cooka.dao.entity import ExperimentEntity, MessageEntity
 from cooka.dao import db
-from cooka.common import util
+from cooka.common import util, dataset_util
 import abc
 from cooka.common.model import TrainMode
 from cooka.common.model import Feature, DatasetStats, ModelFeature
@@ -308,6 +308,9 @@ class ExperimentService(object):
             dataset_default_headers_code = None
 
         # 3. make reader params
+        dataset_read_kwargs = experiment_conf.dataset_read_spec.read_kwargs() \
+            if experiment_conf.dataset_read_spec is not None else {}
+        dataset_read_kwargs.update(dataset_util.compact_read_kwargs(experiment_conf.dataset_dtypes or {}))
         pos_label = experiment_conf.pos_label
         pos_label_is_str = isinstance(pos_label, str)
         reward_metric = self.get_optimize_metric(experiment_conf.task_type, train_job_conf.framework)
@@ -335,6 +338,7 @@ class ExperimentService(object):
             "max_trials": train_job_conf.max_trials,
             "dataset_has_header": experiment_conf.dataset_has_header,
             "dataset_default_headers": dataset_default_headers_code,
+            "dataset_read_kwargs": util.dumps(dataset_read_kwargs, indent=None),
             "model_feature_list": util.dumps(model_input_features, indent=None)
         }
 
@@ -475,8 +479,14 @@ shap_values = dt_explainer.get_shap_values(X_test[:1], nsamples='auto')"""
         # 1. update label col, Avoiding that http request send first and not label_col not updated
         with db.open_session() as s:
             self.dataset_dao.update_by_name(s, dataset_name, {"label_col": label_col})
+        self.dataset_service.invalidate_response_cache(dataset_name)
 
-        # 2. start a process to analyze correlation
+        # 2. look up association calculated when analyzing
+        if self.dataset_service.patch_correlation_by_association(dataset_name, label_col):
+            log.info(f"Correlation with label {label_col} of dataset {dataset_name} is updated by association matrix.")
+            return
+
+        # 3. start a process to analyze correlation
         analyze_pearson_job_name = util.analyze_data_job_name(P.basename(file_path))
         std_log = P.join(util.dataset_dir(dataset_name), f"{analyze_pearson_job_name}.log")
         if task_type == TaskType.Regression: # only for regression task and continuous feature
@@ -582,7 +592,10 @@ shap_values = dt_explainer.get_shap_values(X_test[:1], nsamples='auto')"""
                               cross_validation=cross_validation,
                               train_validation_holdout=train_validation_holdout,
                               datetime_series_col=datetime_series_col,
-                              file_path=dataset_stats.file_path)
+                              file_path=dataset_stats.file_path,
+                              dataset_read_spec=dataset_stats.read_spec,
+                              dataset_dtypes=dataset_util.compact_dtypes(dataset_stats.features,
+                                                                         dataset_stats.is_whole_data_analyzed))
 
         model_input_features = list(map(lambda _: ModelFeature(name=_.name, type=_.type, data_type=_.data_type).to_dict(), filter(lambda _: _.name != label_f.name, dataset_stats.features)))
 
@@ -0,0 +1,67 @@
+# -*- encoding: utf-8 -*-
+from collections import OrderedDict
+
+from cooka.common import util, consts
+
+
+class ResponseCache(object):
+    """In-process LRU cache of responses of dataset apis, such as preview pages and detail of dataset.
+
+    Values are kept as json text, so every hit returns a new copy and size of the cache is bytes of the text. Keys are
+    tuples like (kind, dataset_name, ...) and all entries of a dataset are invalidated once it's changed.
+
+    Args:
+        max_size: max bytes of all entries, 0 disables the cache.
+    """
+
+    def __init__(self, max_size=consts.RESPONSE_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        text = self.entries.get(key)
+        if text is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.entries.move_to_end(key)  # mark as recently used
+        return util.loads(text)
+
+    def put(self, key, value: dict):
+        if not self.enabled:
+            return
+        self._remove(key)
+        text = util.dumps(value, indent=None)
+        if len(text) > self.max_size:
+            return
+        self.entries[key] = text
+        self.size = self.size + len(text)
+        while self.size > self.max_size:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        text = self.entries.pop(key, None)
+        if text is not None:
+            self.size = self.size - len(text)
+
+    def invalidate(self, dataset_name):
+        for key in [k for k in self.entries.keys() if k[1] == dataset_name]:
+            self._remove(key)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "size": self.size,
+            "max_size": self.max_size
+        }
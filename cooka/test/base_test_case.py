@@ -106,6 +106,7 @@ class WithTemporaryDatasetTestCase(BaseTestCase):
         # 3. poll dataset message
         temporary_dataset_name = create_response_body["temporary_dataset_name"]
         analyze_job_name = create_response_body["analyze_job_name"]
+        self.analyze_job_name = analyze_job_name
 
         excepted_event = [AnalyzeStep.Types.Upload, AnalyzeStep.Types.Load, AnalyzeStep.Types.Analyzed]
 
@@ -0,0 +1,197 @@
+# -*- encoding: utf-8 -*-
+"""
+Benchmark of analyzers on synthetic datasets, every analysis runs in a new process to measure the peak RSS.
+
+    python cooka/test/run_analyzer_benchmark.py --rows=10000,1000000 --cols=10,1000 --output=benchmark.json
+    python cooka/test/run_analyzer_benchmark.py --output=new.json --compare=benchmark.json
+
+Datasets are generated once by a fixed seed and kept in `--data_dir`, so results of different commits are comparable.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import time
+from os import path as P
+
+import numpy as np
+import pandas as pd
+
+from cooka.common.model import SampleConf
+
+KIND_NUMERIC = 'numeric'
+KIND_CATEGORICAL = 'categorical'
+KIND_DATETIME = 'datetime'
+KIND_HIGH_CARDINALITY = 'high_cardinality'
+KINDS = [KIND_NUMERIC, KIND_CATEGORICAL, KIND_DATETIME, KIND_HIGH_CARDINALITY]
+MIX_MIXED = 'mixed'  # columns of all kinds in turn
+
+WRITE_CHUNK_SIZE = 100000
+SEED = 2020
+
+
+def column_kind(mix, i):
+    return KINDS[i % len(KINDS)] if mix == MIX_MIXED else mix
+
+
+def make_column(kind, i, begin, n, random_state):
+    if kind == KIND_NUMERIC:
+        if i % 2 == 0:
+            return random_state.randint(0, 1000, n)
+        values = random_state.normal(i, 1 + i % 7, n)
+        values[random_state.random_sample(n) < 0.05] = np.nan  # missing values
+        return values
+    elif kind == KIND_CATEGORICAL:
+        return np.array([f"c{i}_{j}" for j in range(20)])[random_state.randint(0, 20, n)]
+    elif kind == KIND_DATETIME:
+        seconds = random_state.randint(0, 10 * 365 * 86400, n)
+        return pd.to_datetime(seconds + 1262304000, unit='s').strftime("%Y-%m-%d %H:%M:%S")
+    elif kind == KIND_HIGH_CARDINALITY:
+        return np.char.add(f"h{i}_", np.arange(begin, begin + n).astype(str))
+    else:
+        raise ValueError(f"Unseen column kind {kind}")
+
+
+def make_dataset(data_dir, n_rows, n_cols, mix):
+    """Write a csv file deterministically by chunks, the file is reused if it exists. """
+    file_path = P.join(data_dir, f"bench_{n_rows}_{n_cols}_{mix}.csv")
+    if P.exists(file_path):
+        return file_path
+    os.makedirs(data_dir, exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    random_state = np.random.RandomState(SEED)
+    with open(tmp_path, 'w') as f:
+        for begin in range(0, n_rows, WRITE_CHUNK_SIZE):
+            n = min(WRITE_CHUNK_SIZE, n_rows - begin)
+            chunk = pd.DataFrame({f"col_{i}": make_column(column_kind(mix, i), i, begin, n, random_state)
+                                  for i in range(n_cols)})
+            chunk.to_csv(f, index=False, header=begin == 0)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+def make_analyzer(file_path, sample_conf: SampleConf):
+    # the same as analyze_job.py
+    from cooka.core.analyzer import PandasAnalyzer, ParallelAnalyzer
+    if sample_conf.sample_strategy == SampleConf.Strategy.WholeData:
+        return ParallelAnalyzer(file_path=file_path, label_col=None)
+    else:
+        return PandasAnalyzer(file_path=file_path, label_col=None, sample_conf=sample_conf)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on linux, workers of process pool are children
+    usage_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(usage_self, usage_children) / 1024
+
+
+def _run(file_path, sample_conf_dict, queue):
+    sample_conf = SampleConf.load_dict(sample_conf_dict)
+    t = time.time()
+    analyzer = make_analyzer(file_path, sample_conf)
+    load_seconds = time.time() - t
+    t = time.time()
+    analyzer.do_analyze_csv()
+    analyze_seconds = time.time() - t
+    queue.put({"load_seconds": load_seconds, "analyze_seconds": analyze_seconds, "peak_rss_mb": _peak_rss_mb()})
+
+
+def run_analysis(file_path, sample_conf: SampleConf):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(file_path, sample_conf.to_dict(), queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {"error": f"exit code {process.exitcode}"}
+    return queue.get()
+
+
+def make_sample_conf(strategy, n_rows, percentage):
+    if strategy == SampleConf.Strategy.RandomRows:
+        return SampleConf(sample_strategy=strategy, n_rows=n_rows)
+    elif strategy == SampleConf.Strategy.Percentage:
+        return SampleConf(sample_strategy=strategy, percentage=percentage)
+    else:
+        return SampleConf(sample_strategy=strategy)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_results):
+    """Print ratio of time and memory to the baseline for the same dataset and strategy. """
+    def key(r):
+        return r['n_rows'], r['n_cols'], r['mix'], r['strategy']
+
+    baseline_dict = {key(r): r for r in baseline_results}
+    for r in results:
+        b = baseline_dict.get(key(r))
+        if b is None or 'error' in r or 'error' in b:
+            continue
+        ratios = [f"{k}={r[k] / b[k]:.2f}x" for k in ['load_seconds', 'analyze_seconds', 'peak_rss_mb'] if b[k] > 0]
+        print(f"{key(r)}: {', '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark analyzers.', add_help=True)
+    parser.add_argument("--rows", help="row counts, separated by comma", default="10000,100000,1000000")
+    parser.add_argument("--cols", help="column counts, separated by comma", default="10,100,1000")
+    parser.add_argument("--mixes", help="column kinds, separated by comma",
+                        default=",".join(KINDS + [MIX_MIXED]))
+    parser.add_argument("--strategies", help="sample strategies, separated by comma",
+                        default=",".join([SampleConf.Strategy.RandomRows, SampleConf.Strategy.Percentage,
+                                          SampleConf.Strategy.WholeData]))
+    parser.add_argument("--sample_rows", help="rows of random_rows strategy", default=1000, type=int)
+    parser.add_argument("--sample_percentage", help="percentage of percentage strategy", default=20, type=int)
+    parser.add_argument("--max_cells", help="skip datasets larger than rows * cols", default=10 ** 9, type=int)
+    parser.add_argument("--data_dir", help="directory of generated datasets", default="/tmp/cooka_benchmark")
+    parser.add_argument("--output", help="json report", default="analyzer_benchmark.json")
+    parser.add_argument("--compare", help="json report to compare with", default=None)
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in [int(r) for r in args.rows.split(",")]:
+        for n_cols in [int(c) for c in args.cols.split(",")]:
+            if n_rows * n_cols > args.max_cells:
+                print(f"Skip dataset of {n_rows} rows and {n_cols} cols, it's larger than max cells.")
+                continue
+            for mix in args.mixes.split(","):
+                file_path = make_dataset(args.data_dir, n_rows, n_cols, mix)
+                for strategy in args.strategies.split(","):
+                    sample_conf = make_sample_conf(strategy, args.sample_rows, args.sample_percentage)
+                    result = {"n_rows": n_rows, "n_cols": n_cols, "mix": mix, "strategy": strategy,
+                              "file_size": P.getsize(file_path)}
+                    result.update(run_analysis(file_path, sample_conf))
+                    print(json.dumps(result))
+                    results.append(result)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "create_datetime": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "cpu_count": os.cpu_count()
+        },
+        "results": results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Report is written to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
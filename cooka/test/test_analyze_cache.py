@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+import os
+import tempfile
+import time
+
+from cooka.common import consts
+from cooka.common.model import SampleConf
+from cooka.service.analyze_cache import AnalyzeResultCache
+
+
+class TestAnalyzeResultCache:
+
+    def test_get_put(self):
+        cache = AnalyzeResultCache(tempfile.mkdtemp(), max_size=1024 * 1024)
+        random_rows = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, n_rows=1000)
+        whole_data = SampleConf(sample_strategy=SampleConf.Strategy.WholeData)
+        cache.put("hash1", random_rows, {"load": {"n_rows": 10}, "analyzed": {"n_cols": 2}})
+        assert cache.get("hash1", random_rows)["analyzed"]["n_cols"] == 2
+        assert cache.get("hash1", whole_data) is None
+        assert cache.get("hash2", random_rows) is None
+
+    def test_settings_in_key(self):
+        cache = AnalyzeResultCache(tempfile.mkdtemp(), max_size=1024 * 1024)
+        conf = SampleConf(sample_strategy=SampleConf.Strategy.WholeData)
+        cache.put("hash", conf, {"analyzed": {"n_cols": 2}})
+        bins_strategy = consts.BINS_STRATEGY
+        consts.BINS_STRATEGY = consts.BINS_QUANTILE if bins_strategy != consts.BINS_QUANTILE else consts.BINS_EQUAL_WIDTH
+        try:
+            assert cache.get("hash", conf) is None  # computed with other settings
+        finally:
+            consts.BINS_STRATEGY = bins_strategy
+        assert cache.get("hash", conf) is not None
+
+    def test_evict_lru(self):
+        cache_dir = tempfile.mkdtemp()
+        value = {"analyzed": {"features": "x" * 1000}}
+        cache = AnalyzeResultCache(cache_dir, max_size=2500)
+        confs = [SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, n_rows=i) for i in range(3)]
+        cache.put("hash", confs[0], value)
+        cache.put("hash", confs[1], value)
+        time.sleep(0.01)
+        assert cache.get("hash", confs[0]) is not None  # used recently
+        cache.put("hash", confs[2], value)
+        assert len(os.listdir(cache_dir)) == 2
+        assert cache.get("hash", confs[1]) is None
+        assert cache.get("hash", confs[0]) is not None
+
+    def test_disabled(self):
+        cache = AnalyzeResultCache(tempfile.mkdtemp(), max_size=0)
+        conf = SampleConf(sample_strategy=SampleConf.Strategy.WholeData)
+        cache.put("hash", conf, {})
+        assert cache.get("hash", conf) is None
@@ -1,7 +1,17 @@
 # -*- encoding: utf-8 -*-
-from cooka.core.analyzer import PandasAnalyzer
-from cooka.common.model import AnalyzeJobConf, SampleConf
+from cooka.core.analyzer import PandasAnalyzer, StreamingAnalyzer, ParallelAnalyzer
+from cooka.common import consts, util
+from cooka.core.sampler import ReservoirSampler, BernoulliSampler
+from cooka.core import datetime_parser, dask_analyzer, upload_stats
+from cooka.core.upload_stats import UploadStatsAccumulator
+from cooka.core.sniffer import CsvSniffer
+from cooka.core.accumulator import ColumnAccumulator
+from cooka.common.model import AnalyzeJobConf, SampleConf, FeatureType
+import pandas as pd
+import os
+import tempfile
 import unittest
+from os import path as P
 
 
 class TestAnalyzer(unittest.TestCase):
@@ -22,6 +32,292 @@ class TestAnalyzer(unittest.TestCase):
         s = analyzer.do_analyze_csv()
         print(s)
 
+    def test_sample_rows_and_count(self):
+        sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, percentage=None, n_rows=200)
+        analyzer = PandasAnalyzer(self.data_path, None, sample_conf, random_state=1)
+        assert analyzer.n_rows == 10000
+        assert analyzer.n_rows_used == 200
+
+    def test_head_only_analyzer(self):
+        sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, percentage=None, n_rows=1000)
+        analyzer = PandasAnalyzer(self.data_path, None, sample_conf, head_only=True)
+        assert analyzer.n_rows_used == 1000
+        assert abs(analyzer.n_rows - 10000) < 1000  # estimated by bytes
+        assert analyzer.do_analyze_csv().n_rows == analyzer.n_rows
+
+        sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, percentage=None, n_rows=20000)
+        analyzer = PandasAnalyzer(self.data_path, None, sample_conf, head_only=True)
+        assert analyzer.n_rows == 10000
+
+    def test_reservoir_sampler_uniform(self):
+        df = pd.DataFrame({"id": range(1000)})
+        means = []
+        for i in range(50):
+            sampler = ReservoirSampler(100, random_state=i)
+            for begin in range(0, 1000, 37):  # chunk boundary not aligned with reservoir size
+                sampler.update(df.iloc[begin: begin + 37])
+            sample = sampler.get_sample()
+            assert sampler.n_rows == 1000
+            assert sample.shape[0] == 100
+            assert sample['id'].is_unique
+            means.append(sample['id'].mean())
+        assert abs(sum(means) / len(means) - 499.5) < 20
+
+    def test_reservoir_sampler_merge(self):
+        df = pd.DataFrame({"id": range(1000)})
+        means = []
+        for i in range(50):
+            sampler = ReservoirSampler(100, random_state=i)
+            sampler.update(df.iloc[:300])
+            other = ReservoirSampler(100, random_state=i + 100)
+            other.update(df.iloc[300:])
+            sample = sampler.merge(other).get_sample()
+            assert sampler.n_rows == 1000
+            assert sample.shape[0] == 100
+            assert sample['id'].is_unique
+            means.append(sample['id'].mean())
+        assert abs(sum(means) / len(means) - 499.5) < 20
+
+    def test_bernoulli_sampler(self):
+        df = pd.DataFrame({"id": range(10000)})
+        sampler = BernoulliSampler(30, random_state=1)
+        sampler.update(df.iloc[:4000])
+        sampler.update(df.iloc[4000:])
+        assert sampler.n_rows == 10000
+        assert 2700 < sampler.get_sample().shape[0] < 3300
+
+    def test_streaming_analyzer(self):
+        whole_data_conf = SampleConf(sample_strategy=SampleConf.Strategy.WholeData)
+        expected = PandasAnalyzer(self.data_path, None, whole_data_conf).do_analyze_csv()
+        analyzer = StreamingAnalyzer(self.data_path, None, chunksize=777)
+        s = analyzer.do_analyze_csv()
+
+        assert analyzer.n_rows == 10000
+        assert s.n_rows == expected.n_rows
+        assert s.feature_summary.to_dict() == expected.feature_summary.to_dict()
+        for f, expected_f in zip(s.features, expected.features):
+            assert f.name == expected_f.name
+            assert f.type == expected_f.type
+            assert f.data_type == expected_f.data_type
+            assert f.missing.value == expected_f.missing.value
+            assert f.unique.value == expected_f.unique.value
+            if f.type == FeatureType.Continuous:
+                for k in ['min', 'max', 'mean', 'stddev', 'median']:
+                    assert abs(f.extension[k] - expected_f.extension[k]) < 1e-6
+            elif f.type == FeatureType.Datetime:
+                assert f.extension['by_hour'] == expected_f.extension['by_hour']
+
+    def test_parallel_analyzer(self):
+        min_range_size = consts.MIN_ANALYZE_RANGE_SIZE
+        consts.MIN_ANALYZE_RANGE_SIZE = 64 * 1024  # make the small file split
+        try:
+            analyzer = ParallelAnalyzer(self.data_path, None, n_workers=4)
+        finally:
+            consts.MIN_ANALYZE_RANGE_SIZE = min_range_size
+        s = analyzer.do_analyze_csv()
+        expected = StreamingAnalyzer(self.data_path, None).do_analyze_csv()
+
+        assert s.n_rows == 10000
+        assert s.association.columns == expected.association.columns
+        assert analyzer.accumulator.sampler is None  # rows of association features are sampled by another pass
+        for f, expected_f in zip(s.features, expected.features):
+            assert f.name == expected_f.name
+            assert f.type == expected_f.type
+            assert f.missing.value == expected_f.missing.value
+            assert f.unique.value == expected_f.unique.value
+            if f.type == FeatureType.Continuous:
+                assert abs(f.extension['mean'] - expected_f.extension['mean']) < 1e-6
+                assert f.extension['median'] == expected_f.extension['median']
+
+    def test_parallel_analyzer_quoted_after_head(self):
+        min_range_size = consts.MIN_ANALYZE_RANGE_SIZE
+        consts.MIN_ANALYZE_RANGE_SIZE = 1024
+        try:
+            with tempfile.TemporaryDirectory() as d:
+                file_path = P.join(d, "quoted.csv")
+                with open(file_path, 'w') as f:
+                    f.write("id,comment,value\n")
+                    for i in range(2000):
+                        # values with line breaks are far from the head
+                        comment = '"line a\nline b\nline c"' if i > 1000 and i % 7 == 0 else "plain"
+                        f.write(f"{i},{comment},{i * 0.5}\n")
+                spec = CsvSniffer(block_size=1024).sniff(file_path)
+                assert spec.quoted is False
+
+                expected = StreamingAnalyzer(file_path, None, read_spec=spec).do_analyze_csv()
+                analyzer = ParallelAnalyzer(file_path, None, n_workers=4, read_spec=spec)
+                s = analyzer.do_analyze_csv()
+                dask_s = dask_analyzer.DaskAnalyzer(file_path, None, scheduler="synchronous", blocksize=0.005,
+                                                    read_spec=spec).do_analyze_csv() \
+                    if dask_analyzer.is_dask_available() else expected
+        finally:
+            consts.MIN_ANALYZE_RANGE_SIZE = min_range_size
+
+        assert expected.n_rows == s.n_rows == dask_s.n_rows == 2000
+        for stats in [s, dask_s]:
+            for f, expected_f in zip(stats.features, expected.features):
+                assert f.type == expected_f.type
+                assert f.missing.value == expected_f.missing.value
+                assert f.unique.value == expected_f.unique.value
+
+    def test_association_random_state(self):
+        association_sample_rows = consts.ASSOCIATION_SAMPLE_ROWS
+        consts.ASSOCIATION_SAMPLE_ROWS = 500
+        try:
+            whole_data_conf = SampleConf(sample_strategy=SampleConf.Strategy.WholeData)
+            matrices = [PandasAnalyzer(self.data_path, None, whole_data_conf, random_state=1).do_analyze_csv()
+                        .association.to_dict() for i in range(2)]
+        finally:
+            consts.ASSOCIATION_SAMPLE_ROWS = association_sample_rows
+        assert matrices[0] == matrices[1]
+
+    def test_timings_and_progress(self):
+        sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, percentage=None, n_rows=200)
+        progresses = []
+        analyzer = PandasAnalyzer(self.data_path, None, sample_conf, progress_callback=progresses.append)
+        analyzer.do_analyze_csv()
+        assert progresses[-1] == {"n_cols": analyzer.n_cols, "n_cols_done": analyzer.n_cols, "n_rows_scanned": 200}
+        timings = analyzer.summarize_timings()
+        assert len(timings['slowest_columns']) == min(analyzer.n_cols, consts.N_SLOWEST_COLUMNS)
+        assert 'to_feature' in timings['statistics']
+
+        progresses = []
+        analyzer = StreamingAnalyzer(self.data_path, None, chunksize=1000, progress_callback=progresses.append)
+        analyzer.do_analyze_csv()
+        assert progresses[-1]['n_rows_scanned'] == 10000
+        assert progresses[-1]['n_cols_done'] == analyzer.n_cols
+        timings = analyzer.summarize_timings()
+        assert timings['slowest_columns'][0]['took'] >= timings['slowest_columns'][-1]['took']
+        assert 'association' in timings['statistics']
+
+    @unittest.skipIf(not dask_analyzer.is_dask_available(), "dask is not installed")
+    def test_dask_analyzer(self):
+        analyzer = dask_analyzer.DaskAnalyzer(self.data_path, None, scheduler="threads", blocksize=0.1, n_workers=4)
+        s = analyzer.do_analyze_csv()
+        expected = StreamingAnalyzer(self.data_path, None).do_analyze_csv()
+
+        assert s.n_rows == 10000
+        for f, expected_f in zip(s.features, expected.features):
+            assert f.name == expected_f.name
+            assert f.type == expected_f.type
+            assert f.missing.value == expected_f.missing.value
+            assert f.unique.value == expected_f.unique.value
+
+    def test_parse_datetime(self):
+        assert datetime_parser.infer_format(pd.Series(["2020-09-23 16:51:36", None])) == "%Y-%m-%d %H:%M:%S"
+        parsed = datetime_parser.parse_datetime(pd.Series(["2020-09-23T16:51:36.120"]))
+        assert parsed.iloc[0] == pd.Timestamp("2020-09-23 16:51:36.120")
+        parsed = datetime_parser.parse_datetime(pd.Series(["2020/09/23", "2021/01/01"]))
+        assert parsed.iloc[1] == pd.Timestamp("2021-01-01")
+        assert datetime_parser.infer_format(pd.Series(["2020-09-23", "male"])) is None
+        assert datetime_parser.infer_format(pd.Series([1, 2])) is None
+
+        series = pd.Series(["2020-09-23"] * 200 + ["unknown"])
+        assert datetime_parser.parse_datetime(series) is series  # value out of probe is not a date
+
+        epoch = pd.Series([1600849896, 1609459200])
+        assert datetime_parser.parse_datetime(epoch, infer_epoch=False) is epoch
+        parsed = datetime_parser.parse_datetime(epoch, infer_epoch=True)
+        assert parsed.iloc[0] == pd.Timestamp("2020-09-23 08:31:36")
+        parsed = datetime_parser.parse_datetime(epoch * 1000, infer_epoch=True)
+        assert parsed.iloc[1] == pd.Timestamp("2021-01-01")
+        assert datetime_parser.parse_datetime(pd.Series([1, 2]), infer_epoch=True).dtype.name == 'int64'
+
+    def test_datetime_histograms(self):
+        series = pd.Series(pd.to_datetime(["2020-01-06 00:10:00", "2020-12-31 23:00:00", None, "2021-01-10 08:00:00"]))
+        f = ColumnAccumulator("datetime").update(series.iloc[:2]).merge(
+            ColumnAccumulator("datetime").update(series.iloc[2:])).to_feature()
+        assert f.type == FeatureType.Datetime
+        assert f.extension['by_month'] == [2] + [0] * 10 + [1]
+        assert f.extension['by_week'] == [1, 0, 0, 1, 0, 0, 1]
+        assert f.extension['by_hour'][0] == 1 and f.extension['by_hour'][8] == 1 and f.extension['by_hour'][23] == 1
+        assert {y['year']: y['value'] for y in f.extension['by_year']} == {2020: 2, 2021: 1}
+        assert f.missing.value == 1
+
+    def test_csv_sniffer(self):
+        spec = CsvSniffer().sniff(self.data_path)
+        assert spec.has_header is True
+        assert spec.delimiter == ','
+        assert spec.encoding == 'utf-8'
+        assert spec.quoted is False
+        assert spec.dtypes['age'] == 'object' and spec.dtypes['num_lab_procedures'] == 'int64'
+
+        spec = CsvSniffer().sniff("cooka/test/dataset/iris_NoHeader.csv")
+        assert spec.has_header is False
+        assert list(spec.dtypes.keys())[:2] == ['c0', 'c1']
+
+        with tempfile.TemporaryDirectory() as d:
+            tsv = P.join(d, "data.tsv")
+            with open(tsv, 'wb') as f:
+                f.write("城市\t人数\n北京\t1\n上海\t2\n".encode('gbk'))
+            spec = CsvSniffer().sniff(tsv)
+            assert spec.delimiter == '\t' and spec.encoding == 'gb18030' and spec.has_header is True
+            analyzer = PandasAnalyzer(tsv, None, SampleConf(sample_strategy=SampleConf.Strategy.WholeData))
+            assert list(analyzer.df.columns) == ['城市', '人数']
+            assert analyzer.n_rows == 2
+
+            quoted = P.join(d, "quoted.csv")
+            with open(quoted, 'w') as f:
+                f.write('id;comment\n1;"a\nb"\n2;c\n')
+            spec = CsvSniffer(block_size=20).sniff(quoted)
+            assert spec.delimiter == ';' and spec.quoted is True
+            analyzer = ParallelAnalyzer(quoted, None, read_spec=spec)
+            assert analyzer.n_rows == 2
+
+    def test_upload_stats(self):
+        with tempfile.TemporaryDirectory() as d:
+            file_path = P.join(d, "diabetes.csv")
+            accumulator = UploadStatsAccumulator(file_path, sample_rows=2000, random_state=1)
+            with open(self.data_path, 'rb') as f_src, open(file_path, 'wb') as f_dst:
+                while True:
+                    chunk = f_src.read(77777)  # chunk boundary not aligned with lines
+                    if not chunk:
+                        break
+                    f_dst.write(chunk)
+                    accumulator.update(chunk)
+            stats = accumulator.finish(util.file_digest(file_path))
+            assert upload_stats.read_stats(file_path).to_dict() == stats.to_dict()
+            assert stats.n_rows == 10000 and stats.n_sample_rows == 2000
+            assert stats.read_spec.to_dict() == CsvSniffer().sniff(file_path).to_dict()
+
+            sample_df = upload_stats.read_sample(file_path, 2000)
+            assert list(sample_df.columns) == list(stats.read_spec.dtypes.keys())
+            assert sample_df.shape[0] == 2000
+
+            sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.RandomRows, percentage=None, n_rows=1000)
+            analyzer = PandasAnalyzer(file_path, None, sample_conf, random_state=1, upload_stats=stats)
+            assert analyzer.n_rows == 10000 and analyzer.n_rows_used == 1000
+            assert analyzer.do_analyze_csv().n_rows == 10000
+
+            sample_conf = SampleConf(sample_strategy=SampleConf.Strategy.Percentage, percentage=50)
+            assert PandasAnalyzer.n_upload_sample(sample_conf, stats) is None  # more rows than the sample
+
+            with open(file_path, 'a') as f:
+                f.write("\n")
+            assert upload_stats.read_stats(file_path) is None  # changed after uploaded
+
+    def test_upload_stats_max_bytes(self):
+        with tempfile.TemporaryDirectory() as d:
+            file_path = P.join(d, "diabetes.csv")
+            accumulator = UploadStatsAccumulator(file_path, sample_rows=2000, sample_max_bytes=100 * 1024,
+                                                 random_state=1)
+            with open(self.data_path, 'rb') as f_src, open(file_path, 'wb') as f_dst:
+                while True:
+                    chunk = f_src.read(77777)
+                    if not chunk:
+                        break
+                    f_dst.write(chunk)
+                    accumulator.update(chunk)
+                    assert accumulator.reservoir_bytes <= 100 * 1024
+            stats = accumulator.finish()
+            assert stats.n_rows == 10000 and 0 < stats.n_sample_rows < 2000
+            sample_df = upload_stats.read_sample(file_path, 2000)
+            assert sample_df.shape[0] == stats.n_sample_rows
+
+            util.write_content_hash(file_path, util.file_digest(file_path))
+            upload_stats.remove_sidecars(file_path)
+            assert os.listdir(d) == ["diabetes.csv"]
+
     def test_analyze_job(self):
         d = \
             {
@@ -51,3 +347,17 @@ class TestAnalyzer(unittest.TestCase):
         # print(p.is_alive())
         # for i in range(3):
         #     print(q.get().to_dict())
+
+
+def test_column_parallel():
+    from cooka.core import column_parallel
+    df = pd.read_csv("cooka/test/dataset/diabetes_10k_datetime.csv")
+    df = datetime_parser.parse_datetime_cols(df)
+    df['mixed'] = ['a', None, 1] * 3333 + ['b']
+    df['tz'] = datetime_parser.parse_datetime(pd.Series(['2020-09-23T16:51:36+0800', None] * 5000))
+    assert str(df['tz'].dtype) != 'datetime64[ns]' and 'datetime64' in str(df['tz'].dtype)
+    expected = [ColumnAccumulator(c).update(df[c]).to_feature() for c in df.columns]
+    timings = {}
+    features = column_parallel.analyze_columns(df, n_workers=3, timings=timings)
+    assert [f.to_dict() for f in features] == [f.to_dict() for f in expected]
+    assert list(timings.keys()) == list(df.columns)
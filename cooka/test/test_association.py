@@ -0,0 +1,45 @@
+# -*- encoding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from cooka.core import association
+from cooka.core.accumulator import DatasetAccumulator
+
+
+def make_df(n=2000):
+    rs = np.random.RandomState(1)
+    x = rs.normal(size=n)
+    city = rs.choice(['bj', 'sh', 'gz'], size=n)
+    return pd.DataFrame({
+        "x": x,
+        "y": 2 * x + 1,  # linear to x
+        "noise": rs.normal(size=n),
+        "city": city,
+        "province": pd.Series(city).map({'bj': 'BJ', 'sh': 'SH', 'gz': 'GD'}),  # one to one with city
+        "score": pd.Series(city).map({'bj': 1.0, 'sh': 2.0, 'gz': 3.0}),  # decided by city
+        "id": [f"u{i}" for i in range(n)],
+    })
+
+
+def test_association_matrix():
+    df = make_df()
+    features = DatasetAccumulator().update(df).to_dataset_stats(True, association_top_k=0).features
+    matrix = association.association_matrix(df, features)
+
+    assert "id" not in matrix.columns  # ID-ness
+    x = matrix.get("x")
+    assert abs(x["y"] - 1) < 1e-6
+    assert abs(x["noise"]) < 0.1
+    city = matrix.get("city")
+    assert abs(city["province"] - 1) < 1e-6
+    assert abs(city["score"] - 1) < 1e-6
+    assert city["x"] < 0.1
+    assert matrix.get("id") is None
+
+
+def test_association_top_k():
+    df = make_df()
+    df.loc[:100, 'noise'] = None
+    features = DatasetAccumulator().update(df).to_dataset_stats(True, association_top_k=0).features
+    matrix = association.association_matrix(df, features, top_k=3)
+    assert matrix.columns == ["x", "y", "city"]  # least missing first
@@ -3,7 +3,7 @@
 from os import path as P
 from cooka.common import util
 from cooka.common import consts
-from cooka.common.model import Feature, FeatureType
+from cooka.common.model import Feature, FeatureType, AnalyzeStep
 from cooka.test.base_test_case import BaseTestCase, WithTemporaryDatasetTestCase
 
 
@@ -41,6 +41,20 @@ class TestDataset(WithTemporaryDatasetTestCase):
         self.assert_response_and_get(create_response)
         return temporary_dataset_name
 
+    def test_analyze_job_steps(self):
+        temporary_dataset_name = self.create_temporary_dataset()
+        poll_job_response = self.fetch(f'/api/dataset/{temporary_dataset_name}/analyze-job/{self.analyze_job_name}',
+                                       method="GET")
+        poll_job_response_body = self.assert_response_and_get(poll_job_response)
+
+        # progress is not a step, the frontend takes the 3rd step as the analyzed one
+        steps = poll_job_response_body['steps']
+        assert [step['type'] for step in steps] == [AnalyzeStep.Types.Upload, AnalyzeStep.Types.Load,
+                                                   AnalyzeStep.Types.Analyzed]
+        assert steps[2]['status'] == AnalyzeStep.Status.Succeed
+        progress = poll_job_response_body['progress']
+        assert progress['n_cols_done'] == progress['n_cols']
+
     def test_create_and_delete_dataset(self):
         portal = self.get_url("")
         consts.SERVER_PORTAL = portal
@@ -0,0 +1,47 @@
+# -*- encoding: utf-8 -*-
+import tempfile
+from os import path as P
+
+from cooka.common import util, dataset_util
+from cooka.common.model import Feature, FeatureUnique, FeatureType
+
+
+def make_features():
+    return [
+        Feature(name="age", type=FeatureType.Continuous, data_type="int64", extension={"min": 1, "max": 90}),
+        Feature(name="income", type=FeatureType.Continuous, data_type="float64",
+                extension={"min": 0.5, "max": 10000.5}),
+        Feature(name="city", type=FeatureType.Categorical, data_type="object",
+                unique=FeatureUnique(value=2, percentage=50.0)),
+        Feature(name="uid", type=FeatureType.Categorical, data_type="object",
+                unique=FeatureUnique(value=4, percentage=100.0)),
+        Feature(name="birthday", type=FeatureType.Datetime, data_type="datetime64[ns]"),
+    ]
+
+
+def test_compact_dtypes():
+    features = make_features()
+    assert dataset_util.compact_dtypes(features, exact_range=True) == \
+        {"age": "int8", "income": "float32", "city": "category", "birthday": "datetime64[ns]"}
+    # ranges from a sample are not trusted
+    assert dataset_util.compact_dtypes(features) == {"city": "category", "birthday": "datetime64[ns]"}
+
+
+def test_read_compact_dtypes():
+    csv_file = P.join(tempfile.gettempdir(), util.short_uuid() + ".csv")
+    with open(csv_file, 'w') as f:
+        f.write("age,income,city,uid,birthday\n"
+                "20,10.5,bj,u1,2020-01-01\n"
+                "30,20.5,sh,u2,2020-01-02\n"
+                "40,30.5,bj,u3,2020-01-03\n"
+                "50,40.5,sh,u4,2020-01-04\n")
+    features = make_features()
+    dtypes = dataset_util.compact_dtypes(features, exact_range=True)
+    df = util.read_csv(csv_file, True, **dataset_util.compact_read_kwargs(dtypes))
+    assert {k: v.name for k, v in df.dtypes.items()} == \
+        {"age": "int8", "income": "float32", "city": "category", "uid": "object", "birthday": "datetime64[ns]"}
+
+    schema = [f.to_dict() for f in features]
+    casted_df = dataset_util.cast_df(df, schema)
+    assert casted_df['city'].dtype.name == 'category'  # compact types are kept
+    assert casted_df['age'].dtype.name == 'int8'
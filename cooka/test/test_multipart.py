@@ -0,0 +1,92 @@
+# -*- encoding: utf-8 -*-
+import io
+
+import pytest
+
+from cooka.common.multipart import MultipartParser, MultipartError, parse_boundary
+
+
+class BytesSink(io.BytesIO):
+
+    def close(self):
+        self.closed_value = self.getvalue()
+        super(BytesSink, self).close()
+
+
+def make_body(boundary, file_body):
+    return b"".join([b"preamble\r\n--", boundary, b"\r\n",
+                     b'Content-Disposition: form-data; name="source"\r\n\r\n',
+                     b"upload\r\n--", boundary, b"\r\n",
+                     b'Content-Disposition: form-data; name="file"; filename="a.csv"\r\n',
+                     b"Content-Type: text/csv\r\n\r\n",
+                     file_body, b"\r\n--", boundary, b"--\r\n"])
+
+
+def parse(body, boundary, chunk_size):
+    sinks = []
+
+    def open_file(name, filename, headers):
+        assert (name, filename) == ("file", "a.csv")
+        sinks.append(BytesSink())
+        return sinks[0]
+
+    parser = MultipartParser(boundary, open_file)
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i: i + chunk_size])
+    parser.close()
+    return parser.fields, sinks[0].closed_value
+
+
+def test_parse_boundary():
+    assert parse_boundary('multipart/form-data; boundary=----abc') == b"----abc"
+    assert parse_boundary('multipart/form-data; boundary="abc"') == b"abc"
+    assert parse_boundary('application/json') is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 100000])
+def test_parse_by_chunks(chunk_size):
+    boundary = b"----WebKitFormBoundaryx1"
+    # the file contains text like the delimiter but not the whole one
+    file_body = b"a,b\r\n1,2\r\n--" + boundary[:-1] + b"\r\n\r\n3,4" * 100
+    fields, value = parse(make_body(boundary, file_body), boundary, chunk_size)
+    assert fields == {"source": b"upload"}
+    assert value == file_body
+
+
+def test_incomplete_body():
+    boundary = b"xyz"
+    body = make_body(boundary, b"a,b\r\n1,2")
+    with pytest.raises(MultipartError):
+        parse(body[:-20], boundary, 10)
+
+
+def test_upload_sink_finish_only_complete_body():
+    from os import path as P
+    from cooka.common import util
+    from cooka.core import upload_stats
+    from cooka.handler.resource_handler import UploadFileSink
+
+    boundary = b"xyz"
+    body = make_body(boundary, b"a,b\r\n1,2\r\n3,4\r\n")
+    sinks = []
+
+    def open_file(name, filename, headers):
+        sinks.append(UploadFileSink(filename))
+        return sinks[-1]
+
+    # truncated body, the handler closes the sink when the connection is closed
+    parser = MultipartParser(boundary, open_file)
+    parser.feed(body[:-20])
+    sinks[-1].close()
+    truncated_path = sinks[-1].file_path
+    assert not P.exists(truncated_path + util.CONTENT_HASH_SUFFIX)
+    assert not P.exists(upload_stats.stats_path(truncated_path))
+    assert not P.exists(upload_stats.sample_path(truncated_path))
+
+    parser = MultipartParser(boundary, open_file)
+    parser.feed(body)
+    parser.close()
+    assert parser.finished
+    sinks[-1].finish()
+    assert P.exists(sinks[-1].file_path + util.CONTENT_HASH_SUFFIX)
+    assert upload_stats.read_stats(sinks[-1].file_path).n_rows == 2
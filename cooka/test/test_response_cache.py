@@ -0,0 +1,42 @@
+# -*- encoding: utf-8 -*-
+from cooka.service.response_cache import ResponseCache
+
+
+class TestResponseCache:
+
+    def test_get_put(self):
+        cache = ResponseCache(max_size=1024)
+        cache.put(('detail', 'iris', 10), {"name": "iris", "rows": [[1, "a"]]})
+        value = cache.get(('detail', 'iris', 10))
+        assert value == {"name": "iris", "rows": [[1, "a"]]}
+        value['name'] = 'changed'  # hits are copies
+        assert cache.get(('detail', 'iris', 10))['name'] == 'iris'
+        assert cache.get(('detail', 'iris', 20)) is None
+        assert cache.stats()['hits'] == 2
+        assert cache.stats()['misses'] == 1
+
+    def test_evict_lru(self):
+        cache = ResponseCache(max_size=100)
+        value = {"v": "x" * 30}
+        cache.put(('preview', 'd', 1, 10), value)
+        cache.put(('preview', 'd', 2, 10), value)
+        assert cache.get(('preview', 'd', 1, 10)) is not None  # used recently
+        cache.put(('preview', 'd', 3, 10), value)
+        assert cache.get(('preview', 'd', 2, 10)) is None
+        assert cache.get(('preview', 'd', 1, 10)) is not None
+        assert cache.size <= 100
+
+    def test_invalidate(self):
+        cache = ResponseCache(max_size=1024)
+        cache.put(('preview', 'd1', 1, 10), {})
+        cache.put(('detail', 'd1', 10), {})
+        cache.put(('detail', 'd2', 10), {})
+        cache.invalidate('d1')
+        assert cache.get(('preview', 'd1', 1, 10)) is None
+        assert cache.get(('detail', 'd1', 10)) is None
+        assert cache.get(('detail', 'd2', 10)) is not None
+
+    def test_disabled(self):
+        cache = ResponseCache(max_size=0)
+        cache.put(('detail', 'd', 10), {})
+        assert cache.get(('detail', 'd', 10)) is None
@@ -0,0 +1,142 @@
+# -*- encoding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from cooka.core.accumulator import ColumnAccumulator
+from cooka.core.sketch import HyperLogLog, SpaceSaving, KLLSketch
+
+
+class TestHyperLogLog:
+
+    def test_count(self):
+        series = pd.Series(np.arange(200000))
+        hll = HyperLogLog(14).update(series)
+        assert abs(hll.count() - 200000) / 200000 < 3 * hll.error_bound
+
+    def test_small_count(self):
+        hll = HyperLogLog(14).update(pd.Series(["a", "b", "c", "a", None]))
+        assert hll.count() == 3
+
+    def test_merge(self):
+        series = pd.Series(["id_%s" % i for i in range(50000)])
+        hll = HyperLogLog(12).update(series)
+        hll1 = HyperLogLog(12).update(series.iloc[:30000])
+        hll2 = HyperLogLog(12).update(series.iloc[20000:])
+        assert hll1.merge(hll2).count() == hll.count()
+
+    def test_approx_distinct_column(self):
+        series = pd.Series(np.arange(50000))
+        f = ColumnAccumulator("id", approx_distinct=True).update(series).to_feature()
+        assert f.extension['unique_error_bound'] > 0
+        assert abs(f.unique.value - 50000) / 50000 < 0.03
+        assert f.unique.status == 'ID-ness'
+
+        f = ColumnAccumulator("small", approx_distinct=True).update(series % 10).to_feature()
+        assert f.unique.value == 10
+        assert 'unique_error_bound' not in f.extension
+
+
+class TestSpaceSaving:
+
+    @staticmethod
+    def zipf_series(n, seed=1):
+        return pd.Series(np.random.RandomState(seed).zipf(1.5, n))
+
+    def test_exact(self):
+        series = pd.Series(["a", "b", "a", None, "c", "a", "b"])
+        ss = SpaceSaving().update(series.iloc[:3]).update(series.iloc[3:])
+        assert ss.is_exact
+        assert ss.top(2).to_dict() == {"a": 3, "b": 2}
+        assert ss.remained(2) == 1
+
+    def test_exact_many_chunks(self):
+        series = self.zipf_series(300000, seed=4)
+        ss = SpaceSaving()
+        for i in range(0, series.shape[0], 1000):
+            ss.update(series.iloc[i: i + 1000])
+        other = SpaceSaving().update(series.iloc[:1000])
+        ss.merge(other)
+        expected = series.value_counts().add(series.iloc[:1000].value_counts(), fill_value=0).astype('int64')
+        assert ss.is_exact
+        assert ss.total == 301000
+        assert ss.counts.to_dict() == expected.to_dict()
+        assert list(ss.counts.values) == sorted(expected.values, reverse=True)
+
+    def test_heavy_hitters(self):
+        series = self.zipf_series(100000)
+        expected = series.value_counts()
+        ss = SpaceSaving(100)
+        for i in range(0, series.shape[0], 7000):
+            ss.update(series.iloc[i: i + 7000])
+        assert not ss.is_exact
+        assert ss.total == 100000
+        top = ss.top(10)
+        assert list(top.index) == list(expected.index[:10])
+        for value, count in top.items():
+            assert 0 <= count - expected[value] <= ss.errors[value] <= ss.floor
+
+    def test_merge(self):
+        series = self.zipf_series(60000, seed=2)
+        expected = series.value_counts()
+        ss1 = SpaceSaving(50).update(series.iloc[:20000])
+        ss2 = SpaceSaving(50).update(series.iloc[20000:])
+        ss = ss1.merge(ss2)
+        assert ss.counts.shape[0] == 50
+        assert list(ss.top(5).index) == list(expected.index[:5])
+        assert ss.remained(5) == 60000 - ss.top(5).sum()
+
+    def test_approx_value_count(self):
+        series = pd.Series(["v%s" % v for v in self.zipf_series(50000, seed=3)])
+        f_exact = ColumnAccumulator("c").update(series).to_feature()
+        f = ColumnAccumulator("c", approx_distinct=True)
+        for i in range(0, 50000, 10000):
+            f.update(series.iloc[i: i + 10000])
+        f = f.to_feature()
+        assert [v['type'] for v in f.extension['value_count']] == \
+               [v['type'] for v in f_exact.extension['value_count']]
+        assert f.extension['mode']['value'] == f_exact.extension['mode']['value']
+
+
+class TestKLLSketch:
+
+    def test_exact(self):
+        values = np.random.RandomState(1).normal(size=1000)
+        kll = KLLSketch(2000).update(values[:500]).update(values[500:])
+        assert kll.is_exact and kll.rank_error == 0
+        f = ColumnAccumulator("c", approx_distinct=True).update(pd.Series(values)).to_feature()
+        expected = pd.Series(values).describe()
+        assert abs(f.extension['median'] - expected['50%']) < 1e-9
+        assert abs(f.extension['percentile_25'] - expected['25%']) < 1e-9
+        assert abs(f.extension['percentile_75'] - expected['75%']) < 1e-9
+
+    def test_rank_error(self):
+        values = np.random.RandomState(2).exponential(size=200000)
+        kll1 = KLLSketch(200, random_state=1).update(values[:120000])
+        kll2 = KLLSketch(200, random_state=2).update(values[120000:])
+        kll = kll1.merge(kll2)
+        assert kll.n == 200000
+        items, weights = kll.items()
+        assert weights.sum() == 200000
+        assert items.shape[0] < 1000
+        sorted_values = np.sort(values)
+        for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+            i = np.searchsorted(np.cumsum(weights), q * 200000)
+            rank = np.searchsorted(sorted_values, items[i]) / 200000
+            assert abs(rank - q) < kll.rank_error
+
+    def test_bins(self):
+        series = pd.Series(np.random.RandomState(3).exponential(size=100000))
+        column = ColumnAccumulator("c", approx_distinct=True)
+        for i in range(0, 100000, 30000):
+            column.update(series.iloc[i: i + 30000])
+        assert 'quantile_rank_error' in column.to_feature().extension
+
+        bins = column.to_feature(bins_strategy='equal_width').extension['bins']
+        assert sum(b['value'] for b in bins) == 100000
+        assert min(b['begin'] for b in bins) < series.min()
+        assert abs(max(b['end'] for b in bins) - series.max()) < 0.01
+
+        bins = column.to_feature(bins_strategy='quantile').extension['bins']
+        assert len(bins) == 10
+        assert sum(b['value'] for b in bins) == 100000
+        assert all(abs(b['value'] - 10000) < 1000 for b in bins)
@@ -1,8 +1,13 @@
 # -*- encoding: utf-8 -*-
-from cooka.common import util
+from cooka.common import util, consts
+import importlib.util
+import os
 import tempfile
 from os import path as P
 
+import pandas as pd
+import pytest
+
 
 class TestFileUtil:
 
@@ -42,3 +47,149 @@ class TestDatasetUtil:
 
 def test_human_date():
     print(util.human_datetime(util.get_now_datetime()))
+
+
+class TestCountLines:
+
+    def setup_class(self):
+        self.path = P.join(tempfile.gettempdir(), util.short_uuid())
+
+        with open(self.path, 'w') as f:
+            f.write('name,comment\na,"first line\nsecond line"\nb,"say ""hi""\n"\nc,end')
+
+    def test_count_lines(self):
+        assert util.count_lines(self.path) == 6
+
+    def test_count_lines_quoted(self):
+        assert util.count_lines(self.path, quoted=True) == 4
+        # quoted field span blocks
+        assert util.count_lines(self.path, quoted=True, block_size=3) == 4
+
+    def test_count_lines_empty(self):
+        path = P.join(tempfile.gettempdir(), util.short_uuid())
+        open(path, 'w').close()
+        assert util.count_lines(path) == 0
+
+
+def test_split_byte_ranges():
+    path = P.join(tempfile.gettempdir(), util.short_uuid())
+    lines = ["header\n"] + ["line%s\n" % i for i in range(100)]
+    with open(path, 'w') as f:
+        f.write("".join(lines))
+
+    ranges = util.split_byte_ranges(path, 7, skip_first_line=True)
+    assert len(ranges) == 7
+    read_lines = []
+    for start, end in ranges:
+        with util.open_range(path, start, end) as f:
+            read_lines.extend(f.read().decode().splitlines(keepends=True))
+    assert read_lines == lines[1:]
+
+
+def test_copy_with_digest():
+    src = P.join(tempfile.gettempdir(), util.short_uuid())
+    with open(src, 'wb') as f:
+        f.write(b"a,b\n1,2\n" * 1000)
+    dst = src + "_copy"
+    content_hash = util.copy_with_digest(src, dst, block_size=100)
+    assert content_hash == util.file_digest(src) == util.file_digest(dst)
+
+    assert util.read_content_hash(dst, compute=False) is None
+    assert util.read_content_hash(dst) == content_hash  # computed then kept in sidecar
+    assert P.exists(dst + util.CONTENT_HASH_SUFFIX)
+
+
+def test_read_dataset_usecols():
+    from cooka.common import columnar
+    csv_file = P.join(tempfile.gettempdir(), util.short_uuid() + ".csv")
+    with open(csv_file, 'w') as f:
+        f.write("1,a,2.0\n3,b,4.0\n")
+    df = columnar.read_dataset(csv_file, False, ["x", "y", "z"], usecols=["z", "x"])
+    assert df.columns.tolist() == ["x", "z"]
+    assert df.shape[0] == 2
+    assert columnar.read_rows(csv_file, 0, 1) is None  # no columnar copy
+
+
+@pytest.mark.skipif(importlib.util.find_spec('pyarrow') is None, reason="pyarrow is not installed")
+def test_write_columnar():
+    from cooka.common import columnar
+    with tempfile.TemporaryDirectory() as d:
+        csv_file = P.join(d, "data.csv")
+        with open(csv_file, 'w') as f:
+            f.write("id,code,score,ts\n")
+            for i in range(25):
+                # missing ids and numeric codes are in some chunks only
+                _id = "" if i == 17 else str(i)
+                code = str(i) if i < 10 else f"c{i}"
+                f.write(f"{_id},{code},{i * 0.5},2020-01-{i % 28 + 1:02d} 00:00:00\n")
+        features = [{"name": "id", "data_type": "int64"}, {"name": "code", "data_type": "object"},
+                    {"name": "score", "data_type": "float64"}, {"name": "ts", "data_type": "datetime64[ns]"}]
+
+        path = columnar.write_columnar(csv_file, features, True, chunksize=10)
+        assert path == columnar.columnar_path(csv_file) and columnar.is_columnar_ready(csv_file)
+
+        df = columnar.read_dataset(csv_file, True, usecols=["score", "code"])
+        assert df.columns.tolist() == ["code", "score"]
+        assert df['code'].tolist()[:2] == ["0", "1"] and df['code'].iloc[10] == "c10"
+
+        df = columnar.read_dataset(csv_file, True)
+        assert df.shape == (25, 4)
+        assert str(df['ts'].dtype) == 'datetime64[ns]'
+        assert pd.isna(df['id'].iloc[17]) and df['id'].iloc[18] == 18
+
+        page = columnar.read_rows(csv_file, 8, 5)  # rows span row groups
+        assert page['score'].tolist() == [4.0, 4.5, 5.0, 5.5, 6.0]
+
+        # values can not be cast to the schema
+        features[1]['data_type'] = 'int64'
+        os.remove(path)
+        assert columnar.write_columnar(csv_file, features, True, chunksize=10) is None
+        assert not P.exists(path) and os.listdir(d) == ["data.csv"]
+
+
+def test_read_csv_engines():
+    csv_file = P.join(tempfile.gettempdir(), util.short_uuid() + ".csv")
+    with open(csv_file, 'w') as f:
+        f.write("a,b\n" + "".join(f"{i},x{i}\n" for i in range(25)))
+    df_c = util.read_csv(csv_file, True, engine=consts.CSV_ENGINE_C)
+    for engine in consts.CSV_ENGINES:
+        df = util.read_csv(csv_file, True, engine=engine)
+        assert df.equals(df_c)
+    assert sum(chunk.shape[0] for chunk in util.iter_csv(csv_file, chunksize=10)) == 25
+
+
+def test_row_index():
+    from cooka.common import row_index
+    csv_file = P.join(tempfile.gettempdir(), util.short_uuid() + ".csv")
+    with open(csv_file, 'w') as f:
+        f.write("a,b\n" + "".join(f"{i},x{i}\n" for i in range(25)))
+    assert row_index.read_rows(csv_file, 0, 1) is None  # not indexed
+    row_index.build_row_index(csv_file, True, interval=4, block_size=16)  # blocks split lines
+    for start, n in [(0, 3), (5, 10), (22, 10), (25, 3)]:
+        df = row_index.read_rows(csv_file, start, n)
+        assert df.shape[0] == max(min(n, 25 - start), 0)
+        if df.shape[0] > 0:
+            assert df[0].tolist() == list(range(start, start + df.shape[0]))
+
+
+def test_place_file():
+    from cooka.common import file_placement
+    src = P.join(tempfile.gettempdir(), util.short_uuid() + ".csv")
+    with open(src, 'w') as f:
+        f.write("a,b\n1,2\n")
+
+    dst = src + ".hardlink"
+    method, content_hash = file_placement.place_file(src, dst, [file_placement.METHOD_HARDLINK])
+    assert method == file_placement.METHOD_HARDLINK and content_hash is None
+    assert P.samefile(src, dst)
+
+    dst = src + ".copy"
+    method, content_hash = file_placement.place_file(src, dst, [file_placement.METHOD_REFLINK,
+                                                               file_placement.METHOD_COPY])
+    assert util.file_digest(dst) == util.file_digest(src)
+    assert content_hash is None if method == file_placement.METHOD_REFLINK else content_hash == util.file_digest(src)
+
+    dst = src + ".rename"
+    method, _ = file_placement.place_file(src, dst)
+    assert method == file_placement.METHOD_RENAME
+    assert not P.exists(src) and P.exists(dst)
@@ -68,6 +68,12 @@ if __name__ == '__main__':
             'tabular-toolbox',  # todo remove if hypergbm installed
         ],
         extras_require={
+            'parquet': [
+                'pyarrow'
+            ],
+            'dask': [
+                'dask'
+            ],
             'notebook': [
                 'shap',  # todo remove shap if deeptable add
                 'jupyterlab',